@@ -1,12 +1,12 @@
 # Copyright 2022 Energize Lawrence.  All rights reserved.
 
 import argparse
-import os
 import pandas as pd
 
 import sys
 sys.path.append( '../util' )
 import util
+import pipeline
 
 
 # Main program
@@ -15,27 +15,56 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser( description='Generate City Contracts master database' )
     parser.add_argument( '-m', dest='master_filename',  help='Output filename - Name of master database file', required=True )
     parser.add_argument( '-r', dest='research_filename',  help='Output filename - Name of research database file', required=True )
+    parser.add_argument( '-j', dest='workers', type=int, help='Maximum number of build steps to run concurrently (default: number of CPUs)' )
+    parser.add_argument( '-f', dest='force', action='store_true', help='Run all build steps, even those that are up to date?' )
+    parser.add_argument( '-i', dest='in_process', action='store_true', help='Run build steps one at a time in this process, sharing imports and database connections?' )
     args = parser.parse_args()
 
-    # Read contracts data
-    print( '\n=======> Contracts input' )
-    os.system( 'python xl_to_db.py -i ../xl/city_contracts/contracts.xlsx -t RawContracts -m -o {0} -c'.format( args.master_filename ) )
+    # Build graph: Each step lists the master database tables it reads and writes
+    ls_steps = \
+    [
+        # Read contracts data
+        {
+            'label': 'Contracts input',
+            'command': 'python xl_to_db.py -i ../xl/city_contracts/contracts.xlsx -t RawContracts -m -o {master} -c',
+            'writes': ['RawContracts'],
+            'create': True,
+        },
 
-    # Read vendors data
-    print( '\n=======> Vendors input' )
-    os.system( 'python xl_to_db.py -i ../xl/city_contracts/vendors.xlsx -t RawVendors -o {0}'.format( args.master_filename ) )
+        # Read vendors data
+        {
+            'label': 'Vendors input',
+            'command': 'python xl_to_db.py -i ../xl/city_contracts/vendors.xlsx -t RawVendors -o {master}',
+            'writes': ['RawVendors'],
+        },
 
-    # Clean Contracts table
-    print( '\n=======> Clean Contracts table' )
-    os.system( 'python city_contracts_clean_contracts.py -i RawContracts -o Contracts -d {0}'.format( args.master_filename ) )
+        # Clean Contracts table
+        {
+            'label': 'Clean Contracts table',
+            'command': 'python city_contracts_clean_contracts.py -i RawContracts -o Contracts -d {master}',
+            'reads': ['RawContracts'],
+            'writes': ['Contracts'],
+        },
 
-    # Clean Vendors table
-    print( '\n=======> Clean Vendors table' )
-    os.system( 'python city_contracts_clean_vendors.py -i RawVendors -o Vendors -d {0}'.format( args.master_filename ) )
+        # Clean Vendors table
+        {
+            'label': 'Clean Vendors table',
+            'command': 'python city_contracts_clean_vendors.py -i RawVendors -o Vendors -d {master}',
+            'reads': ['RawVendors'],
+            'writes': ['Vendors'],
+        },
 
-    # Generate City Contracts table
-    print( '\n=======> Generate Cost History table' )
-    os.system( 'python city_contracts_cost_history.py -c Contracts -v Vendors -o CostHistory -d {0}'.format( args.master_filename ) )
+        # Generate City Contracts table
+        {
+            'label': 'Generate Cost History table',
+            'command': 'python city_contracts_cost_history.py -c Contracts -v Vendors -o CostHistory -d {master}',
+            'reads': ['Contracts', 'Vendors'],
+            'writes': ['CostHistory'],
+        },
+    ]
+
+    # Run the build graph
+    pipeline.run_steps( ls_steps, args.master_filename, n_workers=args.workers, b_force=args.force, b_in_process=args.in_process )
 
 
     # Publish research copy of database
@@ -6,6 +6,7 @@ import os
 import sys
 sys.path.append( '../util' )
 import util
+import pipeline
 
 
 # Main program
@@ -15,6 +16,9 @@ if __name__ == '__main__':
     parser.add_argument( '-m', dest='master_filename',  help='Output filename - Name of master database file', required=True )
     parser.add_argument( '-r', dest='research_filename',  help='Output filename - Name of research database file', required=True )
     parser.add_argument( '-l', dest='leap_filename',  help='Output filename - Name of LEAP database file', required=True )
+    parser.add_argument( '-j', dest='workers', type=int, help='Maximum number of build steps to run concurrently (default: number of CPUs)' )
+    parser.add_argument( '-f', dest='force', action='store_true', help='Run all build steps, even those that are up to date?' )
+    parser.add_argument( '-i', dest='in_process', action='store_true', help='Run build steps one at a time in this process, sharing imports and database connections?' )
     args = parser.parse_args()
 
     # --------------------------------------------------------
@@ -52,298 +56,569 @@ if __name__ == '__main__':
     # --> Lawrence master database build starts here -->
     # --------------------------------------------------
 
-    # Read cleaned parcels data
-    print( '\n=======> Parcels input' )
-    os.system( 'python db_to_db.py -i ../db/lawrence_parcels.sqlite -f GeoParcels_L -t GeoParcels_L -o {0} -c'.format( args.master_filename ) )
-
-    # Map parcel geolocations to regions inside Lawrence
-    print( '\n=======> Parcels table' )
-    os.system( 'python lawrence_geography.py -b ../xl/lawrence/geography/census_block_group_geometry/tl_2020_25_bg.shp -w ../xl/lawrence/geography/ward_precinct_geometry/WARDSPRECINCTS2022_POLY.shp -p ../xl/lawrence/geography/parcel_geometry/M149TaxPar_CY23_FY24.shp -m {0}'.format( args.master_filename ) )
-
-    # Summarize parcels data
-    print( '\n=======> Parcels summary' )
-    os.system( 'python lawrence_parcels_summarize.py -m {0}'.format( args.master_filename ) )
-
-    # Process motor vehicles data
-    print( '\n=======> Motor vehicles table' )
-    os.system( 'python db_to_db.py -i {0} -f MotorVehicles_L -t MotorVehicles_L -o {1}'.format( vehicle_db_filename, args.master_filename ) )
-    print( '\n=======> Motor vehicles summary' )
-    os.system( 'python lawrence_motor_vehicles_summarize.py -m {0}'.format( args.master_filename ) )
-
-    # Read and combine city vehicles data
-    print( '\n=======> VIN dictionary input' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/city_vehicles/vin_dictionary.csv -t VinDictionary_L -v -o {0}'.format( args.master_filename ) )
-    print( '\n=======> DPW vehicles input' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/city_vehicles/dpw_vehicles.xlsx -t RawDpwVehicles_L -o {0}'.format( args.master_filename ) )
-    print( '\n=======> Vehicle excise tax input' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/city_vehicles/vehicle_excise_tax.xlsx -p COMMITMENT -t RawVehicleExciseTax_L -o {0}'.format( args.master_filename ) )
-    print( '\n=======> Vehicle attributes' )
+    # Columns to keep from city vehicle attributes input
     keep_columns = ','.join( list( util.CONSISTENT_COLUMN_NAMES['RawVehicleAttributes_L'].keys() ) )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/city_vehicles/vehicle_attributes.xlsx -k {0} -t RawVehicleAttributes_L -o {1}'.format( keep_columns, args.master_filename ) )
-    print( '\n=======> City vehicles table' )
-    os.system( 'python lawrence_city_vehicles.py -m {0}'.format( args.master_filename ) )
-
-    # Read census data
-    print( '\n=======> Census input' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/census/census.txt -n "Res. ID" -s "Res. ID" -t RawCensus_L -v -f "|" -x -o {0}'.format( args.master_filename ) )
-
-    # Generate Census table
-    print( '\n=======> Census table' )
-    os.system( 'python lawrence_census.py -m {0}'.format( args.master_filename ) )
-
-    # Read residential assessment data
-    print( '\n=======> Residential input 1' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/assessment/residential_1.xlsx -t RawResidential_1 -r 1 -o {0}'.format( args.master_filename ) )
-    print( '\n=======> Residential input 2' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/assessment/residential_2.xlsx -t RawResidential_2 -r 1 -o {0}'.format( args.master_filename ) )
-    print( '\n=======> Residential input 3' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/assessment/residential_3.xlsx -t RawResidential_3 -r 1 -o {0}'.format( args.master_filename ) )
-    print( '\n=======> Residential input 4' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/assessment/residential_4_5.txt -t RawResidential_4 -v -f "|" -x -o {0}'.format( args.master_filename ) )
-    print( '\n=======> Residential input 5' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/assessment/residential_4_5.txt -t RawResidential_5 -v -f "|" -x -o {0}'.format( args.master_filename ) )
-
-    # Generate table of residential assessments
-    print( '\n=======> Residential merge' )
-    os.system( 'python lawrence_residential.py -m {0}'.format( args.master_filename ) )
-
-    # Read commercial assessment data
-    print( '\n=======> Commercial input 1' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/assessment/commercial_1.xlsx -t RawCommercial_1 -r 2 -n Location -o {0}'.format( args.master_filename ) )
-    print( '\n=======> Commercial input 2' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/assessment/commercial_2.xlsx -t RawCommercial_2 -r 2 -k "REM_ACCT_NUM,REM_USE_CODE,CNS_OCC,CNS_OCC_DESC" -n REM_USE_CODE -o {0}'.format( args.master_filename ) )
-
-    # Generate table of commercial assessments
-    print( '\n=======> Commercial merge' )
-    os.system( 'python lawrence_commercial.py -m {0}'.format( args.master_filename ) )
-
-    # Correct mis-classification of residential and commercial assessment records
-    os.system( 'python lawrence_land_use.py -l ../xl/residential_land_use_codes.xlsx -m {0}'.format( args.master_filename ) )
-
-    # Read business registration data
-    print( '\n=======> Businesses input 1' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/businesses/businesses_1.xlsx -s License# -t RawBusinesses_1 -o {0}'.format( args.master_filename ) )
-    print( '\n=======> Businesses input 2' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/businesses/businesses_2.xlsx -s License# -t RawBusinesses_2 -o {0}'.format( args.master_filename ) )
-
-    # Generate expanded Businesses table
-    print( '\n=======> Businesses merge' )
-    os.system( 'python lawrence_businesses.py -m {0}'.format( args.master_filename ) )
-
-    # Read city building permit data
-    print( '\n=======> City Building Permit input' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/building_permits/building_permits.xlsx -n "Permit#" -s "Permit#" -t RawBuildingPermits -o {0}'.format( args.master_filename ) )
-
-    # Generate city Building Permits table
-    print( '\n=======> City Building Permits table' )
-    os.system( 'python lawrence_building_permits.py -m {0}'.format( args.master_filename ) )
-
-    # Read Columbia Gas building permit data
-    print( '\n=======> Columbia Gas Building Permit input' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/building_permits/building_permits_columbia_gas.xls -n "Permit #" -u "City/Town,Address Num,Street" -s "Date,Permit #,Address Num,Street" -t RawBuildingPermits_Cga -o {0}'.format( args.master_filename ) )
-
-    # Generate Columbia Gas Building Permits table
-    print( '\n=======> Columbia Gas Building Permits table' )
-    os.system( 'python lawrence_building_permits_cga.py -m {0}'.format( args.master_filename ) )
-
-    # Read electrical building permit data
-    print( '\n=======> Electrical Building Permit input' )
-    os.system( 'python xl_to_db.py -d ../xl/lawrence/building_permits/electrical -p "Permit Type,Subtype" -t RawBuildingPermits_Electrical -o {0}'.format( args.master_filename ) )
-
-    # Generate Electrical Building Permits table
-    print( '\n=======> Electrical Building Permits table' )
-    os.system( 'python lawrence_building_permits.py -p Electrical -m {0}'.format( args.master_filename ) )
-
-    # Read gas building permit data
-    print( '\n=======> Gas Building Permit input' )
-    os.system( 'python xl_to_db.py -d ../xl/lawrence/building_permits/gas -p "Permit Type,Subtype" -t RawBuildingPermits_Gas -o {0}'.format( args.master_filename ) )
-
-    # Generate Gas Building Permits table
-    print( '\n=======> Gas Building Permits table' )
-    os.system( 'python lawrence_building_permits.py -p Gas -m {0}'.format( args.master_filename ) )
-
-    # Read plumbing building permit data
-    print( '\n=======> Plumbing Building Permit input' )
-    os.system( 'python xl_to_db.py -d ../xl/lawrence/building_permits/plumbing -p "Permit Type,Subtype" -t RawBuildingPermits_Plumbing -o {0}'.format( args.master_filename ) )
-
-    # Generate Plumbing Building Permits table
-    print( '\n=======> Plumbing Building Permits table' )
-    os.system( 'python lawrence_building_permits.py -p Plumbing -m {0}'.format( args.master_filename ) )
-
-    # Read roof building permit data
-    print( '\n=======> Roof Building Permit input' )
-    os.system( 'python xl_to_db.py -d ../xl/lawrence/building_permits/roof -p "Site Contact,Use of Property,Use Group" -t RawBuildingPermits_Roof -o {0}'.format( args.master_filename ) )
-
-    # Generate Roof Building Permits table
-    print( '\n=======> Roof Building Permits table' )
-    os.system( 'python lawrence_building_permits.py -p Roof -m {0}'.format( args.master_filename ) )
-
-    # Read siding building permit data
-    print( '\n=======> Siding Building Permit input' )
-    os.system( 'python xl_to_db.py -d ../xl/lawrence/building_permits/siding -p "Site Contact,Use of Property,Use Group" -t RawBuildingPermits_Siding -o {0}'.format( args.master_filename ) )
-
-    # Generate Siding Building Permits table
-    print( '\n=======> Siding Building Permits table' )
-    os.system( 'python lawrence_building_permits.py -p Siding -m {0}'.format( args.master_filename ) )
-
-    # Read solar building permit data
-    print( '\n=======> Solar Building Permit input' )
-    os.system( 'python xl_to_db.py -d ../xl/lawrence/building_permits/solar -p "Permit Type,Subtype,Use of Property" -t RawBuildingPermits_Solar -o {0}'.format( args.master_filename ) )
-
-    # Generate Solar Building Permits table
-    print( '\n=======> Solar Building Permits table' )
-    os.system( 'python lawrence_building_permits_solar.py -m {0}'.format( args.master_filename ) )
-
-    # Read Sunrun building permit data
-    print( '\n=======> Sunrun Building Permit input' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/building_permits/building_permits_sunrun.xlsx -y -t RawBuildingPermits_Sunrun -o {0}'.format( args.master_filename ) )
-
-    # Generate Sunrun Building Permits table
-    print( '\n=======> Sunrun Building Permits table' )
-    os.system( 'python lawrence_building_permits_sunrun.py -m {0}'.format( args.master_filename ) )
-
-    # Read weatherization building permit data
-    print( '\n=======> Weatherization building permits input' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/building_permits/wx/building_permits_wx.xlsx -p "Work Description,Use of Property" -t RawBuildingPermits_Wx -o {0}'.format( args.master_filename ) )
-    print( '\n=======> Past weatherization building permits input' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/building_permits/wx/building_permits_wx_past.xlsx -p "id" -t RawBuildingPermits_Wx_Past -o {0}'.format( args.master_filename ) )
-    print( '\n=======> Ongoing weatherization building permits input' )
-    os.system( 'python xl_to_db.py -d ../xl/lawrence/building_permits/wx/ongoing -p "Project Description,Use of Property" -t RawBuildingPermits_Wx_Ongoing -o {0}'.format( args.master_filename ) )
-
-    # Generate Weatherization Building Permits table
-    print( '\n=======> Weatherization Building Permits table' )
-    os.system( 'python lawrence_building_permits_wx.py -m {0}'.format( args.master_filename ) )
-
-    # Read GLCAC jobs data
-    print( '\n=======> GLCAC weatherization jobs input' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/building_permits/wx/glcac_jobs.xlsx -t RawGlcacJobs -o {0}'.format( args.master_filename ) )
-
-    # Generate GLCAC jobs table
-    print( '\n=======> GLCAC weatherization jobs table' )
-    os.system( 'python lawrence_glcac_jobs.py -m {0}'.format( args.master_filename ) )
-
-    # Combine GLCAC and weatherization permit data
-    print( '\n=======> Combine GLCAC and weatherization permit data' )
-    os.system( 'python lawrence_glcac_with_wx.py -m {0}'.format( args.master_filename ) )
 
-    # Read National Grid account data
-    print( '\n=======> National Grid accounts input' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/community_first_partnership/national_grid_accounts.xlsx -a "CoL_NG" -t RawNgAccountsBasic_L -o {0}'.format( args.master_filename ) )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/community_first_partnership/national_grid_accounts.xlsx -a "TPS" -t RawNgAccountsTps_L -o {0}'.format( args.master_filename ) )
-
-    # Read mappings from National Grid misspelled street names to correct spellings
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/community_first_partnership/national_grid_street_names.xlsx -t RawNgStreetNames_L -o {0}'.format( args.master_filename ) )
-
-    # Generate National Grid account tables
-    print( '\n=======> National Grid accounts tables' )
-    os.system( 'python lawrence_national_grid_accounts.py -m {0}'.format( args.master_filename ) )
-
-    # Correlate parcels with voting districts, building permits, GLCAC jobs, and National Grid accounts
-    print( '\n=======> Parcel history' )
-    os.system( 'python lawrence_parcel_history.py -m {0}'.format( args.master_filename ) )
-
-    # Generate Extended Weatherization Building Permits table
-    print( '\n=======> Extended Weatherization Building Permits table' )
-    os.system( 'python lawrence_building_permits_wx_extend.py -m {0}'.format( args.master_filename ) )
-
-    # Read city ward data
-    print( '\n=======> Wards input' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/community_first_partnership/wards.xlsx -t RawWards_L -o {0}'.format( args.master_filename ) )
-
-    # Generate ward tables
-    print( '\n=======> Ward tables' )
-    os.system( 'python lawrence_wards.py -m {0}'.format( args.master_filename ) )
-
-    # Read per-block-group data on energy meter participation in Mass Save
-    print( '\n=======> Mass Save energy meter participation rates input' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/census/energy_meter_participation.xlsx -x -t RawEnergyMeterParticipation_L -o {0}'.format( args.master_filename ) )
-
-    # Read per-block-group percentages of owner-occupied properties, hand-edited from EJScreen PDF reports
-    print( '\n=======> EJScreen Owner-Occupied percentage input' )
-    os.system( 'python xl_to_db.py -i ../xl/lawrence/census/ejscreen_owner_occupied.xlsx -k census_geo_id,Percent_Owner_Occupied -t RawOwnerOccupied_L -o {0}'.format( args.master_filename ) )
-
-    # Summarize EJScreen data
-    print( '\n=======> EJScreen summary' )
-    os.system( 'python lawrence_ejscreen_summarize.py -e ../db/lawrence_ejscreen.sqlite -m {0}'.format( args.master_filename ) )
-
-    # Finish generating Assessment Parcels table
-    print( '\n=======> Parcels finish' )
-    os.system( 'python lawrence_parcels_finish.py -m {0}'.format( args.master_filename ) )
-
-    # Analyze building contractor activity
-    print( '\n=======> Contractor activity' )
-    os.system( 'python lawrence_contractor_activity.py -m {0}'.format( args.master_filename ) )
-
-    # Report statistics on unmatched addresses
-    print( '\n=======> Unmatched addresses' )
-    os.system( 'python lawrence_unmatched.py -m {0}'.format( args.master_filename ) )
+    # Tables produced by building permit processing
+    permit_tables = [ 'BuildingPermits_L_' + s.capitalize() for s in util.BUILDING_PERMIT_TYPES ]
+
+    # Build graph: Each step lists the master database tables it reads and writes
+    ls_steps = \
+    [
+        # Read cleaned parcels data
+        {
+            'label': 'Parcels input',
+            'command': 'python db_to_db.py -i ../db/lawrence_parcels.sqlite -f GeoParcels_L -t GeoParcels_L -o {master} -c',
+            'writes': ['GeoParcels_L'],
+            'create': True,
+        },
+
+        # Map parcel geolocations to regions inside Lawrence
+        {
+            'label': 'Parcels table',
+            'command': 'python lawrence_geography.py -b ../xl/lawrence/geography/census_block_group_geometry/tl_2020_25_bg.shp -w ../xl/lawrence/geography/ward_precinct_geometry/WARDSPRECINCTS2022_POLY.shp -p ../xl/lawrence/geography/parcel_geometry/M149TaxPar_CY23_FY24.shp -m {master}',
+            'reads': ['GeoParcels_L'],
+            'writes': ['Parcels_L', 'ParcelAddressIndex_L'],
+            'inputs': ['../xl/lawrence/geography/parcel_geolocation_manual_overrides.xlsx'],
+        },
+
+        # Summarize parcels data
+        {
+            'label': 'Parcels summary',
+            'command': 'python lawrence_parcels_summarize.py -m {master}',
+            'reads': ['Parcels_L'],
+            'writes': ['ParcelSummary_L'],
+        },
+
+        # Process motor vehicles data
+        {
+            'label': 'Motor vehicles table',
+            'command': 'python db_to_db.py -i ' + vehicle_db_filename + ' -f MotorVehicles_L -t MotorVehicles_L -o {master}',
+            'writes': ['MotorVehicles_L'],
+        },
+        {
+            'label': 'Motor vehicles summary',
+            'command': 'python lawrence_motor_vehicles_summarize.py -m {master}',
+            'reads': ['MotorVehicles_L'],
+            'writes': ['MotorVehicleSummary_L'],
+        },
+
+        # Read and combine city vehicles data
+        {
+            'label': 'VIN dictionary input',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/city_vehicles/vin_dictionary.csv -t VinDictionary_L -v -o {master}',
+            'writes': ['VinDictionary_L'],
+        },
+        {
+            'label': 'DPW vehicles input',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/city_vehicles/dpw_vehicles.xlsx -t RawDpwVehicles_L -o {master}',
+            'writes': ['RawDpwVehicles_L'],
+        },
+        {
+            'label': 'Vehicle excise tax input',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/city_vehicles/vehicle_excise_tax.xlsx -p COMMITMENT -t RawVehicleExciseTax_L -o {master}',
+            'writes': ['RawVehicleExciseTax_L'],
+        },
+        {
+            'label': 'Vehicle attributes',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/city_vehicles/vehicle_attributes.xlsx -k ' + keep_columns + ' -t RawVehicleAttributes_L -o {master}',
+            'writes': ['RawVehicleAttributes_L'],
+        },
+        {
+            'label': 'City vehicles table',
+            'command': 'python lawrence_city_vehicles.py -m {master}',
+            'reads': ['RawVehicleExciseTax_L', 'RawDpwVehicles_L', 'VinDictionary_L', 'RawVehicleAttributes_L'],
+            'writes': ['CityVehicles_L'],
+        },
+
+        # Read census data
+        {
+            'label': 'Census input',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/census/census.txt -n "Res. ID" -s "Res. ID" -t RawCensus_L -v -f "|" -x -o {master}',
+            'writes': ['RawCensus_L'],
+        },
+
+        # Generate Census table
+        {
+            'label': 'Census table',
+            'command': 'python lawrence_census.py -m {master}',
+            'reads': ['RawCensus_L', 'Parcels_L', 'ParcelAddressIndex_L'],
+            'writes': ['Census_L'],
+        },
+
+        # Read residential assessment data
+        {
+            'label': 'Residential input 1',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/assessment/residential_1.xlsx -t RawResidential_1 -r 1 -o {master}',
+            'writes': ['RawResidential_1'],
+        },
+        {
+            'label': 'Residential input 2',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/assessment/residential_2.xlsx -t RawResidential_2 -r 1 -o {master}',
+            'writes': ['RawResidential_2'],
+        },
+        {
+            'label': 'Residential input 3',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/assessment/residential_3.xlsx -t RawResidential_3 -r 1 -o {master}',
+            'writes': ['RawResidential_3'],
+        },
+        {
+            'label': 'Residential input 4',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/assessment/residential_4_5.txt -t RawResidential_4 -v -f "|" -x -o {master}',
+            'writes': ['RawResidential_4'],
+        },
+        {
+            'label': 'Residential input 5',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/assessment/residential_4_5.txt -t RawResidential_5 -v -f "|" -x -o {master}',
+            'writes': ['RawResidential_5'],
+        },
+
+        # Generate table of residential assessments
+        {
+            'label': 'Residential merge',
+            'command': 'python lawrence_residential.py -m {master}',
+            'reads': ['RawResidential_1', 'RawResidential_2', 'RawResidential_3', 'RawResidential_4', 'RawResidential_5'],
+            'writes': ['Assessment_L_Residential_Merged', 'Residential_ColumnNames'],
+        },
+
+        # Read commercial assessment data
+        {
+            'label': 'Commercial input 1',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/assessment/commercial_1.xlsx -t RawCommercial_1 -r 2 -n Location -o {master}',
+            'writes': ['RawCommercial_1'],
+        },
+        {
+            'label': 'Commercial input 2',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/assessment/commercial_2.xlsx -t RawCommercial_2 -r 2 -k "REM_ACCT_NUM,REM_USE_CODE,CNS_OCC,CNS_OCC_DESC" -n REM_USE_CODE -o {master}',
+            'writes': ['RawCommercial_2'],
+        },
+
+        # Generate table of commercial assessments
+        {
+            'label': 'Commercial merge',
+            'command': 'python lawrence_commercial.py -m {master}',
+            'reads': ['RawCommercial_1', 'RawCommercial_2'],
+            'writes': ['Assessment_L_Commercial_Merged', 'Commercial_ColumnNames'],
+        },
+
+        # Correct mis-classification of residential and commercial assessment records
+        {
+            'label': 'Land use',
+            'command': 'python lawrence_land_use.py -l ../xl/residential_land_use_codes.xlsx -m {master}',
+            'reads': ['Assessment_L_Residential_Merged', 'Assessment_L_Commercial_Merged'],
+            'writes': ['Assessment_L_Residential', 'Assessment_L_Commercial'],
+        },
+
+        # Read business registration data
+        {
+            'label': 'Businesses input 1',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/businesses/businesses_1.xlsx -s License# -t RawBusinesses_1 -o {master}',
+            'writes': ['RawBusinesses_1'],
+        },
+        {
+            'label': 'Businesses input 2',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/businesses/businesses_2.xlsx -s License# -t RawBusinesses_2 -o {master}',
+            'writes': ['RawBusinesses_2'],
+        },
+
+        # Generate expanded Businesses table
+        {
+            'label': 'Businesses merge',
+            'command': 'python lawrence_businesses.py -m {master}',
+            'reads': ['RawBusinesses_1', 'RawBusinesses_2', 'Parcels_L'],
+            'writes': ['Businesses_L'],
+        },
+
+        # Read city building permit data
+        {
+            'label': 'City Building Permit input',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/building_permits/building_permits.xlsx -n "Permit#" -s "Permit#" -t RawBuildingPermits -o {master}',
+            'writes': ['RawBuildingPermits'],
+        },
+
+        # Generate city Building Permits table
+        {
+            'label': 'City Building Permits table',
+            'command': 'python lawrence_building_permits.py -m {master}',
+            'reads': ['RawBuildingPermits', 'Parcels_L', 'ParcelAddressIndex_L'],
+            'writes': ['BuildingPermits_L'],
+        },
+
+        # Read Columbia Gas building permit data
+        {
+            'label': 'Columbia Gas Building Permit input',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/building_permits/building_permits_columbia_gas.xls -n "Permit #" -u "City/Town,Address Num,Street" -s "Date,Permit #,Address Num,Street" -t RawBuildingPermits_Cga -o {master}',
+            'writes': ['RawBuildingPermits_Cga'],
+        },
+
+        # Generate Columbia Gas Building Permits table
+        {
+            'label': 'Columbia Gas Building Permits table',
+            'command': 'python lawrence_building_permits_cga.py -m {master}',
+            'reads': ['RawBuildingPermits_Cga', 'Parcels_L', 'ParcelAddressIndex_L'],
+            'writes': ['BuildingPermits_L_Cga'],
+        },
+
+        # Read electrical building permit data
+        {
+            'label': 'Electrical Building Permit input',
+            'command': 'python xl_to_db.py -d ../xl/lawrence/building_permits/electrical -p "Permit Type,Subtype" -t RawBuildingPermits_Electrical -o {master}',
+            'writes': ['RawBuildingPermits_Electrical'],
+        },
+
+        # Generate Electrical Building Permits table
+        {
+            'label': 'Electrical Building Permits table',
+            'command': 'python lawrence_building_permits.py -p Electrical -m {master}',
+            'reads': ['RawBuildingPermits_Electrical', 'Parcels_L', 'ParcelAddressIndex_L'],
+            'writes': ['BuildingPermits_L_Electrical'],
+        },
+
+        # Read gas building permit data
+        {
+            'label': 'Gas Building Permit input',
+            'command': 'python xl_to_db.py -d ../xl/lawrence/building_permits/gas -p "Permit Type,Subtype" -t RawBuildingPermits_Gas -o {master}',
+            'writes': ['RawBuildingPermits_Gas'],
+        },
+
+        # Generate Gas Building Permits table
+        {
+            'label': 'Gas Building Permits table',
+            'command': 'python lawrence_building_permits.py -p Gas -m {master}',
+            'reads': ['RawBuildingPermits_Gas', 'Parcels_L', 'ParcelAddressIndex_L'],
+            'writes': ['BuildingPermits_L_Gas'],
+        },
+
+        # Read plumbing building permit data
+        {
+            'label': 'Plumbing Building Permit input',
+            'command': 'python xl_to_db.py -d ../xl/lawrence/building_permits/plumbing -p "Permit Type,Subtype" -t RawBuildingPermits_Plumbing -o {master}',
+            'writes': ['RawBuildingPermits_Plumbing'],
+        },
+
+        # Generate Plumbing Building Permits table
+        {
+            'label': 'Plumbing Building Permits table',
+            'command': 'python lawrence_building_permits.py -p Plumbing -m {master}',
+            'reads': ['RawBuildingPermits_Plumbing', 'Parcels_L', 'ParcelAddressIndex_L'],
+            'writes': ['BuildingPermits_L_Plumbing'],
+        },
+
+        # Read roof building permit data
+        {
+            'label': 'Roof Building Permit input',
+            'command': 'python xl_to_db.py -d ../xl/lawrence/building_permits/roof -p "Site Contact,Use of Property,Use Group" -t RawBuildingPermits_Roof -o {master}',
+            'writes': ['RawBuildingPermits_Roof'],
+        },
+
+        # Generate Roof Building Permits table
+        {
+            'label': 'Roof Building Permits table',
+            'command': 'python lawrence_building_permits.py -p Roof -m {master}',
+            'reads': ['RawBuildingPermits_Roof', 'Parcels_L', 'ParcelAddressIndex_L'],
+            'writes': ['BuildingPermits_L_Roof'],
+        },
+
+        # Read siding building permit data
+        {
+            'label': 'Siding Building Permit input',
+            'command': 'python xl_to_db.py -d ../xl/lawrence/building_permits/siding -p "Site Contact,Use of Property,Use Group" -t RawBuildingPermits_Siding -o {master}',
+            'writes': ['RawBuildingPermits_Siding'],
+        },
+
+        # Generate Siding Building Permits table
+        {
+            'label': 'Siding Building Permits table',
+            'command': 'python lawrence_building_permits.py -p Siding -m {master}',
+            'reads': ['RawBuildingPermits_Siding', 'Parcels_L', 'ParcelAddressIndex_L'],
+            'writes': ['BuildingPermits_L_Siding'],
+        },
+
+        # Read solar building permit data
+        {
+            'label': 'Solar Building Permit input',
+            'command': 'python xl_to_db.py -d ../xl/lawrence/building_permits/solar -p "Permit Type,Subtype,Use of Property" -t RawBuildingPermits_Solar -o {master}',
+            'writes': ['RawBuildingPermits_Solar'],
+        },
+
+        # Generate Solar Building Permits table
+        {
+            'label': 'Solar Building Permits table',
+            'command': 'python lawrence_building_permits_solar.py -m {master}',
+            'reads': ['RawBuildingPermits_Solar', 'Parcels_L', 'ParcelAddressIndex_L'],
+            'writes': ['BuildingPermits_L_Solar'],
+        },
+
+        # Read Sunrun building permit data
+        {
+            'label': 'Sunrun Building Permit input',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/building_permits/building_permits_sunrun.xlsx -y -t RawBuildingPermits_Sunrun -o {master}',
+            'writes': ['RawBuildingPermits_Sunrun'],
+        },
+
+        # Generate Sunrun Building Permits table
+        {
+            'label': 'Sunrun Building Permits table',
+            'command': 'python lawrence_building_permits_sunrun.py -m {master}',
+            'reads': ['RawBuildingPermits_Sunrun', 'Parcels_L', 'ParcelAddressIndex_L'],
+            'writes': ['BuildingPermits_L_Sunrun'],
+        },
+
+        # Read weatherization building permit data
+        {
+            'label': 'Weatherization building permits input',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/building_permits/wx/building_permits_wx.xlsx -p "Work Description,Use of Property" -t RawBuildingPermits_Wx -o {master}',
+            'writes': ['RawBuildingPermits_Wx'],
+        },
+        {
+            'label': 'Past weatherization building permits input',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/building_permits/wx/building_permits_wx_past.xlsx -p "id" -t RawBuildingPermits_Wx_Past -o {master}',
+            'writes': ['RawBuildingPermits_Wx_Past'],
+        },
+        {
+            'label': 'Ongoing weatherization building permits input',
+            'command': 'python xl_to_db.py -d ../xl/lawrence/building_permits/wx/ongoing -p "Project Description,Use of Property" -t RawBuildingPermits_Wx_Ongoing -o {master}',
+            'writes': ['RawBuildingPermits_Wx_Ongoing'],
+        },
+
+        # Generate Weatherization Building Permits table
+        {
+            'label': 'Weatherization Building Permits table',
+            'command': 'python lawrence_building_permits_wx.py -m {master}',
+            'reads': ['RawBuildingPermits_Wx', 'RawBuildingPermits_Wx_Past', 'RawBuildingPermits_Wx_Ongoing', 'Parcels_L', 'ParcelAddressIndex_L'],
+            'writes': ['BuildingPermits_L_Wx'],
+        },
+
+        # Read GLCAC jobs data
+        {
+            'label': 'GLCAC weatherization jobs input',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/building_permits/wx/glcac_jobs.xlsx -t RawGlcacJobs -o {master}',
+            'writes': ['RawGlcacJobs'],
+        },
+
+        # Generate GLCAC jobs table
+        {
+            'label': 'GLCAC weatherization jobs table',
+            'command': 'python lawrence_glcac_jobs.py -m {master}',
+            'reads': ['RawGlcacJobs', 'Parcels_L', 'ParcelAddressIndex_L'],
+            'writes': ['GlcacJobs_L'],
+        },
+
+        # Combine GLCAC and weatherization permit data
+        {
+            'label': 'Combine GLCAC and weatherization permit data',
+            'command': 'python lawrence_glcac_with_wx.py -m {master}',
+            'reads': ['GlcacJobs_L', 'BuildingPermits_L_Wx'],
+            'writes': ['GlcacJobsWithPermits_L'],
+        },
+
+        # Read National Grid account data
+        {
+            'label': 'National Grid accounts input - Basic',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/community_first_partnership/national_grid_accounts.xlsx -a "CoL_NG" -t RawNgAccountsBasic_L -o {master}',
+            'writes': ['RawNgAccountsBasic_L'],
+        },
+        {
+            'label': 'National Grid accounts input - TPS',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/community_first_partnership/national_grid_accounts.xlsx -a "TPS" -t RawNgAccountsTps_L -o {master}',
+            'writes': ['RawNgAccountsTps_L'],
+        },
+
+        # Read mappings from National Grid misspelled street names to correct spellings
+        {
+            'label': 'National Grid street names input',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/community_first_partnership/national_grid_street_names.xlsx -t RawNgStreetNames_L -o {master}',
+            'writes': ['RawNgStreetNames_L'],
+        },
+
+        # Generate National Grid account tables
+        {
+            'label': 'National Grid accounts tables',
+            'command': 'python lawrence_national_grid_accounts.py -m {master}',
+            'reads': ['RawNgStreetNames_L', 'RawNgAccountsBasic_L', 'RawNgAccountsTps_L', 'Parcels_L', 'ParcelAddressIndex_L'],
+            'writes': ['NgAccountsBasic_L', 'NgAccountsTps_L', 'NgAccountsR1_L', 'NgAccountsR2_L'],
+        },
+
+        # Correlate parcels with voting districts, building permits, GLCAC jobs, and National Grid accounts
+        {
+            'label': 'Parcel history',
+            'command': 'python lawrence_parcel_history.py -m {master}',
+            'reads': ['Parcels_L', * permit_tables, 'GlcacJobs_L', 'NgAccountsR1_L', 'NgAccountsR2_L'],
+            'writes': ['Assessment_L_Parcels_Merged'],
+        },
+
+        # Generate Extended Weatherization Building Permits table
+        {
+            'label': 'Extended Weatherization Building Permits table',
+            'command': 'python lawrence_building_permits_wx_extend.py -m {master}',
+            'reads': ['BuildingPermits_L_Wx', 'Assessment_L_Parcels_Merged'],
+            'writes': ['BuildingPermits_L_Wx_Extended'],
+        },
+
+        # Read city ward data
+        {
+            'label': 'Wards input',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/community_first_partnership/wards.xlsx -t RawWards_L -o {master}',
+            'writes': ['RawWards_L'],
+        },
+
+        # Generate ward tables
+        {
+            'label': 'Ward tables',
+            'command': 'python lawrence_wards.py -m {master}',
+            'reads': ['Assessment_L_Parcels_Merged', 'RawWards_L'],
+            'writes':
+            [
+                * [ 'Ward_{}_ResidentialParcels'.format( s_ward ) for s_ward in util.LAWRENCE_WARDS ],
+                'WardSummary',
+                'WardSummary_Lean_Nwx',
+                'WardSummary_Rentals_2_4',
+                'WardSummary_Rentals_Gt4',
+            ],
+        },
+
+        # Read per-block-group data on energy meter participation in Mass Save
+        {
+            'label': 'Mass Save energy meter participation rates input',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/census/energy_meter_participation.xlsx -x -t RawEnergyMeterParticipation_L -o {master}',
+            'writes': ['RawEnergyMeterParticipation_L'],
+        },
+
+        # Read per-block-group percentages of owner-occupied properties, hand-edited from EJScreen PDF reports
+        {
+            'label': 'EJScreen Owner-Occupied percentage input',
+            'command': 'python xl_to_db.py -i ../xl/lawrence/census/ejscreen_owner_occupied.xlsx -k census_geo_id,Percent_Owner_Occupied -t RawOwnerOccupied_L -o {master}',
+            'writes': ['RawOwnerOccupied_L'],
+        },
+
+        # Summarize EJScreen data
+        {
+            'label': 'EJScreen summary',
+            'command': 'python lawrence_ejscreen_summarize.py -e ' + ejscreen_db_filename + ' -m {master}',
+            'reads': ['RawEnergyMeterParticipation_L', 'Assessment_L_Parcels_Merged', 'RawOwnerOccupied_L', 'MotorVehicles_L'],
+            'writes': ['EJScreenSummary_L'],
+        },
+
+        # Finish generating Assessment Parcels table
+        {
+            'label': 'Parcels finish',
+            'command': 'python lawrence_parcels_finish.py -m {master}',
+            'reads': ['Assessment_L_Parcels_Merged', 'EJScreenSummary_L'],
+            'writes': ['Assessment_L_Parcels'],
+        },
+
+        # Analyze building contractor activity
+        {
+            'label': 'Contractor activity',
+            'command': 'python lawrence_contractor_activity.py -m {master}',
+            'reads': ['Assessment_L_Parcels', * [s for s in permit_tables if s != 'BuildingPermits_L_Cga']],
+            'writes': ['ContractorActivity_L'],
+        },
+
+        # Report statistics on unmatched addresses
+        {
+            'label': 'Unmatched addresses',
+            'command': 'python lawrence_unmatched.py -m {master}',
+            'reads': ['BuildingPermits_L', * permit_tables, 'BuildingPermits_L_Sunrun', 'Businesses_L', 'Census_L', 'GlcacJobs_L', 'NgAccountsR1_L', 'NgAccountsR2_L'],
+            'writes': ['UnmatchedAddresses_L'],
+        },
+
+        # ----------------------------------------------------
+        # <-- Lawrence master database build ends here <--
+        # ----------------------------------------------------
+
+
+        # --------------------------------------------------
+        # --> Lawrence KML build starts here -->
+        # --------------------------------------------------
+
+        #-----------
+        # Geography
+        #-----------
+
+        # Generate KML file showing Lawrence city boundary
+        {
+            'label': 'KML city',
+            'command': 'python lawrence_kml_city.py -w ../xl/lawrence/geography/ward_precinct_geometry/WARDSPRECINCTS2022_POLY.shp -o ../db/kml/geography',
+            'outputs': ['../db/kml/geography/city.kml'],
+        },
+
+        # Generate KML file showing Lawrence ZIP code boundaries
+        {
+            'label': 'KML ZIP codes',
+            'command': 'python lawrence_kml_zip_codes.py -z ../xl/lawrence/geography/zip_code_geometry/ZIP_Codes_(5-Digit)_from_HERE_(Navteq).shp -o ../db/kml/geography',
+            'outputs': ['../db/kml/geography/zip_codes.kml'],
+        },
+
+        # Generate KML file showing wards boundaries
+        {
+            'label': 'KML wards',
+            'command': 'python lawrence_kml_wards.py -w ../xl/lawrence/geography/ward_precinct_geometry/WARDSPRECINCTS2022_POLY.shp -o ../db/kml/geography',
+            'outputs': ['../db/kml/geography/wards.kml'],
+        },
+
+        # Generate KML file showing Lawrence block group boundaries
+        {
+            'label': 'KML block groups',
+            'command': 'python lawrence_kml_block_groups.py -b ../xl/lawrence/geography/census_block_group_geometry/tl_2020_25_bg.shp -o ../db/kml/geography',
+            'outputs': ['../db/kml/geography/block_groups.kml'],
+        },
+
+        #-----------
+        # Heat maps
+        #-----------
+
+        # Generate KML files showing Census Block Group heat maps
+        {
+            'label': 'KML heat maps',
+            'command': 'python lawrence_kml_heat_maps.py -b ../xl/lawrence/geography/census_block_group_geometry/tl_2020_25_bg.shp -c ../xl/lawrence/census/heat_map_values.csv -m {master} -o ../db/kml/heat_maps',
+            'reads': ['EJScreenSummary_L', 'Assessment_L_Parcels_Merged'],
+            'writes': ['HeatMaps_L'],
+            'outputs': ['../db/kml/heat_maps/heat_maps.kml'],
+        },
+
+        #-----------
+        # Parcels
+        #-----------
+
+        # Generate KML files showing Lawrence parcels partitioned in various ways
+        {
+            'label': 'KML parcels',
+            'command': 'python lawrence_kml_parcels.py -m {master} -o ../db/kml/parcels -c',
+            'reads': ['Assessment_L_Parcels_Merged'],
+            'outputs': ['../db/kml/parcels/parcels.kml'],
+        },
+
+        # ----------------------------------------------------
+        # <-- Lawrence KML build ends here <--
+        # ----------------------------------------------------
+
+
+        # --------------------------------------------------
+        # --> Lawrence summary build starts here -->
+        # --------------------------------------------------
+
+        # Generate summaries
+        {
+            'label': 'Summary',
+            'command': 'python lawrence_summary.py -o ../db/xlsx -m {master}',
+            'reads': ['BuildingPermits_L_Wx_Extended'],
+            'writes': ['WxSummaryByPeriod', 'WxSummaryByContractor'],
+            'outputs': ['../db/xlsx/WxSummaryByPeriod.xlsx', '../db/xlsx/WxSummaryByContractor.xlsx'],
+        },
+
+        # ----------------------------------------------------
+        # <-- Lawrence summary build ends here <--
+        # ----------------------------------------------------
+    ]
+
+    # Run the build graph
+    pipeline.run_steps( ls_steps, args.master_filename, n_workers=args.workers, b_force=args.force, b_in_process=args.in_process )
 
     # Generate copyright notice
     print( '\n=======> Copyright' )
     util.create_about_table( 'Lawrence', util.make_df_about_energize_lawrence(), args.master_filename )
 
-    # ----------------------------------------------------
-    # <-- Lawrence master database build ends here <--
-    # ----------------------------------------------------
-
-
-    # --------------------------------------------------
-    # --> Lawrence KML build starts here -->
-    # --------------------------------------------------
-
-    #-----------
-    # Geography
-    #-----------
-
-    # Generate KML file showing Lawrence city boundary
-    print( '\n=======> KML city' )
-    os.system( 'python lawrence_kml_city.py -w ../xl/lawrence/geography/ward_precinct_geometry/WARDSPRECINCTS2022_POLY.shp -o ../db/kml/geography' )
-
-    # Generate KML file showing Lawrence ZIP code boundaries
-    print( '\n=======> KML ZIP codes' )
-    os.system( 'python lawrence_kml_zip_codes.py -z ../xl/lawrence/geography/zip_code_geometry/ZIP_Codes_(5-Digit)_from_HERE_(Navteq).shp -o ../db/kml/geography' )
-
-    # Generate KML file showing wards boundaries
-    print( '\n=======> KML wards' )
-    os.system( 'python lawrence_kml_wards.py -w ../xl/lawrence/geography/ward_precinct_geometry/WARDSPRECINCTS2022_POLY.shp -o ../db/kml/geography' )
-
-    # Generate KML file showing Lawrence block group boundaries
-    print( '\n=======> KML block groups' )
-    os.system( 'python lawrence_kml_block_groups.py -b ../xl/lawrence/geography/census_block_group_geometry/tl_2020_25_bg.shp -o ../db/kml/geography' )
-
-    #-----------
-    # Heat maps
-    #-----------
-
-    # Generate KML files showing Census Block Group heat maps
-    print( '\n=======> KML heat maps' )
-    os.system( 'python lawrence_kml_heat_maps.py -b ../xl/lawrence/geography/census_block_group_geometry/tl_2020_25_bg.shp -c ../xl/lawrence/census/heat_map_values.csv -m {} -o ../db/kml/heat_maps'.format( args.master_filename ) )
-
-    #-----------
-    # Parcels
-    #-----------
-
-    # Generate KML files showing Lawrence parcels partitioned in various ways
-    print( '\n=======> KML parcels' )
-    os.system( 'python lawrence_kml_parcels.py -m {} -o ../db/kml/parcels -c'.format( args.master_filename ) )
-
-    # ----------------------------------------------------
-    # <-- Lawrence KML build ends here <--
-    # ----------------------------------------------------
-
-
-    # --------------------------------------------------
-    # --> Lawrence summary build starts here -->
-    # --------------------------------------------------
-
-    # Generate summaries
-    print( '\n=======> Summary' )
-    os.system( 'python lawrence_summary.py -o ../db/xlsx -m {0}'.format( args.master_filename ) )
-
-    # ----------------------------------------------------
-    # <-- Lawrence summary build ends here <--
-    # ----------------------------------------------------
-
 
     # ----------------------------------------------------
     # --> Lawrence database publishing starts here -->
@@ -40,9 +40,9 @@ if __name__ == '__main__':
     # Clean up before processing
     df_left = df_left.drop_duplicates( subset=[util.PERMIT_NUMBER], keep='last' )
 
-    # Normalize addresses.  Use result_type='expand' to load multiple columns!
+    # Normalize addresses
     df_left[ADDR] = df_left[util.ADDRESS]
-    df_left[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = df_left.apply( lambda row: normalize.normalize_address( row, ADDR, city='LAWRENCE', return_parts=True ), axis=1, result_type='expand' )
+    df_left[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = normalize.normalize_addresses( df_left[ADDR], city='LAWRENCE' )
 
     # Merge left dataframe with assessment data
     table_name = 'BuildingPermits_L' + suffix
@@ -32,9 +32,9 @@ if __name__ == '__main__':
     # Retrieve table from database
     df_left = pd.read_sql_table( 'RawBuildingPermits_Cga', engine, index_col=util.ID, parse_dates=True )
 
-    # Normalize addresses.  Use result_type='expand' to load multiple columns!
+    # Normalize addresses
     df_left[ADDR] = df_left[util.ADDR_STREET_NUMBER].str.strip() + ' ' + df_left[util.ADDR_STREET_NAME].str.strip()
-    df_left[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = df_left.apply( lambda row: normalize.normalize_address( row, ADDR, city='LAWRENCE', return_parts=True ), axis=1, result_type='expand' )
+    df_left[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = normalize.normalize_addresses( df_left[ADDR], city='LAWRENCE' )
 
     # Merge left dataframe with assessment data
     table_name = 'BuildingPermits_L_Cga'
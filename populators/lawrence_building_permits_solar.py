@@ -52,9 +52,9 @@ if __name__ == '__main__':
     idx = df_left.loc[ df_left[util.KW_DC].isnull() ].index
     df_left.at[idx,util.KW_DC] = df_left.loc[idx][util.WATTS_PER_MODULE]
 
-    # Normalize addresses.  Use result_type='expand' to load multiple columns!
+    # Normalize addresses
     df_left[ADDR] = df_left[util.ADDRESS]
-    df_left[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = df_left.apply( lambda row: normalize.normalize_address( row, ADDR, city='LAWRENCE', return_parts=True ), axis=1, result_type='expand' )
+    df_left[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = normalize.normalize_addresses( df_left[ADDR], city='LAWRENCE' )
 
     # Merge left dataframe with assessment data
     table_name = 'BuildingPermits_L_Solar'
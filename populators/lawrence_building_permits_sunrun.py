@@ -86,9 +86,9 @@ if __name__ == '__main__':
     # Build unscrambled dataframe from scrambled raw data
     df_left = unscramble_data()
 
-    # Normalize addresses.  Use result_type='expand' to load multiple columns!
+    # Normalize addresses
     df_left[ADDR] = df_left[util.ADDRESS]
-    df_left[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = df_left.apply( lambda row: normalize.normalize_address( row, ADDR, city='LAWRENCE', return_parts=True ), axis=1, result_type='expand' )
+    df_left[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = normalize.normalize_addresses( df_left[ADDR], city='LAWRENCE' )
 
     # Merge left dataframe with assessment data
     table_name = 'BuildingPermits_L_Sunrun'
@@ -42,9 +42,9 @@ if __name__ == '__main__':
     # Clean up before processing
     df_permits = df_permits.drop_duplicates( subset=[util.PERMIT_NUMBER], keep='last' )
 
-    # Normalize addresses.  Use result_type='expand' to load multiple columns!
+    # Normalize addresses
     df_permits[ADDR] = df_permits[util.ADDRESS].str.strip()
-    df_permits[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = df_permits.apply( lambda row: normalize.normalize_address( row, ADDR, city='LAWRENCE', return_parts=True ), axis=1, result_type='expand' )
+    df_permits[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = normalize.normalize_addresses( df_permits[ADDR], city='LAWRENCE' )
 
     # Merge permits dataframe with assessment data
     table_name = 'BuildingPermits_L_Wx'
@@ -35,9 +35,9 @@ if __name__ == '__main__':
     df_bus_2 = pd.read_sql_table( 'RawBusinesses_2', engine, index_col=util.ID, parse_dates=True, columns=[util.LICENSE_NUMBER, util.BUSINESS_MANAGER] )
     df_left = pd.merge( df_bus_1, df_bus_2, how='left', on=util.LICENSE_NUMBER )
 
-    # Normalize addresses.  Use result_type='expand' to load multiple columns!
+    # Normalize addresses
     df_left[ADDR] = df_left[util.LOCATION]
-    df_left[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = df_left.apply( lambda row: normalize.normalize_address( row, ADDR, city='LAWRENCE', return_parts=True ), axis=1, result_type='expand' )
+    df_left[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = normalize.normalize_addresses( df_left[ADDR], city='LAWRENCE' )
 
     # Read parcels assessment data and select columns for merge
     df_parcels = util.read_parcels_table_for_merge( engine, columns=None )
@@ -1,6 +1,7 @@
 # Copyright 2023 Energize Lawrence.  All rights reserved.
 
 import argparse
+import os
 
 import pandas as pd
 pd.set_option( 'display.max_columns', 500 )
@@ -38,9 +39,9 @@ if __name__ == '__main__':
     df[util.RADDR_STREET_NAME] = df[util.RADDR_STREET_NAME].fillna('').astype(str)
     df[util.RADDR_APARTMENT_NUMBER] = df[util.RADDR_APARTMENT_NUMBER].fillna('').astype(str)
 
-    # Normalize addresses.  Use result_type='expand' to load multiple columns!
+    # Normalize addresses
     df[ADDR] = df[util.RADDR_STREET_NUMBER] + df[util.RADDR_STREET_NUMBER_SUFFIX] + ' ' + df[util.RADDR_STREET_NAME] + ' ' + df[util.RADDR_APARTMENT_NUMBER]
-    df[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = df.apply( lambda row: normalize.normalize_address( row, ADDR, city='LAWRENCE', return_parts=True ), axis=1, result_type='expand' )
+    df[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = normalize.normalize_addresses( df[ADDR], city='LAWRENCE', n_processes=os.cpu_count() )
 
     # Merge census dataframe with assessment data
     table_name = 'Census_L'
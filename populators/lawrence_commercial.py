@@ -73,9 +73,9 @@ if __name__ == '__main__':
     # Drop empty columns
     df_merge = df_merge.dropna( how='all', axis=1 )
 
-    # Normalize addresses.  Use result_type='expand' to load multiple columns!
+    # Normalize addresses
     df_merge[ADDR] = df_merge[util.LOCATION]
-    df_merge[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = df_merge.apply( lambda row: normalize.normalize_address( row, ADDR, city='LAWRENCE', return_parts=True ), axis=1, result_type='expand' )
+    df_merge[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = normalize.normalize_addresses( df_merge[ADDR], city='LAWRENCE' )
 
     # Incorporate scraped data from online Vision database
     df_result = vision.incorporate_vision_assessment_data( engine, df_merge )
@@ -8,14 +8,12 @@ pd.set_option( 'display.width', 1000 )
 
 import geopandas as gpd
 
-from shapely.geometry import Point, Polygon
-from pyproj import Transformer
-
 import os
 
 import sys
 sys.path.append('../util')
 import util
+import geography
 
 MBLU = util.MBLU
 
@@ -42,86 +40,21 @@ GEOMETRY = util.GEOMETRY
 VSID = util.VISION_ID
 ADDRESS = util.ADDRESS
 
-# Transform from projection to lat/long coordinates
-TRANSFORMER = Transformer.from_crs( 'epsg:26986', 'epsg:4326', always_xy=True )
-
-
-
-def pad_slashes( s_mblu ):
-
-    s_mblu = s_mblu.copy()
-
-    s = ~s_mblu.str.contains( '(?:[^/]*/[^/]*){4,}', regex=True )
-
-    while len( s[s] ) > 0:
-        s_mblu.loc[s] = s_mblu.loc[s] + '/'
-        s = ~s_mblu.str.contains( '(?:[^/]*/[^/]*){4,}', regex=True )
-
-    # Clear cells that did not need padding
-    s = s_mblu.str.contains( '////' )
-    s_mblu.loc[s] = ''
-
-    return s_mblu
-
-
-# Transform polygon from polar to lat/long coordinates
-def transform_polygon( poly ):
-
-    # Reorganize current Polygon values into list of tuples
-    xx, yy = poly.exterior.coords.xy
-    ls_x = xx.tolist()
-    ls_y = yy.tolist()
-    ls_xy = [ ( ls_x[i], ls_y[i] ) for i in range( 0, len( ls_x ) ) ]
-
-    # Transform coordinates
-    ls_lat_long = [ TRANSFORMER.transform( x, y ) for x, y in ls_xy ]
-
-    # Set up return values
-    poly = Polygon( ls_lat_long )
-    centroid = poly.centroid
-    lat = centroid.y
-    long = centroid.x
-
-    return poly, centroid, lat, long
-
-
-# Load parcels geometry dataframe
-def load_parcels_geometry():
-
-    # Read raw wards table from the shapefile
-    df = gpd.read_file( args.parcels_filename )
-
-    # Generate mblu-format column from parcel ID
-    df[MBLU] = df['MAP_PAR_ID']
-    df[MBLU] = df[MBLU].fillna( '' )
-    df[MBLU] = df[MBLU].str.replace( '-', '/' )
-    df[MBLU] = df[MBLU].str.replace( '/0/', '//' )
-    df[MBLU] = df[MBLU].str.replace( '/0$', '/', regex=True )
-    df[MBLU] = df[MBLU].str.replace( '^0/', '/', regex=True )
-    df[MBLU] = pad_slashes( df[MBLU] )
-
-    for index, row in df.iterrows():
-
-        # Get geometry for current row
-        shape = row[GEOMETRY]
-
-        # If we got a MultiPolygon, take the outer envelope, which will be a Polygon
-        if shape.geom_type == 'MultiPolygon':
-            poly, centroid, lat, long = transform_polygon( shape.envelope )
-            df.at[index, GEOMETRY] = poly
-            df.at[index, LAT] = lat
-            df.at[index, LONG] = long
+# Region attributes copied to parcels, mapped from shapefile column names
+PRECINCT_COLUMNS = \
+{
+    'WARD': WARD,
+    'PRECINCT': PRECINCT,
+}
 
-        # If we got a Polygon object, take its centroid, which will be a Point
-        elif shape.geom_type == 'Polygon':
-            poly, centroid, lat, long = transform_polygon( shape )
-            df.at[index, GEOMETRY] = centroid
-            df.at[index, LAT] = lat
-            df.at[index, LONG] = long
+BLOCK_GROUP_COLUMNS = \
+{
+    GEOID: GEO_ID,
+    TRACTCE: TRACT,
+    BLKGRPCE: BLOCK_GROUP,
+}
 
-    # Return dataframe
-    df = df[ [MBLU, GEOMETRY, LAT, LONG] ]
-    return df
+REGION_COLUMNS = list( PRECINCT_COLUMNS.values() ) + list( BLOCK_GROUP_COLUMNS.values() )
 
 
 def load_block_groups_geometry():
@@ -137,57 +70,27 @@ def load_block_groups_geometry():
     return df
 
 
-def map_location_to_block_group( point, df_bg ):
-
-    bg = None
-
-    for index, row in df_bg.iterrows():
-        if row[GEOMETRY].contains( point ):
-            bg = \
-            {
-                GEO_ID: row[GEOID],
-                TRACT: row[TRACTCE],
-                BLOCK_GROUP: row[BLKGRPCE]
-            }
-            break
-
-    return bg
-
-
-def load_precincts_geometry():
-
-    # Read raw wards table from the shapefile
-    df = gpd.read_file( args.wards_filename )
-
-    # Extract rows pertaining to Lawrence
-    df = df[ df['TOWN'] == 'LAWRENCE' ]
-
-    for index, row in df.iterrows():
-
-        # Transform to lat/long coordinate system
-        poly, centroid, lat, long = transform_polygon( row[GEOMETRY] )
+# Map geometries to wards, precincts, and census block groups with spatial joins
+# - Returns dataframe indexed like the geometries, with one column for each region attribute
+# - Attributes of regions that do not contain a geometry are left empty
+def map_to_regions( sr_geometry, df_precincts, df_block_groups ):
 
-        # Save transformed coordinates in dataframe
-        df.at[index, GEOMETRY] = poly
-
-    # Return dataframe
-    return df
+    df_regions = pd.DataFrame( None, index=sr_geometry.index, columns=REGION_COLUMNS, dtype=object )
 
+    for df_layer, dc_columns in [ ( df_precincts, PRECINCT_COLUMNS ), ( df_block_groups, BLOCK_GROUP_COLUMNS ) ]:
 
-def map_location_to_precinct( point, df_wp ):
+        # Find regions containing each geometry, using the spatial index of the region layer
+        # - Differences between lat/long coordinate systems of the layers are negligible
+        df_left = gpd.GeoDataFrame( geometry=gpd.GeoSeries( sr_geometry ).set_crs( df_layer.crs, allow_override=True ) )
+        df_joined = gpd.sjoin( df_left, df_layer[list( dc_columns ) + [GEOMETRY]], how='inner', predicate='within' )
 
-    wp = None
+        # Where regions overlap, take the first one in the layer
+        df_joined = df_joined.sort_values( by='index_right', kind='stable' )
+        df_joined = df_joined[ ~df_joined.index.duplicated( keep='first' ) ]
 
-    for index, row in df_wp.iterrows():
-        if row[GEOMETRY].contains( point ):
-            wp = \
-            {
-                WARD: row['WARD'],
-                PRECINCT: row['PRECINCT']
-            }
-            break
+        df_regions.loc[df_joined.index, list( dc_columns.values() )] = df_joined[list( dc_columns )].values
 
-    return wp
+    return df_regions
 
 
 def get_parcels_table():
@@ -217,31 +120,33 @@ def get_parcels_table():
     df_parcels[LONG] = df_parcels[LONG].astype(float).round( decimals=5 )
     df_parcels[LAT] = df_parcels[LAT].astype(float).round( decimals=5 )
 
-    return conn, cur, df_parcels
+    return conn, cur, engine, df_parcels
+
 
+def map_locations_to_regions( df_parcels, df_geo, df_precincts, df_block_groups ):
 
-def map_locations_to_regions( df_parcels, df_geo, df_regions, map_location_to_region, ls_columns ):
+    # Map points at parcel geolocations
+    sr_points = gpd.GeoSeries( gpd.points_from_xy( df_geo[LONG], df_geo[LAT] ), index=df_geo.index )
+    df_regions = map_to_regions( sr_points, df_precincts, df_block_groups )
 
-    # Initialize new columns
-    for col in ls_columns:
+    # Save region attributes in parcels table
+    for col in REGION_COLUMNS:
         df_parcels[col] = None
+        df_parcels.loc[df_regions.index, col] = df_regions[col]
 
-    n_found = 0
-    n_failed = 0
+    print( 'Found {} mappings to precincts'.format( df_regions[WARD].notnull().sum() ) )
+    print( 'Found {} mappings to census block groups'.format( df_regions[GEO_ID].notnull().sum() ) )
 
-    # Iterate over parcels that have geolocations
-    for index, row in df_geo.iterrows():
-        region = map_location_to_region( Point( row[LONG], row[LAT] ), df_regions )
-        if region != None:
-            n_found += 1
-            for col in ls_columns:
-                df_parcels.at[index, col] = region[col]
-        else:
-            n_failed += 1
+    return df_parcels
 
-    print( 'Found {} mappings'.format( n_found ) )
 
-    return df_parcels
+# Save values of found geometries in their target parcels
+# - Where several geometries of a parcel were found, the last one prevails, as when they were mapped one at a time
+def save_found_values( df_parcels, df_values, sr_found, sr_target_index, ls_columns ):
+    df_found = df_values.loc[sr_found, ls_columns]
+    df_found.index = sr_target_index[sr_found].values
+    df_found = df_found[ ~df_found.index.duplicated( keep='last' ) ]
+    df_parcels.loc[df_found.index, ls_columns] = df_found.values
 
 
 def map_geometries_to_regions( df_parcels, df_precincts, df_block_groups ):
@@ -250,40 +155,33 @@ def map_geometries_to_regions( df_parcels, df_precincts, df_block_groups ):
     df_unmapped_parcels = df_parcels[ ( df_parcels[GEO_ID] == 0 ) | df_parcels[WARD].isna() ]
 
     # Get geometries of unmapped parcels
-    df_geometries = load_parcels_geometry()
+    df_geometries = geography.load_parcels_geometry( args.parcels_filename )
     df_unmapped_geometries = df_geometries[ df_geometries[MBLU].isin( df_unmapped_parcels[MBLU] ) ]
 
+    # Find the first parcel with the same MBLU as each geometry; a parcel may have several geometries
+    sr_parcel_index = pd.Series( df_parcels.index, index=df_parcels[MBLU] )
+    sr_parcel_index = sr_parcel_index[ ~sr_parcel_index.index.duplicated( keep='first' ) ]
+    df_unmapped_geometries = df_unmapped_geometries.reset_index( drop=True )
+    sr_target_index = pd.Series( sr_parcel_index.loc[ df_unmapped_geometries[MBLU] ].values, index=df_unmapped_geometries.index )
+
     print( '' )
     print( 'Mapping {} geometries to precincts and census block groups'.format( len( df_unmapped_geometries ) ) )
 
-    n_unmapped_found_in_a_precinct = 0
-    n_unmapped_found_in_a_block_group = 0
+    df_regions = map_to_regions( df_unmapped_geometries[GEOMETRY], df_precincts, df_block_groups )
+    sr_found_in_a_precinct = df_regions[WARD].notnull()
+    sr_found_in_a_block_group = df_regions[GEO_ID].notnull()
 
-    for index, row in df_unmapped_geometries.iterrows():
+    # Save region attributes of geometries that were found in a region
+    save_found_values( df_parcels, df_regions, sr_found_in_a_precinct, sr_target_index, list( PRECINCT_COLUMNS.values() ) )
+    save_found_values( df_parcels, df_regions, sr_found_in_a_block_group, sr_target_index, list( BLOCK_GROUP_COLUMNS.values() ) )
 
-        precinct = map_location_to_precinct( row[GEOMETRY], df_precincts )
-        if precinct != None:
-            n_unmapped_found_in_a_precinct += 1
-            parcels_index = df_parcels[ df_parcels[MBLU] == row[MBLU] ].index[0]
-            df_parcels.at[parcels_index, WARD] = precinct[WARD]
-            df_parcels.at[parcels_index, PRECINCT] = precinct[PRECINCT]
+    # If current geometry yielded a new mapping, save lat/long coordinates
+    sr_found = sr_found_in_a_precinct | sr_found_in_a_block_group
+    save_found_values( df_parcels, df_unmapped_geometries, sr_found, sr_target_index, [LAT, LONG] )
+    df_parcels.loc[sr_target_index[sr_found].unique(), GEO] = 'Geometry'
 
-        block_group = map_location_to_block_group( row[GEOMETRY], df_block_groups )
-        if block_group != None:
-            n_unmapped_found_in_a_block_group += 1
-            parcels_index = df_parcels[ df_parcels[MBLU] == row[MBLU] ].index[0]
-            df_parcels.at[parcels_index, GEO_ID] = block_group[GEO_ID]
-            df_parcels.at[parcels_index, TRACT] = block_group[TRACT]
-            df_parcels.at[parcels_index, BLOCK_GROUP] = block_group[BLOCK_GROUP]
-
-        # If current geometry yielded a new mapping, save lat/long coordinates
-        if ( precinct != None ) or ( block_group != None ):
-            df_parcels.at[parcels_index, LAT] = row[LAT]
-            df_parcels.at[parcels_index, LONG] = row[LONG]
-            df_parcels.at[parcels_index, GEO] = 'Geometry'
-
-    print( 'Geometries found in a precinct:', n_unmapped_found_in_a_precinct )
-    print( 'Geometries found in a block group:', n_unmapped_found_in_a_block_group )
+    print( 'Geometries found in a precinct:', sr_found_in_a_precinct.sum() )
+    print( 'Geometries found in a block group:', sr_found_in_a_block_group.sum() )
 
     df_parcels[LAT] = df_parcels[LAT].astype(float).round( decimals=5 )
     df_parcels[LONG] = df_parcels[LONG].astype(float).round( decimals=5 )
@@ -301,24 +199,19 @@ if __name__ == '__main__':
     args = parser.parse_args()
 
     # Read region geometries
-    df_precincts = load_precincts_geometry()
+    df_precincts = geography.load_precincts_geometry( args.wards_filename )
     df_block_groups = load_block_groups_geometry()
 
     # Read parcels table
-    conn, cur, df_parcels = get_parcels_table()
+    conn, cur, engine, df_parcels = get_parcels_table()
 
     # Isolate parcels that have geolocation data
     df_geo = df_parcels.loc[ df_parcels[LAT].notnull() & df_parcels[LONG].notnull() ]
 
-    # Map parcels to precincts
+    # Map parcels to precincts and census block groups
     print( '' )
-    print( 'Mapping {} geolocations to precincts'.format( len( df_geo ) ) )
-    df_parcels = map_locations_to_regions( df_parcels, df_geo, df_precincts, map_location_to_precinct, [WARD, PRECINCT] )
-
-    # Map parcels to census block groups
-    print( '' )
-    print( 'Mapping {} geolocations to census block groups'.format( len( df_geo ) ) )
-    df_parcels = map_locations_to_regions( df_parcels, df_geo, df_block_groups, map_location_to_block_group, [GEO_ID, TRACT, BLOCK_GROUP] )
+    print( 'Mapping {} geolocations to precincts and census block groups'.format( len( df_geo ) ) )
+    df_parcels = map_locations_to_regions( df_parcels, df_geo, df_precincts, df_block_groups )
 
     # Map unmapped parcels using parcel geometry
     df_parcels = map_geometries_to_regions( df_parcels, df_precincts, df_block_groups )
@@ -335,4 +228,7 @@ if __name__ == '__main__':
     # Save parcels table
     util.create_table( 'Parcels_L', conn, cur, df=df_parcels )
 
+    # Save index of parcel addresses for merges against this parcels table
+    util.create_parcel_address_index( conn, cur, engine )
+
     util.report_elapsed_time()
@@ -7,9 +7,7 @@ pd.set_option( 'display.max_columns', 500 )
 pd.set_option( 'display.width', 1000 )
 
 import re
-
-from geopy.geocoders import Nominatim
-from geopy.geocoders import AzureMaps
+import datetime
 
 import os
 
@@ -18,6 +16,8 @@ sys.path.append('../util')
 import util
 import normalize
 import printctl
+import geocode
+import geography
 
 
 ADDR = util.NORMALIZED_ADDRESS
@@ -32,15 +32,22 @@ LAT = util.LATITUDE
 LONG = util.LONGITUDE
 ZIP = util.ZIP
 
-NO_LOCATION = \
-{
-    LAT: None,
-    LONG: None,
-    ZIP: None,
-}
-
 GEO = util.GEO_SERVICE
+ALIAS = util.GEO_ALIAS
+FAILURE = util.GEO_FAILURE
+FAILED_AT = util.GEO_FAILED_AT
+
+
 
+# Labels of geocoding providers, in order of use
+GEO_SERVICES = ['Primary', 'Secondary']
+GEO_GEOMETRY = 'Geometry'
+
+SAVE_INTERVAL = 100
+
+CACHE_TABLE = 'GeoCache_L'
+FAILURES_TABLE = 'GeoCacheFailures_L'
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
 
 
 def load_azure_key():
@@ -48,71 +55,80 @@ def load_azure_key():
         return f.read()
 
 USER_AGENT = 'City of Lawrence, MA - Office of Energy, Environment, and Sustainability - anil.navkal@CityOfLawrence.com'
-GEO_SERVICE_AZURE = AzureMaps( load_azure_key(), user_agent=USER_AGENT )
-GEO_SERVICE_NOMINATIM = Nominatim( user_agent=USER_AGENT )
 
 
 # Validate geolocation based on returned zip code
-def validate_geo( d_addr, street_name ):
-    zip = d_addr['postalCode'] if 'postalCode' in d_addr else d_addr['postcode']
+def validate_zip( zip ):
     valid_zip = zip if zip in util.LAWRENCE_ZIPS else None
     return valid_zip
 
 
-# Geolocate street address
-def geolocate_address( row, geolocator, addressdetails=None ):
+# Format geolocation request for street address
+def format_request( street ):
+    return ', '.join( [street, 'LAWRENCE', 'MA'] ).upper()
 
-    # Initialize input and output
-    street = row[ADDR]
-    return_value = NO_LOCATION
 
-    try:
-        # Attempt geolocation request
-        request = ', '.join( [street, 'LAWRENCE', 'MA'] ).upper()
-        if addressdetails:
-            location = geolocator.geocode( request, addressdetails=addressdetails )
-        else:
-            location = geolocator.geocode( request )
+# Reformat street address to retry after failed geolocation
+def make_retry_street( street ):
 
-        # Validate returned location
-        zip = validate_geo( location.raw['address'], row[STREET_NAME] )
-        if zip:
-            return_value = \
-            {
-                LAT: location.latitude,
-                LONG: location.longitude,
-                ZIP: zip,
-            }
+    retry_street = street
+
+    # Trailing apartment number, e.g. '7 EASTSIDE ST 2' or '202 BROADWAY 2-1' or '11-21 LAWRENCE ST 1'
+    if re.match( r'^\d+(\-\d+)* .+ \d+(\-\d+)*$', street ):
+        retry_street = re.sub( ' \d+(\-\d+)*$', '', street )
+
+    # Trailing apartment letter, e.g. '74 WOODLAND ST A' or '19 STORROW ST 1A'
+    elif re.match( r'^\d+ .+ \d*[A-Z]$', street ):
+        retry_street = re.sub( ' \d*[A-Z]$', '', street )
+
+    # Hyphenated street number, e.g. '22-24 WOODLAND CT' or '17-17A WOODLAND ST' or '5-7-7A STEVENS ST' or '36-36A-36B KENDALL ST'
+    elif re.match( r'^(\d+[A-Z]*)(\-\d+[A-Z]*)+ ', street ):
+        retry_street = re.sub( '^(\d+[A-Z]*)(\-\d+[A-Z]*)+ ', r'\1 ', street )
 
-    except Exception as e:
+    # Street number with trailing letter, e.g. '2A SALEM ST'
+    elif re.match( r'^(\d+)([A-Z]) ', street ):
+        retry_street = re.sub( '^(\d+)([A-Z]) ', r'\1 ', street )
 
-        # Attempt to reformat the address to retry
-        retry_street = street
+    return retry_street
 
-        # Trailing apartment number, e.g. '7 EASTSIDE ST 2' or '202 BROADWAY 2-1' or '11-21 LAWRENCE ST 1'
-        if re.match( r'^\d+(\-\d+)* .+ \d+(\-\d+)*$', street ):
-            retry_street = re.sub( ' \d+(\-\d+)*$', '', street )
 
-        # Trailing apartment letter, e.g. '74 WOODLAND ST A' or '19 STORROW ST 1A'
-        elif re.match( r'^\d+ .+ \d*[A-Z]$', street ):
-            retry_street = re.sub( ' \d*[A-Z]$', '', street )
+# Geolocation cache lookups, including failures and successful retry variants
+class GeoCache:
 
-        # Hyphenated street number, e.g. '22-24 WOODLAND CT' or '17-17A WOODLAND ST' or '5-7-7A STEVENS ST' or '36-36A-36B KENDALL ST'
-        elif re.match( r'^(\d+[A-Z]*)(\-\d+[A-Z]*)+ ', street ):
-            retry_street = re.sub( '^(\d+[A-Z]*)(\-\d+[A-Z]*)+ ', r'\1 ', street )
+    def __init__( self, df_cache, df_failures, ttl_days ):
 
-        # Street number with trailing letter, e.g. '2A SALEM ST'
-        elif re.match( r'^(\d+)([A-Z]) ', street ):
-            retry_street = re.sub( '^(\d+)([A-Z]) ', r'\1 ', street )
+        # Map addresses, and the variants under which they were found, to results
+        self.dc_results = {}
+        for row in df_cache.dropna( subset=[LAT,LONG,ZIP] ).to_dict( 'records' ):
+            result = { LAT: row[LAT], LONG: row[LONG], ZIP: row[ZIP], GEO: row[GEO] }
+            self.dc_results[row[ADDR]] = result
+            if row.get( ALIAS ):
+                self.dc_results.setdefault( row[ALIAS], result )
 
-        # If we have a reformatted address, retry
-        if street != retry_street:
-            print( '   Retry: <{}> -> <{}>'.format( street, retry_street ) )
-            retry_row = row.copy()
-            retry_row[ADDR] = retry_street
-            return_value = geolocate_address( retry_row, geolocator, addressdetails )
+        # Map street addresses and providers to failures that have not expired
+        s_expiry = ( datetime.datetime.now() - datetime.timedelta( days=ttl_days ) ).strftime( TIMESTAMP_FORMAT )
+        self.dc_failures = {}
+        for row in df_failures.to_dict( 'records' ):
+            if row[FAILED_AT] >= s_expiry:
+                self.dc_failures[( row[ADDR], row[GEO] )] = ( row[FAILURE], row[FAILED_AT] )
 
-    return return_value
+    def look_up( self, street ):
+        return self.dc_results.get( street )
+
+    def look_up_failure( self, street, provider ):
+        failure = self.dc_failures.get( ( street, provider ) )
+        return failure[0] if failure else None
+
+    def add_result( self, street, result ):
+        self.dc_results[street] = result
+
+    def add_failure( self, street, provider, reason ):
+        self.dc_failures[( street, provider )] = ( reason, datetime.datetime.now().strftime( TIMESTAMP_FORMAT ) )
+
+    # Return dataframe of unexpired failures
+    def failures( self ):
+        ls_rows = [{ ADDR: street, GEO: provider, FAILURE: reason, FAILED_AT: failed_at } for ( street, provider ), ( reason, failed_at ) in self.dc_failures.items()]
+        return pd.DataFrame( ls_rows, columns=[ADDR,GEO,FAILURE,FAILED_AT] ).sort_values( by=[ADDR,GEO] )
 
 
 def report_unmapped_addresses():
@@ -166,6 +182,11 @@ def save_progress():
 
     global df_cache
 
+    # Add rows found since last save to the cache
+    if ls_cache_rows:
+        df_cache = pd.concat( [df_cache, pd.DataFrame( ls_cache_rows )], ignore_index=True )
+        ls_cache_rows.clear()
+
     # Clear meaningless excess precision
     df_parcels[LAT] = df_parcels[LAT].astype(float).round( decimals=5 )
     df_parcels[LONG] = df_parcels[LONG].astype(float).round( decimals=5 )
@@ -179,7 +200,8 @@ def save_progress():
     # Save parcels table and cache
     printctl.off()
     util.create_table( 'GeoParcels_L', conn_parcels, cur_parcels, df=df_parcels )
-    util.create_table( 'GeoCache_L', conn_cache, cur_cache, df=df_cache )
+    util.create_table( CACHE_TABLE, conn_cache, cur_cache, df=df_cache )
+    util.create_table( FAILURES_TABLE, conn_cache, cur_cache, df=geo_cache.failures() )
     printctl.on()
 
     # Report current status
@@ -193,8 +215,27 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser( description='Find geolocation coordinates of Lawrence parcel addresses' )
     parser.add_argument( '-p', dest='parcels_filename',  help='Parcels database filename', required=True )
     parser.add_argument( '-g', dest='geo_cache_filename',  help='Geolocation cache filename', required=True )
+    parser.add_argument( '-a', dest='azure_url',  help='URL of stand-in for Azure Maps service, such as http://localhost:8766' )
+    parser.add_argument( '-n', dest='nominatim_url',  help='URL of stand-in for Nominatim service, such as http://localhost:8766' )
+    parser.add_argument( '-t', dest='failure_ttl', type=float, default=30, help='Days after which failed geolocations are retried' )
+    parser.add_argument( '-s', dest='parcels_shapefile',  help='Name of shapefile containing Lawrence parcel geometry; parcels found in it are geolocated at their centroids' )
+    parser.add_argument( '-z', dest='zip_codes_shapefile',  help='Name of shapefile containing Lawrence ZIP Codes geometry; required with -s' )
+    parser.add_argument( '-o', dest='offline', action='store_true', help='Skip online geocoding of parcels not found otherwise?' )
     args = parser.parse_args()
 
+    if args.parcels_shapefile and not args.zip_codes_shapefile:
+        parser.error( 'ZIP Codes shapefile (-z) is required with parcel shapefile (-s)' )
+
+    # Prepare geocoding providers, in order of use
+    if args.offline:
+        ls_providers = []
+    else:
+        ls_providers = \
+        [
+            geocode.AzureMaps( '' if args.azure_url else load_azure_key(), url=( args.azure_url or geocode.AZURE_URL ) ),
+            geocode.Nominatim( url=( args.nominatim_url or geocode.NOMINATIM_URL ) ),
+        ]
+
     # Read parcels data
     conn_parcels, cur_parcels, engine_parcels = util.open_database( args.parcels_filename, False )
     df_parcels = pd.read_sql_table( 'PublishedParcels_L', engine_parcels, index_col=util.ID, parse_dates=True )
@@ -202,20 +243,38 @@ if __name__ == '__main__':
     # Read geolocation data
     conn_cache, cur_cache, engine_cache = util.open_database( args.geo_cache_filename, False )
     try:
-        df_cache = pd.read_sql_table( 'GeoCache_L', engine_cache, index_col=util.ID )
+        df_cache = pd.read_sql_table( CACHE_TABLE, engine_cache, index_col=util.ID )
     except:
         df_cache = pd.DataFrame( columns=[ADDR,LAT,LONG,ZIP,GEO] )
+    if ALIAS not in df_cache.columns:
+        df_cache[ALIAS] = ''
+    df_cache[ALIAS] = df_cache[ALIAS].fillna( '' )
+
+    try:
+        df_failures = pd.read_sql_table( FAILURES_TABLE, engine_cache, index_col=util.ID )
+    except:
+        df_failures = pd.DataFrame( columns=[ADDR,GEO,FAILURE,FAILED_AT] )
+
+    geo_cache = GeoCache( df_cache, df_failures, args.failure_ttl )
 
     # Normalize parcel addresses
     df_parcels[ADDR] = df_parcels[LOCN]
-    df_parcels[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = df_parcels.apply( lambda row: normalize.normalize_address( row, ADDR, city='LAWRENCE', return_parts=True ), axis=1, result_type='expand' )
+    df_parcels[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = normalize.normalize_addresses( df_parcels[ADDR], city='LAWRENCE' )
 
 
     # Enhance normalization results by applying information found in MBLU
     df_parcels = enhance_normalization_results( df_parcels )
 
     # Merge parcels with coordinates from geolocation cache
-    df_parcels = pd.merge( df_parcels, df_cache, how='left', on=[ADDR] )
+    df_parcels = pd.merge( df_parcels, df_cache[[ADDR,LAT,LONG,ZIP,GEO]], how='left', on=[ADDR] )
+
+    # Geolocate parcels found in parcel geometry at their centroids, in preference to geocoded addresses
+    if args.parcels_shapefile:
+        df_located = geography.locate_parcels_by_geometry( df_parcels, args.parcels_shapefile, args.zip_codes_shapefile )
+        df_parcels.loc[df_located.index, [LAT,LONG,ZIP]] = df_located[[LAT,LONG,ZIP]]
+        df_parcels.loc[df_located.index, GEO] = GEO_GEOMETRY
+        print( '' )
+        print( 'Parcels geolocated by geometry: {}'.format( len( df_located ) ) )
 
     # Select rows with null coordinates and addresses that begin with digits
     df_need_geo = df_parcels.loc[ ( df_parcels[LAT].isnull() | df_parcels[LONG].isnull() | df_parcels[ZIP].isnull() ) & df_parcels[ADDR].str[0].str.isdigit() ]
@@ -224,48 +283,52 @@ if __name__ == '__main__':
 
     n_found = 0
     n_failed = 0
+    n_last_saved = 0
 
-    # Process rows that need geolocation
-    for index, row in df_need_geo.iterrows():
+    # Collect new cache rows, to be added to the cache when progress is saved
+    ls_cache_rows = []
 
-        # Call default geolocator with current address
-        geo_service = 'Primary'
-        geoloc = geolocate_address( row, GEO_SERVICE_AZURE )
+    # Geolocate each distinct address once, applying the result to all rows that share it
+    dc_need_geo = {} if args.offline else df_need_geo.groupby( by=[ADDR] ).groups
 
-        # If first geolocator failed, try again with alternate geolocator
-        if geoloc == NO_LOCATION:
-            geo_service = 'Secondary'
-            geoloc = geolocate_address( row, GEO_SERVICE_NOMINATIM, addressdetails=True )
+    for address, geoloc, i_provider, street in geocode.geocode_addresses( list( dc_need_geo ), ls_providers, USER_AGENT, format_request, validate_zip, make_retry_street, cache=geo_cache ):
 
         # Save non-empty results
-        if geoloc != NO_LOCATION:
+        if geoloc:
+
+            geo_service = geoloc[GEO] if i_provider is None else GEO_SERVICES[i_provider]
 
             # Save result in parcels table
-            df_parcels.at[index, LAT] = geoloc[LAT]
-            df_parcels.at[index, LONG] = geoloc[LONG]
-            df_parcels.at[index, ZIP] = geoloc[ZIP]
-            df_parcels.at[index, GEO] = geo_service
+            index = dc_need_geo[address]
+            df_parcels.loc[index, LAT] = geoloc[LAT]
+            df_parcels.loc[index, LONG] = geoloc[LONG]
+            df_parcels.loc[index, ZIP] = geoloc[ZIP]
+            df_parcels.loc[index, GEO] = geo_service
 
-            # Save result in cache
+            # Save result in cache, noting the retry variant, if any, under which it was found
             cache_row = \
             {
-                ADDR: row[ADDR],
+                ADDR: address,
                 LAT: geoloc[LAT],
                 LONG: geoloc[LONG],
                 ZIP: geoloc[ZIP],
                 GEO: geo_service,
+                ALIAS: street if street != address else '',
             }
-            df_cache = df_cache.append( cache_row, ignore_index=True )
+            ls_cache_rows.append( cache_row )
+            geo_cache.add_result( address, cache_row )
+            geo_cache.add_result( street, cache_row )
 
             n_found += 1
-            print( '  (+{},-{}) <{}> Found: ({},{},{},{})'.format( n_found, n_failed, row[ADDR], geoloc[LAT], geoloc[LONG], geoloc[ZIP], geo_service ) )
+            print( '  (+{},-{}) <{}> Found: ({},{},{},{})'.format( n_found, n_failed, address, geoloc[LAT], geoloc[LONG], geoloc[ZIP], geo_service ) )
 
         else:
             n_failed += 1
-            print( '  (+{},-{}) <{}> Error'.format( n_found, n_failed, row[ADDR] ) )
+            print( '  (+{},-{}) <{}> Error'.format( n_found, n_failed, address ) )
 
         # Save intermediate result
-        if ( n_found + 1 ) % 20 == 0:
+        if n_found - n_last_saved >= SAVE_INTERVAL:
+            n_last_saved = n_found
             save_progress()
 
     # Save final result
@@ -32,12 +32,12 @@ if __name__ == '__main__':
     # Retrieve GLCAC jobs table from database
     df_jobs = pd.read_sql_table( 'RawGlcacJobs', engine, index_col=util.ID, parse_dates=True )
 
-    # Normalize addresses.  Use result_type='expand' to load multiple columns!
+    # Normalize addresses
     df_jobs[ADDR] = df_jobs[util.ADDRESS].str.strip()
     df_jobs[ADDR] = df_jobs[ADDR].str.upper()
     df_jobs[ADDR] = df_jobs[ADDR].str.split( ' MA ', expand=True )[0]
     df_jobs[ADDR] = df_jobs[ADDR].str.rsplit( n=1, expand=True )[0]
-    df_jobs[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = df_jobs.apply( lambda row: normalize.normalize_address( row, ADDR, city='LAWRENCE', return_parts=True ), axis=1, result_type='expand' )
+    df_jobs[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = normalize.normalize_addresses( df_jobs[ADDR], city='LAWRENCE' )
 
     # Merge jobs dataframe with assessment data
     table_name = 'GlcacJobs_L'
@@ -6,20 +6,15 @@ import pandas as pd
 pd.set_option( 'display.max_columns', 500 )
 pd.set_option( 'display.width', 1000 )
 
-import simplekml
 import numpy as np
 
-import xml.etree.ElementTree as ET
-import uuid
-
 import os
+import multiprocessing
 
 import sys
 sys.path.append( '../util' )
 import util
-
-
-KML_NAMESPACE = util.KML_NAMESPACE
+import kml_writer
 
 
 # Nicknames
@@ -36,7 +31,6 @@ HEAT_MAP_PREFIX = 'heat_map_prefix'
 HEAT_MAP_UNIT = 'heat_map_unit'
 HEAT_MAP_VISIBILITY = 'heat_map_visibility'
 HEAT_MAP_VALUE = 'heat_map_value'
-SPECTRUM_INDEX = 'spectrum_index'
 
 
 # Generate a color spectrumm represented as a list of RGB tuples
@@ -56,6 +50,7 @@ SPECTRUM_GRAY = [200, 200, 200]
 SPECTRUM_BLUE = [0, 50, 255]
 SPECTRUM_LEN = 256
 HEAT_MAP_SPECTRUM = make_spectrum( SPECTRUM_GRAY, SPECTRUM_BLUE, SPECTRUM_LEN )
+HEAT_MAP_ALPHA = 150
 
 # Heat map names
 HEALTH = 'health'
@@ -76,7 +71,10 @@ RES_PARCELS_NWX = 'res_parcels_nwx'
 RES_PARCELS_WX = 'res_parcels_wx'
 RES_PARCELS_WX_PCT = 'res_parcels_wx_pct'
 
-XML = 'xml'
+# Totals of residential parcels, used to calculate weatherization rates
+RES_HOUSEHOLDS = 'res_households'
+RES_PARCELS = 'res_parcels'
+
 KML = 'kml'
 
 
@@ -254,248 +252,82 @@ DC_FOLDERS = \
 }
 
 
-# --------------------------------------------
-# --> Functions to compute heat map values -->
-# --------------------------------------------
-
-class Compute:
-
-
-    def households( df_res_parcels, df_stats, df_block_groups, s_name ):
-        return make_heat_map_from_stats( df_stats, df_block_groups, s_name )
-
-
-    def households_elec_oil( df_res_parcels, df_stats, df_block_groups, s_name ):
-
-        # Add column of heat map values to block groups dataframe
-        for idx, row in df_block_groups.copy().iterrows():
-
-            # Find residential parcels in current block group
-            df_cbg_res = df_res_parcels[df_res_parcels[TRACT_DASH_GROUP] == row[TRACT_DASH_GROUP]]
-
-            # Isolate residential parcels with either electric or oil heat
-            df_cbg_elec_oil = df_cbg_res[ df_cbg_res[FUEL].isin( [ELEC, OIL] ) ]
-
-            # Count households in current block group with electric or oil heat
-            n_households = df_cbg_elec_oil[OCC].sum()
-            df_block_groups.at[idx, HEAT_MAP_VALUE] = n_households
-
-        df_block_groups[HEAT_MAP_VALUE] = df_block_groups[HEAT_MAP_VALUE].astype( int )
-        df_block_groups[s_name] = df_block_groups[HEAT_MAP_VALUE]
-
-        return df_block_groups
-
-
-    def households_elec_oil_nwx( df_res_parcels, df_stats, df_block_groups, s_name ):
-
-        # Add column of heat map values to block groups dataframe
-        for idx, row in df_block_groups.copy().iterrows():
-
-            # Find residential parcels in current block group
-            df_cbg_res = df_res_parcels[df_res_parcels[TRACT_DASH_GROUP] == row[TRACT_DASH_GROUP]]
-
-            # Isolate residential parcels with either electric or oil heat
-            df_cbg_elec_oil = df_cbg_res[ df_cbg_res[FUEL].isin( [ELEC, OIL] ) ]
-
-            # Find which electric and oil parcels are not weatherized
-            df_cbg_elec_oil_nwx = df_cbg_elec_oil[ df_cbg_elec_oil[WX_PERMIT].isnull() ]
-
-            # Count households in current block group with electric or oil heat and no weatherization
-            n_households = df_cbg_elec_oil_nwx[OCC].sum()
-            df_block_groups.at[idx, HEAT_MAP_VALUE] = n_households
-
-        df_block_groups[HEAT_MAP_VALUE] = df_block_groups[HEAT_MAP_VALUE].astype( int )
-        df_block_groups[s_name] = df_block_groups[HEAT_MAP_VALUE]
-
-        return df_block_groups
-
-
-    def households_elec_oil_wx( df_res_parcels, df_stats, df_block_groups, s_name ):
-
-        # Add column of heat map values to block groups dataframe
-        for idx, row in df_block_groups.copy().iterrows():
-
-            # Find residential parcels in current block group
-            df_cbg_res = df_res_parcels[df_res_parcels[TRACT_DASH_GROUP] == row[TRACT_DASH_GROUP]]
-
-            # Isolate residential parcels with either electric or oil heat
-            df_cbg_elec_oil = df_cbg_res[ df_cbg_res[FUEL].isin( [ELEC, OIL] ) ]
-
-            # Find which electric and oil parcels are weatherized
-            df_cbg_elec_oil_wx = df_cbg_elec_oil[ ~df_cbg_elec_oil[WX_PERMIT].isnull() ]
-
-            # Count households in current block group with electric or oil heat and weatherization
-            n_households = df_cbg_elec_oil_wx[OCC].sum()
-            df_block_groups.at[idx, HEAT_MAP_VALUE] = n_households
-
-        df_block_groups[HEAT_MAP_VALUE] = df_block_groups[HEAT_MAP_VALUE].astype( int )
-        df_block_groups[s_name] = df_block_groups[HEAT_MAP_VALUE]
-
-        return df_block_groups
-
-
-    def households_median_income( df_res_parcels, df_stats, df_block_groups, s_name ):
-        return make_heat_map_from_stats( df_stats, df_block_groups, s_name )
-
-
-    def households_nwx( df_res_parcels, df_stats, df_block_groups, s_name ):
-
-        # Add column of heat map values to block groups dataframe
-        for idx, row in df_block_groups.copy().iterrows():
-
-            # Find residential parcels in current block group
-            df_cbg_res = df_res_parcels[df_res_parcels[TRACT_DASH_GROUP] == row[TRACT_DASH_GROUP]]
-
-            # Find which residential parcels are not weatherized
-            df_cbg_nwx = df_cbg_res[ df_cbg_res[WX_PERMIT].isnull() ]
-
-            # Count households that are not weatherized
-            n_nwx = df_cbg_nwx[OCC].sum()
-            df_block_groups.at[idx, HEAT_MAP_VALUE] = n_nwx
-
-        df_block_groups[HEAT_MAP_VALUE] = df_block_groups[HEAT_MAP_VALUE].astype( int )
-        df_block_groups[s_name] = df_block_groups[HEAT_MAP_VALUE]
-
-        return df_block_groups
-
-
-    def households_wx( df_res_parcels, df_stats, df_block_groups, s_name ):
-
-        # Add column of heat map values to block groups dataframe
-        for idx, row in df_block_groups.copy().iterrows():
-
-            # Find residential parcels in current block group
-            df_cbg_res = df_res_parcels[df_res_parcels[TRACT_DASH_GROUP] == row[TRACT_DASH_GROUP]]
-
-            # Find which residential parcels are weatherized
-            df_cbg_wx = df_cbg_res[ ~df_cbg_res[WX_PERMIT].isnull() ]
-
-            # Count households that are weatherized
-            n_wx = df_cbg_wx[OCC].sum()
-            df_block_groups.at[idx, HEAT_MAP_VALUE] = n_wx
-
-        df_block_groups[HEAT_MAP_VALUE] = df_block_groups[HEAT_MAP_VALUE].astype( int )
-        df_block_groups[s_name] = df_block_groups[HEAT_MAP_VALUE]
-
-        return df_block_groups
-
-
-    def households_poverty( df_res_parcels, df_stats, df_block_groups, s_name ):
-        return make_heat_map_from_stats( df_stats, df_block_groups, s_name )
-
-
-    def households_poverty_pct( df_res_parcels, df_stats, df_block_groups, s_name ):
-        return make_heat_map_from_stats( df_stats, df_block_groups, s_name )
-
-
-    def households_wx_pct( df_res_parcels, df_stats, df_block_groups, s_name ):
-
-        # Add column of heat map values to block groups dataframe
-        for idx, row in df_block_groups.copy().iterrows():
-
-            # Find residential parcels in current block group
-            df_cbg_res = df_res_parcels[df_res_parcels[TRACT_DASH_GROUP] == row[TRACT_DASH_GROUP]]
-
-            # Find which residential parcels are weatherized
-            df_cbg_wx = df_cbg_res[ ~df_cbg_res[WX_PERMIT].isnull() ]
-
-            # Calculate weatherization rate for current block group
-            n_wx = df_cbg_wx[OCC].sum()
-            n_res = df_cbg_res[OCC].sum()
-            df_block_groups.at[idx, HEAT_MAP_VALUE] = ( 100 * n_wx / n_res ) if n_res != 0 else 0
+TREE_LABEL = 'tree_label'
+TREE_CONTENTS = 'tree_contents'
 
-        df_block_groups[HEAT_MAP_VALUE] = df_block_groups[HEAT_MAP_VALUE].astype( int )
-        df_block_groups[s_name] = df_block_groups[HEAT_MAP_VALUE]
-
-        return df_block_groups
-
-    def population( df_res_parcels, df_stats, df_block_groups, s_name ):
-        return make_heat_map_from_stats( df_stats, df_block_groups, s_name )
-
-
-    def health_risk_score( df_res_parcels, df_stats, df_block_groups, s_name ):
-        return make_heat_map_from_stats( df_stats, df_block_groups, s_name )
-
-
-    def population_poverty( df_res_parcels, df_stats, df_block_groups, s_name ):
-        return make_heat_map_from_stats( df_stats, df_block_groups, s_name )
-
-
-    def res_parcels_nwx( df_res_parcels, df_stats, df_block_groups, s_name ):
-
-        # Add column of heat map values to block groups dataframe
-        for idx, row in df_block_groups.copy().iterrows():
-
-            # Find residential parcels in current block group
-            df_cbg_res = df_res_parcels[df_res_parcels[TRACT_DASH_GROUP] == row[TRACT_DASH_GROUP]]
-
-            # Find which residential parcels are weatherized
-            df_cbg_nwx = df_cbg_res[ df_cbg_res[WX_PERMIT].isnull() ]
-
-            # Count weatherized residential parcels for current block group
-            n_nwx = len( df_cbg_nwx )
-            df_block_groups.at[idx, HEAT_MAP_VALUE] = n_nwx
-
-        df_block_groups[HEAT_MAP_VALUE] = df_block_groups[HEAT_MAP_VALUE].astype( int )
-        df_block_groups[s_name] = df_block_groups[HEAT_MAP_VALUE]
-
-        return df_block_groups
-
-
-    def res_parcels_wx( df_res_parcels, df_stats, df_block_groups, s_name ):
-
-        # Add column of heat map values to block groups dataframe
-        for idx, row in df_block_groups.copy().iterrows():
-
-            # Find residential parcels in current block group
-            df_cbg_res = df_res_parcels[df_res_parcels[TRACT_DASH_GROUP] == row[TRACT_DASH_GROUP]]
-
-            # Find which residential parcels are weatherized
-            df_cbg_wx = df_cbg_res[ ~df_cbg_res[WX_PERMIT].isnull() ]
-
-            # Count weatherized residential parcels for current block group
-            n_wx = len( df_cbg_wx )
-            df_block_groups.at[idx, HEAT_MAP_VALUE] = n_wx
-
-        df_block_groups[HEAT_MAP_VALUE] = df_block_groups[HEAT_MAP_VALUE].astype( int )
-        df_block_groups[s_name] = df_block_groups[HEAT_MAP_VALUE]
-
-        return df_block_groups
-
-
-    def res_parcels_wx_pct( df_res_parcels, df_stats, df_block_groups, s_name ):
-
-        # Add column of heat map values to block groups dataframe
-        for idx, row in df_block_groups.copy().iterrows():
-
-            # Find residential parcels in current block group
-            df_cbg_res = df_res_parcels[df_res_parcels[TRACT_DASH_GROUP] == row[TRACT_DASH_GROUP]]
-
-            # Find which residential parcels are weatherized
-            df_cbg_wx = df_cbg_res[ ~df_cbg_res[WX_PERMIT].isnull() ]
-
-            # Calculate weatherization rate for current block group
-            n_wx = len( df_cbg_wx )
-            n_res = len( df_cbg_res )
-            df_block_groups.at[idx, HEAT_MAP_VALUE] = ( 100 * n_wx / n_res ) if n_res != 0 else 0
-
-        df_block_groups[HEAT_MAP_VALUE] = df_block_groups[HEAT_MAP_VALUE].astype( int )
-        df_block_groups[s_name] = df_block_groups[HEAT_MAP_VALUE]
-
-        return df_block_groups
+# Dictionary of trees for grouping folders, each saved in its own file
+DC_TREES = \
+{
+    'demographics_tree': \
+    {
+        TREE_LABEL: 'Demographics',
+        TREE_CONTENTS: [POPULATION_FOLDER, HOUSEHOLDS_FOLDER, HEALTH_FOLDER],
+    },
+    'heating_fuel_tree': \
+    {
+        TREE_LABEL: 'Heating Fuel',
+        TREE_CONTENTS: [HEATING_FUEL_FOLDER],
+    },
+    'weatherization_tree': \
+    {
+        TREE_LABEL: 'Weatherization',
+        TREE_CONTENTS: [WX_HOUSEHOLDS_FOLDER, WX_PARCELS_FOLDER],
+    },
+}
 
 
-def make_heat_map_from_stats( df_stats, df_block_groups, s_name ):
+# --------------------------------------------
+# --> Functions to compute heat map values -->
+# --------------------------------------------
 
-    # Add column of heat map values to block groups dataframe
-    for idx, row in df_block_groups.copy().iterrows():
+# Count households and residential parcels in each block group, all heat maps at once
+# - Returns dataframe indexed by block group label, with one column per heat map
+def compute_parcel_values( df_res_parcels ):
+
+    # Build masks of residential parcels by heating fuel and weatherization
+    sr_elec_oil = df_res_parcels[FUEL].isin( [ELEC, OIL] )
+    sr_wx = df_res_parcels[WX_PERMIT].notnull()
+    sr_occ = df_res_parcels[OCC]
+
+    # Sum households and parcels under each combination of conditions, in one pass over the parcels
+    df_sums = pd.DataFrame(
+        {
+            HOUSEHOLDS_ELEC_OIL: sr_occ.where( sr_elec_oil ),
+            HOUSEHOLDS_ELEC_OIL_NWX: sr_occ.where( sr_elec_oil & ~sr_wx ),
+            HOUSEHOLDS_ELEC_OIL_WX: sr_occ.where( sr_elec_oil & sr_wx ),
+            HOUSEHOLDS_NWX: sr_occ.where( ~sr_wx ),
+            HOUSEHOLDS_WX: sr_occ.where( sr_wx ),
+            RES_HOUSEHOLDS: sr_occ,
+            RES_PARCELS_NWX: ~sr_wx,
+            RES_PARCELS_WX: sr_wx,
+            RES_PARCELS: True,
+        },
+        index=df_res_parcels.index
+    )
+    df_sums = df_sums.groupby( df_res_parcels[TRACT_DASH_GROUP] ).sum()
+
+    # Calculate weatherization rates
+    df_sums[HOUSEHOLDS_WX_PCT] = ( 100 * df_sums[HOUSEHOLDS_WX] / df_sums[RES_HOUSEHOLDS] ).where( df_sums[RES_HOUSEHOLDS] != 0, 0 )
+    df_sums[RES_PARCELS_WX_PCT] = ( 100 * df_sums[RES_PARCELS_WX] / df_sums[RES_PARCELS] ).where( df_sums[RES_PARCELS] != 0, 0 )
+    df_sums = df_sums.drop( columns=[RES_HOUSEHOLDS, RES_PARCELS] )
+
+    return df_sums
+
+
+# Add column of values to block groups dataframe for each heat map
+# - Values counted from residential parcels are matched by block group label; values copied from census statistics, by geographic ID
+def compute_heat_map_values( df_res_parcels, df_stats, df_block_groups ):
+
+    df_parcel_values = compute_parcel_values( df_res_parcels )
+    df_stats = df_stats.set_index( GEOID )
 
-        # Copy value from census stats
-        sr_geoid = df_stats[df_stats[GEOID] == row[GEOID]]
-        df_block_groups.at[idx, HEAT_MAP_VALUE] = sr_geoid[s_name]
+    for s_name in DC_HEAT_MAPS:
+        if s_name in df_parcel_values.columns:
+            sr_values = df_block_groups[TRACT_DASH_GROUP].map( df_parcel_values[s_name] ).fillna( 0 )
+        else:
+            sr_values = df_block_groups[GEOID].map( df_stats[s_name] )
 
-    df_block_groups[HEAT_MAP_VALUE] = df_block_groups[HEAT_MAP_VALUE].astype( int )
-    df_block_groups[s_name] = df_block_groups[HEAT_MAP_VALUE]
+        df_block_groups[s_name] = sr_values.astype( int )
 
     return df_block_groups
 
@@ -565,42 +397,31 @@ def get_res_parcels( engine ):
     return df_res_parcels
 
 
-# Generate heat map styles
-def make_heat_map_styles( df_block_groups, kml, dc_heat_map_attrs ):
-
-    s_label = dc_heat_map_attrs[HEAT_MAP_LABEL]
+# Generate heat map styles, one for each block group
+def make_heat_map_styles( df_block_groups, s_name ):
 
-    # Add spectrum index column to block groups dataframe
+    # Find position of each heat map value in the color spectrum
     f_min_rate = df_block_groups[HEAT_MAP_VALUE].min()
     f_max_rate = df_block_groups[HEAT_MAP_VALUE].max()
     f_normalized_rate = f_max_rate - f_min_rate
 
-    for idx, row in df_block_groups.copy().iterrows():
-        df_block_groups.at[idx, SPECTRUM_INDEX] = ( len( HEAT_MAP_SPECTRUM ) - 1 ) * ( row[HEAT_MAP_VALUE] - f_min_rate ) / f_normalized_rate
-    df_block_groups[SPECTRUM_INDEX] = df_block_groups[SPECTRUM_INDEX].astype( int )
+    sr_spectrum_index = ( ( len( HEAT_MAP_SPECTRUM ) - 1 ) * ( df_block_groups[HEAT_MAP_VALUE] - f_min_rate ) / f_normalized_rate ).astype( int )
 
-    # Populate dictionary of block group styles
+    # Populate dictionary of block group styles, with IDs unique across heat maps
     dc_heat_map_styles = {}
-    doc = kml.newdocument( name=s_label )
-    doc.visibility = dc_heat_map_attrs[HEAT_MAP_VISIBILITY]
+    s_line_color = kml_writer.format_color( 255, 255, 255 )
 
-    for idx, row in df_block_groups.iterrows():
-        cbg_style = simplekml.Style()
-        cbg_style.linestyle.color = simplekml.Color.white
-        cbg_style.linestyle.width = 4
-        cbg_style.polystyle.fill = 1
-        rgb = HEAT_MAP_SPECTRUM[row[SPECTRUM_INDEX]]
-        cbg_style.polystyle.color = simplekml.Color.changealphaint( 150, simplekml.Color.rgb( *rgb ))
+    for s_block_group, spectrum_index in zip( df_block_groups[TRACT_DASH_GROUP], sr_spectrum_index ):
+        s_style_id = f'{s_name}_{s_block_group}'
+        s_poly_color = kml_writer.format_color( *HEAT_MAP_SPECTRUM[spectrum_index], alpha=HEAT_MAP_ALPHA )
+        dc_heat_map_styles[s_block_group] = ( s_style_id, kml_writer.format_polygon_style( s_style_id, s_line_color, 4, s_poly_color ) )
 
-        # Save style in document and dictionary
-        doc.styles.append( cbg_style )
-        dc_heat_map_styles[row[TRACT_DASH_GROUP]] = cbg_style
-
-    return doc, dc_heat_map_styles
+    return dc_heat_map_styles
 
 
 # Generate KML heat map of data partitioned by census block groups
-def make_heat_map_kml_file( kml, doc, df_block_groups, dc_heat_map_attrs, dc_heat_map_styles, output_directory, s_name ):
+# - Returns location of the heat map document in the file, to be copied into folders
+def make_heat_map_kml_file( df_block_groups, dc_heat_map_attrs, dc_heat_map_styles, output_directory, s_name ):
 
     s_prefix = dc_heat_map_attrs[HEAT_MAP_PREFIX]
     s_unit = dc_heat_map_attrs[HEAT_MAP_UNIT]
@@ -613,138 +434,108 @@ def make_heat_map_kml_file( kml, doc, df_block_groups, dc_heat_map_attrs, dc_hea
     s_max = f'{s_prefix}{n_max:,}{s_unit}'
     s_to = ' to '
     s_range = f': Range {s_min}{s_to}{s_max}'
-    doc.name += s_range
-
-    # Generate polygon for each census block group
-    for idx, row in df_block_groups.iterrows():
-        s_block_group = row[TRACT_DASH_GROUP]
-        n_value = row[HEAT_MAP_VALUE]
-        s_value = f'{s_prefix}{n_value:,}{s_unit}'
-        poly = doc.newpolygon( name=f'CBG {s_block_group}: {s_value}' )
-        poly.outerboundaryis = list( row[util.GEOMETRY].exterior.coords )
-        poly.description = f'<p>Geographic ID: {row[GEOID]}</p><p>{s_label}: {s_value}</p>'
-        poly.style = dc_heat_map_styles[s_block_group]
-
-    # Save the KML file
+
     print( f'Saving heat map "{s_label}"' )
-    kml.save( os.path.join( output_directory, 'maps', f'{s_name}.kml' ) )
 
-    return kml
+    with kml_writer.KmlWriter( os.path.join( output_directory, 'maps', f'{s_name}.kml' ) ) as writer:
 
+        writer.start( 'Document' )
+        offset = writer.start_fragment()
+        writer.start( 'Document', s_name=s_label + s_range, s_visibility=dc_heat_map_attrs[HEAT_MAP_VISIBILITY] )
 
-# Replace simplekml-generated integer IDs with unique IDs
-def replace_ids_with_uuids( kml, output_directory, s_name ):
+        for s_style_id, s_style in dc_heat_map_styles.values():
+            writer.write( s_style )
 
-    # Get XML string from Kml object
-    s_kml = kml.kml()
+        # Generate polygon for each census block group
+        for s_block_group, n_value, s_geoid, geometry in zip( df_block_groups[TRACT_DASH_GROUP], df_block_groups[HEAT_MAP_VALUE], df_block_groups[GEOID], df_block_groups[util.GEOMETRY] ):
+            s_value = f'{s_prefix}{n_value:,}{s_unit}'
+            s_description = f'<p>Geographic ID: {s_geoid}</p><p>{s_label}: {s_value}</p>'
+            writer.write( kml_writer.format_polygon_placemark( f'CBG {s_block_group}: {s_value}', s_description, dc_heat_map_styles[s_block_group][0], geometry.exterior.coords ) )
 
-    # Parse XML
-    root = ET.fromstring( s_kml )
+        writer.end()
+        fragment = writer.end_fragment( offset )
 
-    # Set the KML namespace
-    ET.register_namespace( '', KML_NAMESPACE )
+    return fragment
 
-    # Replace simplekml ID with UUID and save mappings in dictionary
-    dc_id_uuid = {}
-    for elem in root.iter():
-        elem_id = elem.get( 'id' )
-        if elem_id:
-            new_id = str( uuid.uuid4() )
-            dc_id_uuid[elem_id] = new_id
-            elem.set( 'id', new_id )
 
-    # Replace references to old IDs
-    for elem in root.iter():
-        if elem.text and elem.text.startswith( '#' ):
-            ref_id = elem.text[1:]
-            if ref_id in dc_id_uuid:
-                elem.text = '#' + dc_id_uuid[ref_id]
+# Generate one heat map from block groups with its values
+def make_heat_map( s_name, df_block_groups, output_directory ):
 
-    # Return revised KML
-    xml = ET.ElementTree( root )
+    df_block_groups = df_block_groups.rename( columns={ s_name: HEAT_MAP_VALUE } )
 
-    return xml
+    # Generate heat map styles
+    dc_heat_map_styles = make_heat_map_styles( df_block_groups, s_name )
 
+    # Generate KML heat map file
+    return make_heat_map_kml_file( df_block_groups, DC_HEAT_MAPS[s_name], dc_heat_map_styles, output_directory, s_name )
 
-# Combine heat maps under a parent folder
-def combine_heat_maps( s_folder, output_directory=None ):
 
-    namespace = KML_NAMESPACE
-    ET.register_namespace( '', namespace )
+# Generate heat maps from computed values, optionally in a pool of worker processes
+def make_heat_maps( df_block_groups, output_directory, n_processes=1 ):
 
-    # Create new KML root
-    schema = f'{{{namespace}}}'
-    root = ET.Element( f'{schema}kml' )
-    doc = ET.SubElement( root, f'{schema}Document' )
+    # Give each heat map only the columns it needs
+    ls_args = [( s_name, df_block_groups[[GEOID, TRACT_DASH_GROUP, util.GEOMETRY, s_name]], output_directory ) for s_name in DC_HEAT_MAPS]
 
-    # Get folder attributes
-    dc_folder = DC_FOLDERS[s_folder]
+    if ( n_processes or 1 ) > 1:
+        with multiprocessing.Pool( n_processes ) as pool:
+            ls_fragments = pool.starmap( make_heat_map, ls_args )
+    else:
+        ls_fragments = [make_heat_map( *args ) for args in ls_args]
 
-    # Create parent folder that will contain all heat maps
-    parent_folder = ET.SubElement( doc, f'{schema}Folder' )
-    ET.SubElement( parent_folder, f'{schema}name' ).text = dc_folder[FOLDER_LABEL]
+    # Save locations of heat maps, in order of the DC_HEAT_MAPS table
+    for s_name, fragment in zip( DC_HEAT_MAPS, ls_fragments ):
+        DC_HEAT_MAPS[s_name][KML] = fragment
 
-    # Iterate through saved heat maps
+
+# Write KML folder of heat maps, copied from map files
+def write_heat_maps_folder( writer, s_folder ):
+
+    dc_folder = DC_FOLDERS[s_folder]
+
+    writer.start( 'Folder', s_name=dc_folder[FOLDER_LABEL] )
     for s_heat_map in dc_folder[FOLDER_CONTENTS]:
+        writer.copy( DC_HEAT_MAPS[s_heat_map][KML] )
+    writer.end()
 
-        # Start with root of saved heat map
-        kml = DC_HEAT_MAPS[s_heat_map][KML]
 
-        # -> Commented out -> not needed ->
-        #
-        # Replace simplekml-generated integer IDs with unique IDs and save as tree
-        # xml = replace_ids_with_uuids( kml, args.output_directory, s_name )
-        #
-        # <- Commented out <- not needed <-
-        #
-        # -> Instead, do this ->
-        #
-        xml = ET.ElementTree( ET.fromstring( kml.kml() ) )
-        #
-        # <- Instead, do this <-
+# Combine heat maps under a parent folder
+def combine_heat_maps( s_folder, output_directory ):
+
+    print( f'Saving folder "{DC_FOLDERS[s_folder][FOLDER_LABEL]}"' )
 
-        xml_root = xml.getroot()
+    with kml_writer.KmlWriter( os.path.join( output_directory, 'folders', f'{s_folder}.kml' ) ) as writer:
+        writer.start( 'Document' )
+        write_heat_maps_folder( writer, s_folder )
 
-        # Find <Document> element of the source
-        src_doc = xml_root.find( f'{schema}Document' )
 
-        # Append all children of the source KML to the parent folder
-        for child in list( src_doc ):
-            parent_folder.append( util.replicate_kml_element( child ) )
+# Write KML folder containing a tree of heat map folders
+def write_heat_maps_tree( writer, s_tree ):
 
-    # Save folder of combined heat maps
-    xml = ET.ElementTree( root )
-    dc_folder[XML] = xml
+    dc_tree = DC_TREES[s_tree]
 
-    # Optionally write the result to a KML file
-    if output_directory:
-        print( f'Saving folder "{dc_folder[FOLDER_LABEL]}"' )
-        output_path = os.path.join( output_directory, 'folders', f'{s_folder}.kml' )
-        xml.write( output_path, encoding='utf-8', xml_declaration=True )
+    writer.start( 'Folder', s_name=dc_tree[TREE_LABEL] )
+    for s_folder in dc_tree[TREE_CONTENTS]:
+        write_heat_maps_folder( writer, s_folder )
+    writer.end()
 
 
 # Build full heat maps tree for Google Earth presentation
 def make_heat_maps_tree( output_directory ):
 
-    # Build Demographics tree
-    ls_children = [DC_FOLDERS[POPULATION_FOLDER][XML], DC_FOLDERS[HOUSEHOLDS_FOLDER][XML], DC_FOLDERS[HEALTH_FOLDER][XML]]
-    output_path = os.path.join( output_directory, 'trees', 'demographics_tree.kml' )
-    demo_tree = util.insert_in_parent_kml_folder( ls_children, 'Demographics', output_path=output_path )
-
-    # Build Heating Fuel tree
-    ls_children = [DC_FOLDERS[HEATING_FUEL_FOLDER][XML]]
-    output_path = os.path.join( output_directory, 'trees', 'heating_fuel_tree.kml' )
-    fuel_tree = util.insert_in_parent_kml_folder( ls_children, 'Heating Fuel', output_path=output_path )
-
-    # Build Weatherization tree
-    ls_children = [DC_FOLDERS[WX_HOUSEHOLDS_FOLDER][XML], DC_FOLDERS[WX_PARCELS_FOLDER][XML]]
-    output_path = os.path.join( output_directory, 'trees', 'weatherization_tree.kml' )
-    wx_tree = util.insert_in_parent_kml_folder( ls_children, 'Weatherization', output_path=output_path )
+    # Build Demographics, Heating Fuel, and Weatherization trees
+    for s_tree in DC_TREES:
+        print( f'Saving tree "{DC_TREES[s_tree][TREE_LABEL]}"' )
+        with kml_writer.KmlWriter( os.path.join( output_directory, 'trees', f'{s_tree}.kml' ) ) as writer:
+            writer.start( 'Document' )
+            write_heat_maps_tree( writer, s_tree )
 
     # Build full Heat Maps tree
-    ls_children = [demo_tree, fuel_tree, wx_tree]
-    output_path = os.path.join( output_directory, 'heat_maps.kml' )
-    util.insert_in_parent_kml_folder( ls_children, 'Heat Maps', output_path=output_path )
+    print( 'Saving tree "Heat Maps"' )
+    with kml_writer.KmlWriter( os.path.join( output_directory, 'heat_maps.kml' ) ) as writer:
+        writer.start( 'Document' )
+        writer.start( 'Folder', s_name='Heat Maps' )
+        for s_tree in DC_TREES:
+            write_heat_maps_tree( writer, s_tree )
 
 
 
@@ -760,6 +551,7 @@ if __name__ == '__main__':
     parser.add_argument( '-b', dest='block_groups_filename',  help='Input filename - Name of shapefile containing Lawrence block group geometry', required=True )
     parser.add_argument( '-c', dest='census_data_filename',  help='Input filename - Name of CSV file containing US Census data partitioned by block groups', required=True )
     parser.add_argument( '-o', dest='output_directory', help='Target directory for output files', required=True )
+    parser.add_argument( '-j', dest='workers', type=int, default=1, help='Number of worker processes generating heat map KML files (default: 1)' )
 
     args = parser.parse_args()
 
@@ -785,39 +577,24 @@ if __name__ == '__main__':
 
     # Extract block group geometries from shapefile
     df_block_groups = util.get_block_groups_geometry( args.block_groups_filename )
-    df_block_groups[HEAT_MAP_VALUE] = None
 
-    # Generate heat maps
-    for s_name in DC_HEAT_MAPS:
-
-        # Get attributes of current heat map
-        dc_heat_map_attrs = DC_HEAT_MAPS[s_name]
-
-        # Compute heat map values
-        f = getattr( Compute, s_name )
-        df_block_groups = f( df_res_parcels, df_stats, df_block_groups, s_name )
-
-        # Create empty KML
-        kml = simplekml.Kml()
-
-        # Generate heat map styles
-        doc, dc_heat_map_styles = make_heat_map_styles( df_block_groups, kml, dc_heat_map_attrs )
-
-        # Generate KML heat map file
-        DC_HEAT_MAPS[s_name][KML] = make_heat_map_kml_file( kml, doc, df_block_groups, dc_heat_map_attrs, dc_heat_map_styles, args.output_directory, s_name )
+    # Compute heat map values
+    df_block_groups = compute_heat_map_values( df_res_parcels, df_stats, df_block_groups )
 
+    # Generate heat maps
+    make_heat_maps( df_block_groups, args.output_directory, n_processes=args.workers )
 
     # Group heat maps into KML folders
     print( '' )
     for s_folder in DC_FOLDERS:
-        combine_heat_maps( s_folder, output_directory=args.output_directory )
+        combine_heat_maps( s_folder, args.output_directory )
 
     # Group folders into tree structure
     print( '' )
     make_heat_maps_tree( args.output_directory )
 
     # Save heat map values to database
-    df_block_groups = df_block_groups.drop( columns=[util.GEOMETRY, HEAT_MAP_VALUE, SPECTRUM_INDEX] )
+    df_block_groups = df_block_groups.drop( columns=[util.GEOMETRY] )
     util.create_table( 'HeatMaps_L', conn, cur, df=df_block_groups )
 
     util.report_elapsed_time()
@@ -5,17 +5,16 @@ B_DEBUG = False
 
 import argparse
 import os
+import multiprocessing
 
 import pandas as pd
 pd.set_option( 'display.max_columns', 500 )
 pd.set_option( 'display.width', 1000 )
 
-import simplekml
-import xml.etree.ElementTree as ET
-
 import sys
 sys.path.append( '../util' )
 import util
+import kml_writer
 
 
 # Nicknames
@@ -42,7 +41,6 @@ OCC = util.TOTAL_OCCUPANCY
 WX_PERMIT = util.WX_PERMIT
 IS_RENTAL = 'is_rental'
 WARDS=util.LAWRENCE_WARDS
-STYLEMAP = 'stylemap'
 
 RES = 'res'
 RENT = 'rent'
@@ -53,15 +51,16 @@ FUELS = util.FUELS
 FILTER = 'filter'
 DOCS = 'docs'
 
-KML_NAMESPACE = util.KML_NAMESPACE
-
 KML = 'kml'
 KML_LIST = 'kml_list'
-XML = 'xml'
-XML_LIST = 'xml_list'
+STYLES = 'styles'
+NAME = 'name'
 PARCEL_COUNT = 'parcel_count'
 UNIT_COUNT = 'unit_count'
 
+# Columns of parcels shown in documents, in sort order
+MAP_COLUMNS = [WARD, STREET_NAME, ADDR, FUEL, LAT, LONG, LINK]
+
 # Field values to be used in generating folders
 FOLDER_HOUSE_TYPES = [RENT, RES]
 FOLDER_WX_TYPES = [NWX, WX]
@@ -288,13 +287,17 @@ for s_key in DC_DOCUMENTS:
 
 # KML rendering attributes
 KML_MAP = util.KML_MAP
+ICON_URL = 'https://maps.google.com/mapfiles/kml/shapes/{}.png'
+HIGHLIGHT_ICON_URL = 'http://maps.google.com/mapfiles/kml/pushpin/ylw-pushpin.png'
 
 ######################
 
 
+# Generate stylemaps for all combinations of ward and fuel
+# - Returns dictionary mapping ( ward, fuel ) to ( stylemap ID, KML of styles and stylemap )
 def make_styles():
 
-    df_styles = pd.DataFrame()
+    dc_styles = {}
 
     for s_ward in KML_MAP[COLOR]:
         for s_fuel in KML_MAP[ICON]:
@@ -308,68 +311,72 @@ def make_styles():
             s_icon = KML_MAP[ICON][s_fuel]
             shape_scale = s_icon.split('|')
 
+            s_style_map_id = f'{s_ward}_{s_fuel}'.lower()
+            s_normal_id = s_style_map_id + '_normal'
+            s_highlight_id = s_style_map_id + '_highlight'
+
             # Generate normal style
-            normal_style = simplekml.Style()
-            normal_style.labelstyle.scale = 0
-            normal_style.iconstyle.color = icon_colors[0]
-            normal_style.iconstyle.icon.href = 'https://maps.google.com/mapfiles/kml/shapes/' + shape_scale[0] + '.png'
-            normal_style.iconstyle.scale = shape_scale[1]
+            s_normal_style = kml_writer.format_icon_style( s_normal_id, icon_colors[0], ICON_URL.format( shape_scale[0] ), shape_scale[1], 0 )
 
             # Generate highlight style for mouseover
-            highlight_style = simplekml.Style()
-            highlight_style.labelstyle.scale = 1.1
-            highlight_style.iconstyle.color = icon_colors[1]
+            s_highlight_style = kml_writer.format_icon_style( s_highlight_id, icon_colors[1], HIGHLIGHT_ICON_URL, 1, 1.1 )
 
             # Combine normal and highlight styles in a stylemap
-            style_map = simplekml.StyleMap()
-            style_map.normalstyle = normal_style
-            style_map.highlightstyle = highlight_style
+            s_style_map = kml_writer.format_style_map( s_style_map_id, s_normal_id, s_highlight_id )
 
-            # Save the stylemap in the styles dataframe
-            dc_row = \
-            {
-                WARD: s_ward,
-                FUEL: s_fuel,
-                STYLEMAP: style_map
-            }
-            df_styles = df_styles.append( dc_row, ignore_index=True )
+            # Save the stylemap in the styles dictionary
+            dc_styles[( s_ward, s_fuel )] = ( s_style_map_id, s_normal_style + s_highlight_style + s_style_map )
 
-    return df_styles
+    return dc_styles
 
 
 # Generate a KML file containing POIs
-def make_kml_file( s_label, df, df_styles, n_parcels, n_units, output_directory ):
+# - Returns location of the inner document in the file, to be copied into folders, trees, and treetops, and styles it uses
+# - Styles are written outside the inner document, so that files combining documents can write each style once
+def make_kml_file( s_label, df, dc_styles, n_parcels, n_units, output_directory ):
 
-    # Create empty KML
-    kml = simplekml.Kml()
-
-    # Set the document name
     s_docname = make_doc_name( s_label, n_parcels, n_units )
-    kml.document.name = s_docname
-    doc = kml.newdocument( name=s_docname )
+    s_doc_key = s_label.lower()
+    s_filepath = os.path.join( output_directory, 'maps', f'{s_doc_key}.kml' )
 
-    for index, row in df.iterrows():
+    # Find styles used in this document, in order of first use
+    ls_ward_fuel = list( zip( df[WARD], df[FUEL] ) )
+    ls_style_keys = list( dict.fromkeys( ls_ward_fuel ) )
 
-        # Create a point for this parcel
-        point = doc.newpoint( name=f'{row[WARD]}: {row[ADDR]}', coords=[ ( row[LONG], row[LAT] ) ] )
+    with kml_writer.KmlWriter( s_filepath ) as writer:
 
-        # Set link
-        point.description = f'<a href="{row[LINK]}">{row[ADDR]}</a><br/>{row[FUEL]} heat'
+        # Set the document name
+        writer.start( 'Document', s_name=s_docname )
+        write_styles( writer, ls_style_keys, dc_styles )
 
-        # Set the style map to switch between normal and highlight styles
-        s_ward = row[WARD]
-        s_fuel = row[FUEL]
-        style_row = df_styles[ ( df_styles[WARD] == s_ward ) & ( df_styles[FUEL] == s_fuel )]
+        offset = writer.start_fragment()
+        writer.start( 'Document', s_name=s_docname )
 
-        # Assign the stylemap to the point
-        style_map = simplekml.StyleMap()
-        point.stylemap = style_row[STYLEMAP].values[0]
+        # Find the style map of each parcel, to switch between normal and highlight styles
+        ls_style_map_ids = [dc_styles[ward_fuel][0] for ward_fuel in ls_ward_fuel]
 
-    s_doc_key = s_label.lower()
-    s_filepath = os.path.join( output_directory, 'maps', f'{s_doc_key}.kml' )
-    kml.save( s_filepath )
+        for s_ward, s_addr, s_fuel, lat, long, s_link, s_style_map_id in zip( df[WARD], df[ADDR], df[FUEL], df[LAT], df[LONG], df[LINK], ls_style_map_ids ):
+
+            # Create a point for this parcel, with link
+            s_name = f'{s_ward}: {s_addr}'
+            s_description = f'<a href="{s_link}">{s_addr}</a><br/>{s_fuel} heat'
+            writer.write( kml_writer.format_point_placemark( s_name, s_description, s_style_map_id, long, lat ) )
 
-    return kml, s_doc_key
+        writer.end()
+        fragment = writer.end_fragment( offset )
+
+    return fragment, s_doc_key, ls_style_keys
+
+
+# Write styles, given their ( ward, fuel ) keys
+def write_styles( writer, ls_style_keys, dc_styles ):
+    for ward_fuel in ls_style_keys:
+        writer.write( dc_styles[ward_fuel][1] )
+
+
+# Collect styles used by documents in given folders, once each, in order of first use
+def collect_styles( ls_folders ):
+    return list( dict.fromkeys( ward_fuel for s_folder in ls_folders for ward_fuel in DC_FOLDERS[s_folder][STYLES] ) )
 
 
 # Format delimited words in a string
@@ -397,71 +404,98 @@ def make_doc_name( s_label, n_parcels, n_units ):
     return s_out
 
 
-# Generate KML documents
-def make_kml_documents( df_parcels, df_styles, output_directory ):
+# Generate one KML document, selecting parcels by filter and weatherization status
+# - Returns document key, location of document in its KML file, styles it uses, and counts of parcels and housing units
+def make_kml_document( s_key, s_wx, df_parcels, dc_styles, output_directory ):
 
-    print( '' )
-    print( f'Generating {len( DC_DOCUMENTS ) * len( WX_FILTERS )} KML files' )
-    print( '' )
+    df = df_parcels
 
-    # Add rental flag column
-    df_parcels[IS_RENTAL] = df_parcels[OCC] > 1
+    # Initialize the label for current KML
+    s_label = s_key
 
-    n_files = 0
+    # Select rows based on current filter
+    dc_filters = DC_DOCUMENTS[s_label][FILTER]
+    for col in dc_filters:
+        df = df[ df[col].isin( dc_filters[col] ) ]
 
-    # Generate three KMLs for each filter in the DC_DOCUMENTS table
-    for s_key in DC_DOCUMENTS:
+    # Select further, based on weatherization status
+    if s_wx:
+        s_label += '_' + s_wx
+        df = df[ df[WX_PERMIT].isnull() ] if s_wx == NWX else df[ ~df[WX_PERMIT].isnull() ]
 
-        # Generate three KMLs for current filter
-        for s_wx in WX_FILTERS:
+    # Count parcels and housing units that will be represented by this KML
+    n_parcels = len( df )
+    n_units = df[OCC].sum()
 
-            # Start with a copy of the full parcels table
-            df = df_parcels.copy()
+    # Reorder columns and rows
+    df = df[MAP_COLUMNS]
+    df = df.sort_values( by=MAP_COLUMNS )
+    df = df.reset_index( drop=True )
 
-            # Initialize the label for current KML
-            s_label = s_key
+    # Convert dataframe to KML
+    fragment, s_doc_key, ls_style_keys = make_kml_file( s_label, df, dc_styles, n_parcels, n_units, output_directory )
 
-            # Select rows based on current filter
-            dc_filters = DC_DOCUMENTS[s_label][FILTER]
-            for col in dc_filters:
-                df = df[ df[col].isin( dc_filters[col] ) ]
+    return s_doc_key, fragment, ls_style_keys, n_parcels, n_units
 
-            # Select further, based on weatherization status
-            if s_wx:
-                s_label += '_' + s_wx
-                df = df[ df[WX_PERMIT].isnull() ] if s_wx == NWX else df[ ~df[WX_PERMIT].isnull() ]
 
-            # Count parcels and housing units that will be represented by this KML
-            n_parcels = len( df )
-            n_units = df[OCC].sum()
+# Save arguments shared by all documents generated in a worker process
+def init_worker( df_parcels, dc_styles, output_directory ):
+    global worker_args
+    worker_args = ( df_parcels, dc_styles, output_directory )
 
-            # Edit Vision hyperlinks encoded for Excel
-            pattern = r'=HYPERLINK\("(http.*pid=\d+)".*'
-            df = df.replace( to_replace=pattern, value=r'\1', regex=True )
 
-            # Reorder columns and rows
-            ls_columns = [WARD, STREET_NAME, ADDR, FUEL, LAT, LONG, LINK]
-            df = df[ls_columns]
-            df = df.sort_values( by=ls_columns )
-            df = df.reset_index( drop=True )
+# Generate one KML document in a worker process
+def make_kml_document_in_worker( key_wx ):
+    return make_kml_document( *key_wx, *worker_args )
 
-            # Convert dataframe to KML
-            kml, s_doc_key = make_kml_file( s_label, df, df_styles, n_parcels, n_units, output_directory )
 
-            # Save the KML file and associated counts
-            DC_DOCUMENTS[s_key][DOCS][s_doc_key][KML] = kml
-            DC_DOCUMENTS[s_key][DOCS][s_doc_key][PARCEL_COUNT] = n_parcels
-            DC_DOCUMENTS[s_key][DOCS][s_doc_key][UNIT_COUNT] = n_units
+# Generate KML documents, optionally in a pool of worker processes
+def make_kml_documents( df_parcels, dc_styles, output_directory, n_processes=1 ):
 
-            # Report progress
-            n_files += 1
-            print( '{: >3d}: {}, "{}"'.format( n_files, s_doc_key, kml.document.name ) )
+    print( '' )
+    print( f'Generating {len( DC_DOCUMENTS ) * len( WX_FILTERS )} KML files' )
+    print( '' )
+
+    # Add rental flag column
+    df_parcels[IS_RENTAL] = df_parcels[OCC] > 1
+
+    # Keep only the columns needed to select and show parcels
+    ls_filter_columns = [col for s_key in DC_DOCUMENTS for col in DC_DOCUMENTS[s_key][FILTER]]
+    df_parcels = df_parcels[ list( dict.fromkeys( ls_filter_columns + [WX_PERMIT, OCC] + MAP_COLUMNS ) ) ]
+
+    # Edit Vision hyperlinks encoded for Excel
+    pattern = r'=HYPERLINK\("(http.*pid=\d+)".*'
+    df_parcels = df_parcels.replace( to_replace=pattern, value=r'\1', regex=True )
+
+    # Generate three KMLs for each filter in the DC_DOCUMENTS table
+    ls_key_wx = [( s_key, s_wx ) for s_key in DC_DOCUMENTS for s_wx in WX_FILTERS]
+
+    if ( n_processes or 1 ) > 1:
+        with multiprocessing.Pool( n_processes, initializer=init_worker, initargs=( df_parcels, dc_styles, output_directory ) ) as pool:
+            save_kml_documents( ls_key_wx, pool.imap( make_kml_document_in_worker, ls_key_wx ) )
+    else:
+        save_kml_documents( ls_key_wx, ( make_kml_document( s_key, s_wx, df_parcels, dc_styles, output_directory ) for s_key, s_wx in ls_key_wx ) )
 
     print( '' )
 
     return
 
 
+# Save locations, styles, and counts of generated documents, in order of the DC_DOCUMENTS table
+def save_kml_documents( ls_key_wx, results ):
+
+    for n_files, ( ( s_key, s_wx ), ( s_doc_key, fragment, ls_style_keys, n_parcels, n_units ) ) in enumerate( zip( ls_key_wx, results ), start=1 ):
+
+        # Save the KML file and associated styles and counts
+        DC_DOCUMENTS[s_key][DOCS][s_doc_key][KML] = fragment
+        DC_DOCUMENTS[s_key][DOCS][s_doc_key][STYLES] = ls_style_keys
+        DC_DOCUMENTS[s_key][DOCS][s_doc_key][PARCEL_COUNT] = n_parcels
+        DC_DOCUMENTS[s_key][DOCS][s_doc_key][UNIT_COUNT] = n_units
+
+        # Report progress
+        print( '{: >3d}: {}, "{}"'.format( n_files, s_doc_key, make_doc_name( s_doc_key, n_parcels, n_units ) ) )
+
+
 # Generate data structure to group documents into folders
 def make_dc_folders():
 
@@ -495,10 +529,11 @@ def make_dc_folders():
                 {
                     FOLDER_CONTENTS: [],
                     KML_LIST: [],
+                    STYLES: [],
                     PARCEL_COUNT: 0,
                     UNIT_COUNT: 0,
                     VISIBILITY: s_vis,
-                    XML: None,
+                    NAME: None,
                 }
 
     # Iterate over dictionary, 3 documents per element
@@ -539,93 +574,46 @@ def make_dc_folders():
                 fu = dc_kml_attrs[FU]
                 wx = dc_kml_attrs[WX]
                 s_folder_name = f'{hs} {fu} {wx}'
-                kml = DC_DOCUMENTS[s_doc_label][DOCS][s_kml_label][KML]
+                fragment = DC_DOCUMENTS[s_doc_label][DOCS][s_kml_label][KML]
                 DC_FOLDERS[s_folder_name][FOLDER_CONTENTS].append( s_kml_label )
-                DC_FOLDERS[s_folder_name][KML_LIST].append( kml )
+                DC_FOLDERS[s_folder_name][KML_LIST].append( fragment )
+                DC_FOLDERS[s_folder_name][STYLES] += DC_DOCUMENTS[s_doc_label][DOCS][s_kml_label][STYLES]
                 DC_FOLDERS[s_folder_name][PARCEL_COUNT] += DC_DOCUMENTS[s_doc_label][DOCS][s_kml_label][PARCEL_COUNT]
                 DC_FOLDERS[s_folder_name][UNIT_COUNT] += DC_DOCUMENTS[s_doc_label][DOCS][s_kml_label][UNIT_COUNT]
 
-    return
-
-
-# Group KML documents into KML folders
-def insert_maps_in_folders( output_directory=None ):
-
-    namespace = KML_NAMESPACE
-    schema = f'{{{namespace}}}'
-    ET.register_namespace( '', namespace )
-
-    # Iterate over dictionary of folders
-    for s_folder in DC_FOLDERS:
-
-        # Create new KML root
-        root = ET.Element( f'{schema}kml' )
-
-        # Convert lowercase folder string to formatted name
-        s_folder_name = format_words( s_folder )
-
-        # Append counts
-        n_parcels = DC_FOLDERS[s_folder][PARCEL_COUNT]
-        n_units = DC_FOLDERS[s_folder][UNIT_COUNT]
-        s_folder_name += format_counts( n_parcels, n_units )
-
-        # Initialize document to contain everything
-        parent_document = ET.SubElement( root, f'{schema}Document' )
-        ET.SubElement( parent_document, f'{schema}name' ).text = s_folder_name
+    # Convert lowercase folder strings to formatted names, with counts
+    for s_folder, dc_folder in DC_FOLDERS.items():
+        dc_folder[NAME] = format_words( s_folder ) + format_counts( dc_folder[PARCEL_COUNT], dc_folder[UNIT_COUNT] )
 
-        # Track unique style IDs
-        dc_unique_styles = {}
-
-        # Create the top-level folder
-        content_folder = ET.SubElement( parent_document, f'{schema}Folder' )
-        ET.SubElement( content_folder, f'{schema}name' ).text = s_folder_name
-        ET.SubElement( content_folder, f'{schema}visibility' ).text = DC_FOLDERS[s_folder][VISIBILITY]
-
-        # Initialize list to collect features ( Placemarks, Documents, etc.)
-        ls_features = []
-
-        # Iterate over source KML documents
-        for kml in DC_FOLDERS[s_folder][KML_LIST]:
-            xml_root = ET.fromstring( kml.kml() )
-            src_doc = xml_root.find( f'{schema}Document' )
-
-            # Iterate over children of the source document
-            for child in src_doc:
+    return
 
-                # Replicate child element
-                replicated_child = util.replicate_kml_element( child )
 
-                tag_name = replicated_child.tag.replace( schema, '' )
+# Write KML folder containing documents, copied from map files
+def write_folder( writer, s_folder ):
 
-                # Collect Style and StyleMap elements
-                if tag_name in ['Style', 'StyleMap']:
-                    style_id = replicated_child.get( 'id' )
-                    if style_id not in dc_unique_styles:
-                        dc_unique_styles[style_id] = replicated_child
+    dc_folder = DC_FOLDERS[s_folder]
 
-                # Collect feature elements
-                elif tag_name in ['Placemark', 'Folder', 'Document', 'NetworkLink']:
-                    ls_features.append( replicated_child )
+    writer.start( 'Folder', s_name=dc_folder[NAME], s_visibility=dc_folder[VISIBILITY] )
+    for fragment in dc_folder[KML_LIST]:
+        writer.copy( fragment )
+    writer.end()
 
-        # Insert collected styles first into the Parent Document
-        for style_id, style_element in dc_unique_styles.items():
-            parent_document.insert( 0, style_element ) # Insert at the beginning of the Document
 
-        # Append features to content folder
-        for feature in ls_features:
-            content_folder.append( feature )
+# Group KML documents into KML folders
+def insert_maps_in_folders( output_directory, dc_styles ):
 
-        # Save the combined KML
-        xml = ET.ElementTree( root )
+    # Iterate over dictionary of folders
+    for s_folder in DC_FOLDERS:
 
-        # Save for later, to be inserted into a tree
-        DC_FOLDERS[s_folder][XML] = xml
+        s_folder_name = DC_FOLDERS[s_folder][NAME]
+        s_filename = f'{"_".join( s_folder.split() )}.kml'
+        print( f'Saving folder "{s_folder_name}" containing {DC_FOLDERS[s_folder][FOLDER_CONTENTS]} to {s_filename}' )
+        output_path = os.path.join( output_directory, 'folders', s_filename )
 
-        if output_directory:
-            s_filename = f'{"_".join( s_folder.split() )}.kml'
-            print( f'Saving folder "{s_folder_name}" containing {DC_FOLDERS[s_folder][FOLDER_CONTENTS]} to {s_filename}' )
-            output_path = os.path.join( output_directory, 'folders', s_filename )
-            xml.write( output_path, encoding='utf-8', xml_declaration=True )
+        with kml_writer.KmlWriter( output_path ) as writer:
+            writer.start( 'Document', s_name=s_folder_name )
+            write_styles( writer, collect_styles( [s_folder] ), dc_styles )
+            write_folder( writer, s_folder )
 
     return
 
@@ -647,11 +635,10 @@ def make_dc_trees():
             DC_TREES[s_label] = \
             {
                 TREE_CONTENTS: [],
-                XML_LIST: [],
                 PARCEL_COUNT: 0,
                 UNIT_COUNT: 0,
                 VISIBILITY: s_vis,
-                XML: None,
+                NAME: None,
             }
 
             # Populate the dictionary for this tree
@@ -664,15 +651,28 @@ def make_dc_trees():
                 if hs in ls_folder_parts and wx in ls_folder_parts:
                     #... Add current folder to this tree
                     DC_TREES[s_label][TREE_CONTENTS].append( s_folder )
-                    DC_TREES[s_label][XML_LIST].append( dc_folder[XML] )
                     DC_TREES[s_label][PARCEL_COUNT] += ( dc_folder[PARCEL_COUNT] )
                     DC_TREES[s_label][UNIT_COUNT] += ( dc_folder[UNIT_COUNT] )
 
+            # Convert lowercase tree string to formatted name, with counts
+            DC_TREES[s_label][NAME] = format_words( s_label, '_' ) + format_counts( DC_TREES[s_label][PARCEL_COUNT], DC_TREES[s_label][UNIT_COUNT] )
+
     return
 
 
+# Write KML folder containing a tree of folders
+def write_tree( writer, s_tree ):
+
+    dc_tree = DC_TREES[s_tree]
+
+    writer.start( 'Folder', s_name=dc_tree[NAME], s_visibility=dc_tree[VISIBILITY] )
+    for s_folder in dc_tree[TREE_CONTENTS]:
+        write_folder( writer, s_folder )
+    writer.end()
+
+
 # Insert KML folders into trees
-def insert_folders_in_trees( output_directory ):
+def insert_folders_in_trees( output_directory, dc_styles ):
 
     print( '' )
 
@@ -680,71 +680,93 @@ def insert_folders_in_trees( output_directory ):
 
     for s_tree, dc_tree in DC_TREES.items():
 
-        # Convert lowercase folder string to formatted name
-        s_tree_name = format_words( s_tree, '_' )
-
-        # Append counts
-        n_parcels = dc_tree[PARCEL_COUNT]
-        n_units = dc_tree[UNIT_COUNT]
-        s_tree_name += format_counts( n_parcels, n_units )
+        s_tree_name = dc_tree[NAME]
+        print( f'Saving tree "{s_tree_name}"' )
 
         output_path = os.path.join( output_directory, 'trees', f'{s_tree}.kml' )
-        dc_tree[XML] = util.insert_in_parent_kml_folder( dc_tree[XML_LIST], s_tree_name, s_visibility=dc_tree[VISIBILITY], output_path=output_path )
+        with kml_writer.KmlWriter( output_path ) as writer:
+            writer.start( 'Document' )
+            write_styles( writer, collect_styles( dc_tree[TREE_CONTENTS] ), dc_styles )
+            write_tree( writer, s_tree )
 
         ls_tree_names.append( s_tree_name )
 
     return ls_tree_names
 
 
-# Group trees into folders based on house type
-def make_treetop( s_house_type, output_directory ):
+# Select trees by house type, and count their parcels and housing units
+def select_trees( s_house_type ):
 
-    # Select trees by house type
     ls_trees = []
+    n_parcels = 0
+    n_units = 0
+
     for s_tree in DC_TREES:
         if s_house_type in s_tree:
-            ls_trees.append( DC_TREES[s_tree] )
+            ls_trees.append( s_tree )
+            n_parcels += DC_TREES[s_tree][PARCEL_COUNT]
+            n_units += DC_TREES[s_tree][UNIT_COUNT]
 
-    # Collect XMLs and counts from selected trees
-    ls_xml = []
-    n_parcels = 0
-    n_units = 0
-    for dc_tree in ls_trees:
-        ls_xml.append( dc_tree[XML] )
-        n_parcels += dc_tree[PARCEL_COUNT]
-        n_units += dc_tree[UNIT_COUNT]
+    return ls_trees, n_parcels, n_units
+
+
+# Write KML folder grouping trees of one house type
+def write_treetop( writer, s_house_type ):
+
+    ls_trees, n_parcels, n_units = select_trees( s_house_type )
 
-    # Make treetop for this house type
     s_name = make_doc_name( s_house_type, n_parcels, n_units )
-    output_path = os.path.join( output_directory, 'treetops', f'{s_house_type}.kml' )
     s_vis = '0' if ( s_house_type == RES ) else '1'
-    xml = util.insert_in_parent_kml_folder( ls_xml, s_name, s_visibility=s_vis, output_path=output_path )
 
-    return xml, s_name
+    writer.start( 'Folder', s_name=s_name, s_visibility=s_vis )
+    for s_tree in ls_trees:
+        write_tree( writer, s_tree )
+    writer.end()
 
+    return s_name
 
-# Build treetops and full parcels tree
-def make_parcels_tree( output_directory ):
 
-    # Initialize values for parcels tree root
-    ls_xml = []
+# List folders in trees of given house types
+def select_folders( ls_house_types ):
+    return [s_folder for s_house_type in ls_house_types for s_tree in select_trees( s_house_type )[0] for s_folder in DC_TREES[s_tree][TREE_CONTENTS]]
+
+
+# Group trees into folders based on house type
+def make_treetop( s_house_type, output_directory, dc_styles ):
+
+    output_path = os.path.join( output_directory, 'treetops', f'{s_house_type}.kml' )
+
+    with kml_writer.KmlWriter( output_path ) as writer:
+        writer.start( 'Document' )
+        write_styles( writer, collect_styles( select_folders( [s_house_type] ) ), dc_styles )
+        s_name = write_treetop( writer, s_house_type )
+
+    print( f'Saving tree "{s_name}"' )
+
+    return s_name
+
+
+# Build treetops and full parcels tree
+def make_parcels_tree( output_directory, dc_styles ):
 
     # Initialize return value
     ls_treetop_names = []
 
     # Generate top-level subtrees based on house types
     for s_house_type in FOLDER_HOUSE_TYPES:
-
-        # Generate the subtree
-        xml, s_name = make_treetop( s_house_type, output_directory )
-
-        # Accumulate information for parcels tree root
-        ls_xml.append( xml )
-        ls_treetop_names.append( s_name )
+        ls_treetop_names.append( make_treetop( s_house_type, output_directory, dc_styles ) )
 
     # Generate full parcels tree
     output_path = os.path.join( output_directory, '', 'parcels.kml' )
-    util.insert_in_parent_kml_folder( ls_xml, 'Parcels', output_path=output_path )
+
+    with kml_writer.KmlWriter( output_path ) as writer:
+        writer.start( 'Document' )
+        write_styles( writer, collect_styles( select_folders( FOLDER_HOUSE_TYPES ) ), dc_styles )
+        writer.start( 'Folder', s_name='Parcels' )
+        for s_house_type in FOLDER_HOUSE_TYPES:
+            write_treetop( writer, s_house_type )
+
+    print( 'Saving tree "Parcels"' )
 
     return ls_treetop_names
 
@@ -778,6 +800,7 @@ if __name__ == '__main__':
     parser.add_argument( '-m', dest='master_filename',  help='Master database filename', required=True )
     parser.add_argument( '-o', dest='output_directory', help='Target directory output files', required=True )
     parser.add_argument( '-c', dest='clear_directory', action='store_true', help='Clear target directory first?' )
+    parser.add_argument( '-j', dest='workers', type=int, default=1, help='Number of worker processes generating KML documents (default: 1)' )
 
     args = parser.parse_args()
 
@@ -809,25 +832,25 @@ if __name__ == '__main__':
     df_parcels = pd.read_sql_table( s_table, engine )
 
     # Generate styles of placemarks based on ward and fuel
-    df_styles = make_styles()
+    dc_styles = make_styles()
 
     # Generate KML documents
-    make_kml_documents( df_parcels, df_styles, args.output_directory )
+    make_kml_documents( df_parcels, dc_styles, args.output_directory, n_processes=args.workers )
 
     # Generate data structure to group documents into folders
     make_dc_folders()
 
     # Generate KML files representing single-tier groupings of documents into foldersl
-    insert_maps_in_folders( output_directory=args.output_directory )
+    insert_maps_in_folders( args.output_directory, dc_styles )
 
     # Build data structure of trees
     make_dc_trees()
 
     # Insert KML folders into trees
-    ls_tree_names = insert_folders_in_trees( args.output_directory )
+    ls_tree_names = insert_folders_in_trees( args.output_directory, dc_styles )
 
     # Build treetops and full parcels tree
-    ls_treetop_names = make_parcels_tree( args.output_directory )
+    ls_treetop_names = make_parcels_tree( args.output_directory, dc_styles )
 
     # Save tree names in a text file
     save_tree_names( ls_treetop_names, ls_tree_names, args.output_directory )
@@ -110,9 +110,9 @@ if __name__ == '__main__':
     for addr_col in addr_cols:
         df_bs = clean_address_column( df_bs, addr_col )
 
-    # Normalize addresses.  Use result_type='expand' to load multiple columns!
+    # Normalize addresses
     df_bs[ADDR] = df_bs[util.SERV_ADDR_1] + ' ' + df_bs[util.SERV_ADDR_2] + ' ' + df_bs[util.SERV_ADDR_3] + ' ' + df_bs[util.SERV_ADDR_4]
-    df_bs[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = df_bs.apply( lambda row: normalize.normalize_address( row, ADDR, city='LAWRENCE', return_parts=True ), axis=1, result_type='expand' )
+    df_bs[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = normalize.normalize_addresses( df_bs[ADDR], city='LAWRENCE' )
 
 
     # Retrieve raw third-party supplier table from database
@@ -132,9 +132,9 @@ if __name__ == '__main__':
     # Extract residential accounts
     df_tps = df_tps[ df_tps[util.SERVICE_DESCRIPTION].str.contains( 'Residential' ) ].copy()
 
-    # Normalize addresses.  Use result_type='expand' to load multiple columns!
+    # Normalize addresses
     df_tps[ADDR] = df_tps[util.SERVICE_ADDRESS]
-    df_tps[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = df_tps.apply( lambda row: normalize.normalize_address( row, ADDR, city='LAWRENCE', return_parts=True ), axis=1, result_type='expand' )
+    df_tps[[ADDR,STREET_NUMBER,STREET_NAME,OCCUPANCY,ADDITIONAL]] = normalize.normalize_addresses( df_tps[ADDR], city='LAWRENCE' )
 
 
     # Build and save table R1 accounts
@@ -17,6 +17,6 @@ if __name__ == '__main__':
 
     # Generate parcels table with normalized addresses and geolocation data
     print( '\n=======> Generate parcels table with geolocation' )
-    os.system( 'python lawrence_geolocate.py -p ../db/lawrence_parcels.sqlite -g ../db/lawrence_geo_cache.sqlite' )
+    os.system( 'python lawrence_geolocate.py -p ../db/lawrence_parcels.sqlite -g ../db/lawrence_geo_cache.sqlite -s ../xl/lawrence/geography/parcel_geometry/M149TaxPar_CY23_FY24.shp -z "../xl/lawrence/geography/zip_code_geometry/ZIP_Codes_(5-Digit)_from_HERE_(Navteq).shp"' )
 
     util.report_elapsed_time()
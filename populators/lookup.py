@@ -5,6 +5,7 @@ import pandas as pd
 pd.set_option( 'display.max_columns', 500 )
 pd.set_option( 'display.width', 1000 )
 
+import os
 import time
 import re
 
@@ -532,7 +533,7 @@ if __name__ == '__main__':
     df_census[util.RADDR_STREET_NUMBER] = df_census[util.RADDR_STREET_NUMBER].fillna(0).astype(int).astype(str)
     df_census[util.RADDR_STREET_NAME] = df_census[util.RADDR_STREET_NAME].fillna('').astype(str)
     df_census[ADDR] = df_census[util.RADDR_STREET_NUMBER] + ' ' + df_census[util.RADDR_STREET_NAME]
-    df_census[ADDR] = df_census.apply( lambda row: normalize.normalize_address( row, ADDR ), axis=1 )
+    df_census[ADDR] = normalize.normalize_addresses( df_census[ADDR], return_parts=False, n_processes=os.cpu_count() )
     df_census[APT_NUM] = df_census[util.RADDR_APARTMENT_NUMBER].fillna('').astype(str)
 
     # Select columns for database
@@ -547,7 +548,7 @@ if __name__ == '__main__':
     df_assessment[util.LADDR_STREET_NUMBER] = df_assessment[util.LADDR_STREET_NUMBER].fillna(0).astype(str)
     df_assessment[util.LADDR_STREET_NAME] = df_assessment[util.LADDR_STREET_NAME].fillna('').astype(str)
     df_assessment[ADDR] = df_assessment[util.LADDR_STREET_NUMBER] + ' ' + df_assessment[util.LADDR_STREET_NAME]
-    df_assessment[ADDR] = df_assessment.apply( lambda row: normalize.normalize_address( row, ADDR ), axis=1 )
+    df_assessment[ADDR] = normalize.normalize_addresses( df_assessment[ADDR], return_parts=False )
     df_assessment[APT_NUM] = df_assessment[util.LADDR_CONDO_UNIT].fillna('').astype(str)
 
     # Select columns for database
@@ -569,7 +570,7 @@ if __name__ == '__main__':
     df_water[util.ADDR_STREET_NUMBER] = df_water[util.ADDR_STREET_NUMBER].fillna('').astype(str).str.strip()
     df_water[util.ADDR_STREET_NAME] = df_water[util.ADDR_STREET_NAME].fillna('').astype(str).str.strip()
     df_water[ADDR] = df_water[util.ADDR_STREET_NUMBER] + ' ' + df_water[util.ADDR_STREET_NAME]
-    df_water[ADDR] = df_water.apply( lambda row: normalize.normalize_address( row, ADDR ), axis=1 )
+    df_water[ADDR] = normalize.normalize_addresses( df_water[ADDR], return_parts=False, n_processes=os.cpu_count() )
     df_water[util.FIRST_NAME] = df_water[util.FIRST_NAME].fillna('').astype(str).str.strip()
     df_water[util.LAST_NAME] = df_water[util.LAST_NAME].fillna('').astype(str).str.strip()
 
@@ -585,7 +586,7 @@ if __name__ == '__main__':
     df_solar = df_solar.rename( columns={ util.SITE_ADDRESS: ADDR, util.ID: SOLAR_ID } )
     df_solar[SOLAR_ID] = df_solar[SOLAR_ID].fillna('').astype(str)
     df_solar[ADDR] = df_solar[ADDR].fillna('').astype(str)
-    df_solar[ADDR] = df_solar.apply( lambda row: normalize.normalize_address( row, ADDR ), axis=1 )
+    df_solar[ADDR] = normalize.normalize_addresses( df_solar[ADDR], return_parts=False )
 
     # Select columns for database
     df_solar = df_solar[ [ ADDR, SOLAR_ID ] ]
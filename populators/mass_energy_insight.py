@@ -1,13 +1,13 @@
 # Copyright 2023 Energize Lawrence.  All rights reserved.
 
 import argparse
-import os
 import pandas as pd
 import chardet
 
 import sys
 sys.path.append( '../util' )
 import util
+import pipeline
 
 
 #################################################
@@ -41,81 +41,142 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser( description='Generate Mass Energy Insight master database' )
     parser.add_argument( '-m', dest='master_filename',  help='Output filename - Name of master database file', required=True )
     parser.add_argument( '-r', dest='research_filename',  help='Output filename - Name of research database file', required=True )
+    parser.add_argument( '-j', dest='workers', type=int, help='Maximum number of build steps to run concurrently (default: number of CPUs)' )
+    parser.add_argument( '-f', dest='force', action='store_true', help='Run all build steps, even those that are up to date?' )
+    parser.add_argument( '-i', dest='in_process', action='store_true', help='Run build steps one at a time in this process, sharing imports and database connections?' )
     args = parser.parse_args()
 
-    # Read Mass Energy Insight data - Andover
-    print( '\n=======> Mass Energy Insight input - Andover' )
-    csv_filename = '../xl/mass_energy_insight/mass_energy_insight_a.csv'
-    table_name = 'RawMassEnergyInsight_A'
-    keep_columns = ','.join( list( util.CONSISTENT_COLUMN_NAMES[table_name].keys() ) )
-    os.system( 'python xl_to_db.py -i {} -t {} -v -k {} -o {} -c'.format( csv_filename, table_name, keep_columns, args.master_filename ) )
-
-    # Read Mass Energy Insight data - Lawrence
-    print( '\n=======> Mass Energy Insight input - Lawrence' )
-    csv_filename = '../xl/mass_energy_insight/mass_energy_insight_l.csv'
-    table_name = 'RawMassEnergyInsight_L'
-    keep_columns = ','.join( list( util.CONSISTENT_COLUMN_NAMES[table_name].keys() ) )
-    os.system( 'python xl_to_db.py -i {} -t {} -v -k {} -o {}'.format( csv_filename, table_name, keep_columns, args.master_filename ) )
-
-    # Preprocess Mass Energy Insight data - Andover
-    print( '\n=======> Mass Energy Insight preprocess - Andover' )
-    os.system( 'python mass_energy_insight_preprocess.py -i RawMassEnergyInsight_A -o RawMassEnergyInsight_A_OldFormat -d {0}'.format( args.master_filename ) )
-
-    # Preprocess Mass Energy Insight data - Lawrence
-    print( '\n=======> Mass Energy Insight preprocess - Lawrence' )
-    os.system( 'python mass_energy_insight_preprocess.py -i RawMassEnergyInsight_L -o RawMassEnergyInsight_L_OldFormat -d {0}'.format( args.master_filename ) )
-
-
-    # Read external suppliers data
-    print( '\n=======> External suppliers input' )
-    os.system( 'python xl_to_db.py -i ../xl/mass_energy_insight/external_suppliers_electric_l.xlsx -t RawExternalSuppliersElectric_L -o {0}'.format( args.master_filename ) )
-    os.system( 'python xl_to_db.py -i ../xl/mass_energy_insight/external_suppliers_gas_l.xlsx -t RawExternalSuppliersGas_L -r 1 -m -o {0}'.format( args.master_filename ) )
-
-    # Read ISO zones data
-    print( '\n=======> ISO zones input' )
-    os.system( 'python xl_to_db.py -i ../xl/mass_energy_insight/iso_zones_l.xlsx -s account_number -t RawIsoZones_L -o {0}'.format( args.master_filename ) )
-
-    # Generate clean Mass Energy Insight tables with optional addition of external suppliers data
-    print( '\n=======> Mass Energy Insight tables' )
-    os.system( 'python mass_energy_insight_clean.py -i RawMassEnergyInsight_A_OldFormat -o Mei_A -d {0}'.format( args.master_filename ) )
-    os.system( 'python mass_energy_insight_clean.py -i RawMassEnergyInsight_L_OldFormat -z RawIsoZones_L -e RawExternalSuppliersElectric_L -g RawExternalSuppliersGas_L -o Mei_L -p ExternalSuppliersElectric_L -q ExternalSuppliersGas_L -d {0}'.format( args.master_filename ) )
-
-
-    # Generate Mass Energy Insight month tables
-    print( '\n=======> Mass Energy Insight months' )
-    os.system( 'python mass_energy_insight_months.py -i Mei_A -o Mei_A -d {0}'.format( args.master_filename ) )
-    os.system( 'python mass_energy_insight_months.py -i Mei_L -o Mei_L -d {0}'.format( args.master_filename ) )
-
-    # Generate Mass Energy Insight totals
-    print( '\n=======> Mass Energy Insight totals' )
-    os.system( 'python mass_energy_insight_totals.py -i Mei_A -o Mei_A_Totals -d {0}'.format( args.master_filename ) )
-    os.system( 'python mass_energy_insight_totals.py -i Mei_L -o Mei_L_Totals -d {0}'.format( args.master_filename ) )
-
-
-
-    # Read National Grid electric meter data - Andover
-    print( '\n=======> National Grid electric meters input - Andover' )
-    csv_directory = '../xl/mass_energy_insight/electric_meters_a'
-    raw_table_name = 'RawElectricMeters_A'
-    os.system( 'python xl_to_db.py -d {} -v -l account_number -s account_number,readDate -t {} -o {}'.format( csv_directory, raw_table_name, args.master_filename ) )
-
-    # Summarize National Grid electric meter data - Andover
-    print( '\n=======> National Grid electric meters summary - Andover' )
-    facility_table_name = 'Mei_A_Totals'
-    table_name = 'ElectricMeters_A'
-    os.system( 'python mass_energy_insight_meters.py -i {} -f {} -o {} -d {}'.format( raw_table_name, facility_table_name, table_name, args.master_filename ) )
-
-    # Read National Grid electric meter data - Lawrence
-    print( '\n=======> National Grid electric meters input - Lawrence' )
-    csv_directory = '../xl/mass_energy_insight/electric_meters_l'
-    raw_table_name = 'RawElectricMeters_L'
-    os.system( 'python xl_to_db.py -d {} -v -l account_number -s account_number,readDate -t {} -o {}'.format( csv_directory, raw_table_name, args.master_filename ) )
-
-    # Summarize National Grid electric meter data - Lawrence
-    print( '\n=======> National Grid electric meters summary - Lawrence' )
-    facility_table_name = 'Mei_L_Totals'
-    table_name = 'ElectricMeters_L'
-    os.system( 'python mass_energy_insight_meters.py -i {} -f {} -o {} -d {}'.format( raw_table_name, facility_table_name, table_name, args.master_filename ) )
+    # Month suffixes of tables generated by mass_energy_insight_months.py
+    months = [ str( n ).zfill( 2 ) for n in range( 1, 13 ) ]
+
+    # Build graph: Each step lists the master database tables it reads and writes
+    ls_steps = \
+    [
+        # Read Mass Energy Insight data - Andover
+        {
+            'label': 'Mass Energy Insight input - Andover',
+            'command': 'python xl_to_db.py -i ../xl/mass_energy_insight/mass_energy_insight_a.csv -t RawMassEnergyInsight_A -v -k ' + ','.join( list( util.CONSISTENT_COLUMN_NAMES['RawMassEnergyInsight_A'].keys() ) ) + ' -o {master} -c',
+            'writes': ['RawMassEnergyInsight_A'],
+            'create': True,
+        },
+
+        # Read Mass Energy Insight data - Lawrence
+        {
+            'label': 'Mass Energy Insight input - Lawrence',
+            'command': 'python xl_to_db.py -i ../xl/mass_energy_insight/mass_energy_insight_l.csv -t RawMassEnergyInsight_L -v -k ' + ','.join( list( util.CONSISTENT_COLUMN_NAMES['RawMassEnergyInsight_L'].keys() ) ) + ' -o {master}',
+            'writes': ['RawMassEnergyInsight_L'],
+        },
+
+        # Preprocess Mass Energy Insight data - Andover
+        {
+            'label': 'Mass Energy Insight preprocess - Andover',
+            'command': 'python mass_energy_insight_preprocess.py -i RawMassEnergyInsight_A -o RawMassEnergyInsight_A_OldFormat -d {master}',
+            'reads': ['RawMassEnergyInsight_A'],
+            'writes': ['RawMassEnergyInsight_A_OldFormat'],
+        },
+
+        # Preprocess Mass Energy Insight data - Lawrence
+        {
+            'label': 'Mass Energy Insight preprocess - Lawrence',
+            'command': 'python mass_energy_insight_preprocess.py -i RawMassEnergyInsight_L -o RawMassEnergyInsight_L_OldFormat -d {master}',
+            'reads': ['RawMassEnergyInsight_L'],
+            'writes': ['RawMassEnergyInsight_L_OldFormat'],
+        },
+
+        # Read external suppliers data
+        {
+            'label': 'External suppliers input - Electric',
+            'command': 'python xl_to_db.py -i ../xl/mass_energy_insight/external_suppliers_electric_l.xlsx -t RawExternalSuppliersElectric_L -o {master}',
+            'writes': ['RawExternalSuppliersElectric_L'],
+        },
+        {
+            'label': 'External suppliers input - Gas',
+            'command': 'python xl_to_db.py -i ../xl/mass_energy_insight/external_suppliers_gas_l.xlsx -t RawExternalSuppliersGas_L -r 1 -m -o {master}',
+            'writes': ['RawExternalSuppliersGas_L'],
+        },
+
+        # Read ISO zones data
+        {
+            'label': 'ISO zones input',
+            'command': 'python xl_to_db.py -i ../xl/mass_energy_insight/iso_zones_l.xlsx -s account_number -t RawIsoZones_L -o {master}',
+            'writes': ['RawIsoZones_L'],
+        },
+
+        # Generate clean Mass Energy Insight tables with optional addition of external suppliers data
+        {
+            'label': 'Mass Energy Insight tables - Andover',
+            'command': 'python mass_energy_insight_clean.py -i RawMassEnergyInsight_A_OldFormat -o Mei_A -d {master}',
+            'reads': ['RawMassEnergyInsight_A_OldFormat'],
+            'writes': ['Mei_A'],
+        },
+        {
+            'label': 'Mass Energy Insight tables - Lawrence',
+            'command': 'python mass_energy_insight_clean.py -i RawMassEnergyInsight_L_OldFormat -z RawIsoZones_L -e RawExternalSuppliersElectric_L -g RawExternalSuppliersGas_L -o Mei_L -p ExternalSuppliersElectric_L -q ExternalSuppliersGas_L -d {master}',
+            'reads': ['RawMassEnergyInsight_L_OldFormat', 'RawIsoZones_L', 'RawExternalSuppliersElectric_L', 'RawExternalSuppliersGas_L'],
+            'writes': ['Mei_L', 'ExternalSuppliersElectric_L', 'ExternalSuppliersGas_L'],
+        },
+
+        # Generate Mass Energy Insight month tables
+        {
+            'label': 'Mass Energy Insight months - Andover',
+            'command': 'python mass_energy_insight_months.py -i Mei_A -o Mei_A -d {master}',
+            'reads': ['Mei_A'],
+            'writes': [ 'Mei_A_' + s for s in months ],
+        },
+        {
+            'label': 'Mass Energy Insight months - Lawrence',
+            'command': 'python mass_energy_insight_months.py -i Mei_L -o Mei_L -d {master}',
+            'reads': ['Mei_L'],
+            'writes': [ 'Mei_L_' + s for s in months ],
+        },
+
+        # Generate Mass Energy Insight totals
+        {
+            'label': 'Mass Energy Insight totals - Andover',
+            'command': 'python mass_energy_insight_totals.py -i Mei_A -o Mei_A_Totals -d {master}',
+            'reads': ['Mei_A'],
+            'writes': ['Mei_A_Totals'],
+        },
+        {
+            'label': 'Mass Energy Insight totals - Lawrence',
+            'command': 'python mass_energy_insight_totals.py -i Mei_L -o Mei_L_Totals -d {master}',
+            'reads': ['Mei_L'],
+            'writes': ['Mei_L_Totals'],
+        },
+
+        # Read National Grid electric meter data - Andover
+        {
+            'label': 'National Grid electric meters input - Andover',
+            'command': 'python xl_to_db.py -d ../xl/mass_energy_insight/electric_meters_a -v -l account_number -s account_number,readDate -t RawElectricMeters_A -o {master}',
+            'writes': ['RawElectricMeters_A'],
+        },
+
+        # Summarize National Grid electric meter data - Andover
+        {
+            'label': 'National Grid electric meters summary - Andover',
+            'command': 'python mass_energy_insight_meters.py -i RawElectricMeters_A -f Mei_A_Totals -o ElectricMeters_A -d {master}',
+            'reads': ['RawElectricMeters_A', 'Mei_A_Totals'],
+            'writes': ['ElectricMeters_A'],
+        },
+
+        # Read National Grid electric meter data - Lawrence
+        {
+            'label': 'National Grid electric meters input - Lawrence',
+            'command': 'python xl_to_db.py -d ../xl/mass_energy_insight/electric_meters_l -v -l account_number -s account_number,readDate -t RawElectricMeters_L -o {master}',
+            'writes': ['RawElectricMeters_L'],
+        },
+
+        # Summarize National Grid electric meter data - Lawrence
+        {
+            'label': 'National Grid electric meters summary - Lawrence',
+            'command': 'python mass_energy_insight_meters.py -i RawElectricMeters_L -f Mei_L_Totals -o ElectricMeters_L -d {master}',
+            'reads': ['RawElectricMeters_L', 'Mei_L_Totals'],
+            'writes': ['ElectricMeters_L'],
+        },
+    ]
+
+    # Run the build graph
+    pipeline.run_steps( ls_steps, args.master_filename, n_workers=args.workers, b_force=args.force, b_in_process=args.in_process )
 
     # Generate copyright notice
     print( '\n=======> Copyright' )
@@ -6,6 +6,7 @@ import os
 import sys
 sys.path.append( '../util' )
 import util
+import pipeline
 
 
 # Main program
@@ -13,131 +14,182 @@ if __name__ == '__main__':
 
     parser = argparse.ArgumentParser( description='Process MassSave data' )
     parser.add_argument( '-o', dest='output_filename',  help='Output filename - Name of SQLite database file', required=True )
+    parser.add_argument( '-j', dest='workers', type=int, help='Maximum number of build steps to run concurrently (default: number of CPUs)' )
+    parser.add_argument( '-f', dest='force', action='store_true', help='Run all build steps, even those that are up to date?' )
+    parser.add_argument( '-i', dest='in_process', action='store_true', help='Run build steps one at a time in this process, sharing imports and database connections?' )
     args = parser.parse_args()
 
-    #
-    # Read data sources
-    #
-    print( '\n=======> Raw Electric Usage' )
-    os.system( 'python xl_to_db.py -d ../xl/mass_save/electric_usage -l year -r 2 -n "Annual" -o {0} -t RawElectricUsage -c'.format( args.output_filename ) )
-
-    print( '\n=======> Raw Gas Usage' )
-    os.system( 'python xl_to_db.py -d ../xl/mass_save/gas_usage -l year -r 2 -n "Annual" -o {0} -t RawGasUsage'.format( args.output_filename ) )
-
-    print( '\n=======> Raw Geographic Report' )
-    os.system( 'python xl_to_db.py -d ../xl/mass_save/geographic_report -l year -r 1 -n "Gas Incentives" -o {0} -t RawGeographicReport'.format( args.output_filename ) )
-
-    print( '\n=======> Electric EES Rates' )
-    os.system( 'python xl_to_db.py -i ../xl/mass_save/electric_ees_rates.xlsx -o {0} -t ElectricEesRates -n "Electric Utility" -s "Year,Electric Utility"'.format( args.output_filename ) )
-
-    print( '\n=======> Gas EES Rates' )
-    os.system( 'python xl_to_db.py -i ../xl/mass_save/gas_ees_rates.xlsx -o {0} -t GasEesRates -n "Gas Utility" -s "Year,Gas Utility"'.format( args.output_filename ) )
-
-    #
-    # Refine raw tables
-    #
     common_columns = 'jan,feb,mar,apr,may,jun,jul,aug,sep,oct,nov,dec,'
 
-    print( '\n=======> Electric Usage' )
-    numeric_columns = common_columns + 'annual_electric_usage_mwh'
-    os.system( 'python mass_save_refine.py -i RawElectricUsage -o ElectricUsage -n {0} -d {1}'.format( numeric_columns, args.output_filename ) )
-
-    print( '\n=======> Gas Usage' )
-    numeric_columns = common_columns + 'annual_gas_usage_therms'
-    os.system( 'python mass_save_refine.py -i RawGasUsage -o GasUsage -n {0} -d {1}'.format( numeric_columns, args.output_filename ) )
-
-    print( '\n=======> Geographic Report' )
-    numeric_columns = 'annual_electric_usage_mwh,annual_electric_savings_mwh,electric_incentives_$,annual_gas_usage_therms,annual_gas_savings_therms,gas_incentives_$'
-    os.system( 'python mass_save_refine.py -i RawGeographicReport -o GeographicReport -r zip_code -n {0} -z "No gas,Municipal" -p "Protected" -c GeographicReportDropped -d {1}'.format( numeric_columns, args.output_filename ) )
-
-    #
-    # Create table of towns
-    #
-    print( '\n=======> Towns' )
-    os.system( 'python mass_save_towns.py -d {0} -p ../xl/mass_save/population_2020.xlsx -e ../xl/mass_save/poverty_rates.xlsx -u ../xl/mass_save/electric_utilities.xlsx -v ../xl/mass_save/gas_utilities.xlsx'.format( args.output_filename ) )
-
-    #
-    # Analyze MassSave data
-    #
-    print( '\n=======> Analyze' )
-    os.system( 'python mass_save_analyze.py -d {0}'.format( args.output_filename ) )
-
-    #
-    # Summarize MassSave data
-    #
-    print( '\n=======> Summarize Residential' )
-    os.system( 'python mass_save_summarize.py -s "Residential & Low-Income" -t SummaryResidential -d {0}'.format( args.output_filename ) )
-
-    print( '\n=======> Summarize Commercial' )
-    os.system( 'python mass_save_summarize.py -s "Commercial & Industrial" -t SummaryCommercial -d {0}'.format( args.output_filename ) )
-
-    print( '\n=======> Summarize Total' )
-    os.system( 'python mass_save_summarize.py -s "Total" -t SummaryTotal -d {0}'.format( args.output_filename ) )
-
-    #
-    # Calculate statistics
-    #
-    print( '\n=======> Cost per Saved Therm' )
-    os.system( 'python mass_save_cost_per_saved_therm.py -t CostPerSavedTherm -d {0}'.format( args.output_filename ) )
-
-    print( '\n=======> Cost per Saved MWh' )
-    os.system( 'python mass_save_cost_per_saved_mwh.py -t CostPerSavedMwh -d {0}'.format( args.output_filename ) )
-
-    #
-    # Semiannual Reports
-    #
-    print( '\n=======> Equity Zip Codes' )
-    os.system( 'python xl_to_db.py -i ../xl/mass_save/equity_zip_codes.xlsx -z -t EquityZipCodes -o {0}'.format( args.output_filename ) )
-
-    print( '\n=======> Raw Semiannual Reports' )
-    os.system( 'python xl_to_db.py -d ../xl/mass_save/semiannual_report -a "Wxn & HPs by Zip" -r 6 -m -l year,quarter -t RawSemiannualReport -o {0}'.format( args.output_filename ) )
-
-    print( '\n=======> Analyze Semiannual Reports' )
-    os.system( 'python mass_save_semiannual_report.py -d {0}'.format( args.output_filename ) )
+    # Build graph: Each step lists the database tables it reads and writes
+    ls_steps = \
+    [
+        #
+        # Read data sources
+        #
+        {
+            'label': 'Raw Electric Usage',
+            'command': 'python xl_to_db.py -d ../xl/mass_save/electric_usage -l year -r 2 -n "Annual" -o {master} -t RawElectricUsage -c',
+            'writes': ['RawElectricUsage'],
+            'create': True,
+        },
+        {
+            'label': 'Raw Gas Usage',
+            'command': 'python xl_to_db.py -d ../xl/mass_save/gas_usage -l year -r 2 -n "Annual" -o {master} -t RawGasUsage',
+            'writes': ['RawGasUsage'],
+        },
+        {
+            'label': 'Raw Geographic Report',
+            'command': 'python xl_to_db.py -d ../xl/mass_save/geographic_report -l year -r 1 -n "Gas Incentives" -o {master} -t RawGeographicReport',
+            'writes': ['RawGeographicReport'],
+        },
+        {
+            'label': 'Electric EES Rates',
+            'command': 'python xl_to_db.py -i ../xl/mass_save/electric_ees_rates.xlsx -o {master} -t ElectricEesRates -n "Electric Utility" -s "Year,Electric Utility"',
+            'writes': ['ElectricEesRates'],
+        },
+        {
+            'label': 'Gas EES Rates',
+            'command': 'python xl_to_db.py -i ../xl/mass_save/gas_ees_rates.xlsx -o {master} -t GasEesRates -n "Gas Utility" -s "Year,Gas Utility"',
+            'writes': ['GasEesRates'],
+        },
+
+        #
+        # Refine raw tables
+        #
+        {
+            'label': 'Electric Usage',
+            'command': 'python mass_save_refine.py -i RawElectricUsage -o ElectricUsage -n ' + common_columns + 'annual_electric_usage_mwh -d {master}',
+            'reads': ['RawElectricUsage'],
+            'writes': ['ElectricUsage'],
+        },
+        {
+            'label': 'Gas Usage',
+            'command': 'python mass_save_refine.py -i RawGasUsage -o GasUsage -n ' + common_columns + 'annual_gas_usage_therms -d {master}',
+            'reads': ['RawGasUsage'],
+            'writes': ['GasUsage'],
+        },
+        {
+            'label': 'Geographic Report',
+            'command': 'python mass_save_refine.py -i RawGeographicReport -o GeographicReport -r zip_code -n annual_electric_usage_mwh,annual_electric_savings_mwh,electric_incentives_$,annual_gas_usage_therms,annual_gas_savings_therms,gas_incentives_$ -z "No gas,Municipal" -p "Protected" -c GeographicReportDropped -d {master}',
+            'reads': ['RawGeographicReport'],
+            'writes': ['GeographicReport', 'GeographicReportDropped'],
+        },
+
+        #
+        # Create table of towns
+        #
+        {
+            'label': 'Towns',
+            'command': 'python mass_save_towns.py -d {master} -p ../xl/mass_save/population_2020.xlsx -e ../xl/mass_save/poverty_rates.xlsx -u ../xl/mass_save/electric_utilities.xlsx -v ../xl/mass_save/gas_utilities.xlsx',
+            'reads': ['ElectricUsage', 'GasUsage', 'GeographicReport'],
+            'writes': ['Towns'],
+        },
+
+        #
+        # Analyze MassSave data
+        #
+        {
+            'label': 'Analyze',
+            'command': 'python mass_save_analyze.py -d {master}',
+            'reads': ['GeographicReport', 'Towns', 'ElectricEesRates', 'GasEesRates'],
+            'writes': ['Analysis'],
+        },
+
+        #
+        # Summarize MassSave data
+        #
+        {
+            'label': 'Summarize Residential',
+            'command': 'python mass_save_summarize.py -s "Residential & Low-Income" -t SummaryResidential -d {master}',
+            'reads': ['Towns', 'Analysis'],
+            'writes': ['SummaryResidential'],
+        },
+        {
+            'label': 'Summarize Commercial',
+            'command': 'python mass_save_summarize.py -s "Commercial & Industrial" -t SummaryCommercial -d {master}',
+            'reads': ['Towns', 'Analysis'],
+            'writes': ['SummaryCommercial'],
+        },
+        {
+            'label': 'Summarize Total',
+            'command': 'python mass_save_summarize.py -s "Total" -t SummaryTotal -d {master}',
+            'reads': ['Towns', 'Analysis'],
+            'writes': ['SummaryTotal'],
+        },
+
+        #
+        # Calculate statistics
+        #
+        {
+            'label': 'Cost per Saved Therm',
+            'command': 'python mass_save_cost_per_saved_therm.py -t CostPerSavedTherm -d {master}',
+            'reads': ['Analysis'],
+            'writes': ['CostPerSavedTherm'],
+        },
+        {
+            'label': 'Cost per Saved MWh',
+            'command': 'python mass_save_cost_per_saved_mwh.py -t CostPerSavedMwh -d {master}',
+            'reads': ['Analysis'],
+            'writes': ['CostPerSavedMwh'],
+        },
+
+        #
+        # Semiannual Reports
+        #
+        {
+            'label': 'Equity Zip Codes',
+            'command': 'python xl_to_db.py -i ../xl/mass_save/equity_zip_codes.xlsx -z -t EquityZipCodes -o {master}',
+            'writes': ['EquityZipCodes'],
+        },
+        {
+            'label': 'Raw Semiannual Reports',
+            'command': 'python xl_to_db.py -d ../xl/mass_save/semiannual_report -a "Wxn & HPs by Zip" -r 6 -m -l year,quarter -t RawSemiannualReport -o {master}',
+            'writes': ['RawSemiannualReport'],
+        },
+        {
+            'label': 'Analyze Semiannual Reports',
+            'command': 'python mass_save_semiannual_report.py -d {master}',
+            'reads': ['RawSemiannualReport', 'EquityZipCodes'],
+            'writes': ['SemiannualReport'],
+        },
+    ]
 
     #
     # Participation Reports
     #
-
-    s_sector = util.SECTOR_COM_AND_IND.split()[0].lower()
-    s_sector_cap = s_sector.capitalize()
-    s_fuel = util.ELECTRIC.lower()
-    s_fuel_cap = s_fuel.capitalize()
-    s_dir = f'/{s_sector}/{s_fuel}'
-    s_table = f'RawParticipation{s_sector_cap}{s_fuel_cap}'
-
-    print( f'\n=======> Participation Report: {s_sector_cap} {s_fuel_cap}' )
-    os.system( 'python xl_to_db.py -d ../xl/mass_save/participation_report{0} -l year -t {1} -o {2}'.format( s_dir, s_table, args.output_filename ) )
-
-    s_fuel = util.GAS.lower()
-    s_fuel_cap = s_fuel.capitalize()
-    s_dir = f'/{s_sector}/{s_fuel}'
-    s_table = f'RawParticipation{s_sector_cap}{s_fuel_cap}'
-
-    print( f'\n=======> Participation Report: {s_sector_cap} {s_fuel_cap}' )
-    os.system( 'python xl_to_db.py -d ../xl/mass_save/participation_report{0} -l year -t {1} -o {2}'.format( s_dir, s_table, args.output_filename ) )
-
-    s_sector = util.SECTOR_RES_AND_LOW.split()[0].lower()
-    s_sector_cap = s_sector.capitalize()
-    s_fuel = util.ELECTRIC.lower()
-    s_fuel_cap = s_fuel.capitalize()
-    s_dir = f'/{s_sector}/{s_fuel}'
-    s_table = f'RawParticipation{s_sector_cap}{s_fuel_cap}'
-
-    print( f'\n=======> Participation Report: {s_sector_cap} {s_fuel_cap}' )
-    os.system( 'python xl_to_db.py -d ../xl/mass_save/participation_report{0} -l year -t {1} -o {2}'.format( s_dir, s_table, args.output_filename ) )
-
-    s_fuel = util.GAS.lower()
-    s_fuel_cap = s_fuel.capitalize()
-    s_dir = f'/{s_sector}/{s_fuel}'
-    s_table = f'RawParticipation{s_sector_cap}{s_fuel_cap}'
-
-    print( f'\n=======> Participation Report: {s_sector_cap} {s_fuel_cap}' )
-    os.system( 'python xl_to_db.py -d ../xl/mass_save/participation_report{0} -l year -t {1} -o {2}'.format( s_dir, s_table, args.output_filename ) )
-
-    print( '\n=======> Clean Participation Reports' )
-    os.system( 'python mass_save_participation_report.py -d {0}'.format( args.output_filename ) )
-
+    ls_participation = []
+
+    for s_sector in [util.SECTOR_COM_AND_IND, util.SECTOR_RES_AND_LOW]:
+        s_sector = s_sector.split()[0].lower()
+        s_sector_cap = s_sector.capitalize()
+
+        for s_fuel in [util.ELECTRIC, util.GAS]:
+            s_fuel = s_fuel.lower()
+            s_fuel_cap = s_fuel.capitalize()
+            s_dir = f'/{s_sector}/{s_fuel}'
+            s_table = f'Participation{s_sector_cap}{s_fuel_cap}'
+
+            ls_steps.append(
+                {
+                    'label': f'Participation Report: {s_sector_cap} {s_fuel_cap}',
+                    'command': f'python xl_to_db.py -d ../xl/mass_save/participation_report{s_dir} -l year -t Raw{s_table} -o {{master}}',
+                    'writes': [f'Raw{s_table}'],
+                }
+            )
+            ls_participation.append( s_table )
+
+    ls_steps.append(
+        {
+            'label': 'Clean Participation Reports',
+            'command': 'python mass_save_participation_report.py -d {master}',
+            'reads': [ 'Raw' + s for s in ls_participation ],
+            'writes': ls_participation,
+        }
+    )
+
+    # Run the build graph
+    pipeline.run_steps( ls_steps, args.output_filename, n_workers=args.workers, b_force=args.force, b_in_process=args.in_process )
 
     # Generate copyright notice
     print( '\n=======> Copyright' )
@@ -95,6 +95,9 @@ if __name__ == '__main__':
     # Read raw table from database
     df = pd.read_sql_table( args.input_table_name, engine, index_col=util.ID, parse_dates=True )
 
+    # Order rows by Vision ID; the scraper appends them in the order it finds them
+    df = df.sort_values( by=[VSID] )
+
     # Clean up data
     df[ACCT] = vision.clean_string( df[ACCT] )
     df[MBLU] = vision.clean_string( df[MBLU], remove_all_spaces=True )
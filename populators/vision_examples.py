@@ -2,10 +2,6 @@
 
 import argparse
 import os
-import requests
-from bs4 import BeautifulSoup
-
-import warnings
 
 import pandas as pd
 pd.set_option( 'display.max_columns', 500 )
@@ -16,6 +12,7 @@ sys.path.append( '../util' )
 import printctl
 import util
 import vision
+import vision_archive
 
 
 LABEL = 'label'
@@ -27,30 +24,23 @@ SAVE_FREQUENCY = 50
 
 
 # Extract label examples from building tables on current HTML page
-def extract_labels( soup, ls_building_ids, town_l, df_labels, ls_labels ):
+def extract_labels( page, ls_building_ids, town_l, df_labels, ls_labels ):
 
     for dc_ids in ls_building_ids:
-        table = soup.find( 'table', id=dc_ids[vision.BUILDING_TABLE_ID] )
-
-        if table:
-            # Iterate over rows
-            trs = table.find_all( 'tr' )
-            for tr in trs:
 
-                # If current row has 2 cells...
-                tds = tr.find_all( 'td' )
-                if ( len( tds ) == 2 ):
-                    s_label = tds[0].string.strip()
-                    s_value = tds[1].string.strip()
+        # Iterate over rows that have 2 cells
+        for s_cell_label, s_cell_value in page.building_rows( dc_ids[vision.BUILDING_TABLE_ID] ):
+            s_label = ( s_cell_label or '' ).strip()
+            s_value = ( s_cell_value or '' ).strip()
 
-                    # If we are interested in this label and value is not empty...
-                    if s_label in ls_labels and s_value not in ['', '0']:
+            # If we are interested in this label and value is not empty...
+            if s_label in ls_labels and s_value not in ['', '0']:
 
-                        # Save the example in the dataframe
-                        df_labels = df_labels.append( { LABEL: tds[0].string, VALUE: s_value, VSID: vision_id }, ignore_index=True )
+                # Save the example in the dataframe
+                df_labels = df_labels.append( { LABEL: s_cell_label, VALUE: s_value, VSID: vision_id }, ignore_index=True )
 
-                        # As soon as we have a non-empty example for this vision_id, quit the loop
-                        break
+                # As soon as we have a non-empty example for this vision_id, quit the loop
+                break
 
     df_labels = df_labels.drop_duplicates()
     return df_labels
@@ -77,6 +67,8 @@ if __name__ == '__main__':
     parser.add_argument( '-t', dest='town',  help='Town to search', required=True )
     parser.add_argument( '-e', dest='example_labels',  help='Example labels to find', required=True )
     parser.add_argument( '-c', dest='create', action='store_true', help='Create new database?' )
+    parser.add_argument( '-a', dest='offline', action='store_true', help='Re-parse pages from archive instead of fetching them?' )
+    parser.add_argument( '-u', dest='site_url', help='URL of stand-in for Vision site, such as http://localhost:8765' )
     args = parser.parse_args()
 
     # Open the output database
@@ -101,7 +93,7 @@ if __name__ == '__main__':
     id_range = df[util.VISION_ID].to_list()
 
     # Prepare URL base
-    url_base = vision.URL_BASE.format( town_l )
+    url_base = vision.format_url_base( town_l, args.site_url )
 
     # Initialize list of labels
     ls_labels = args.example_labels.split( ',' )
@@ -111,14 +103,17 @@ if __name__ == '__main__':
     print( '' )
     save_counter = 0
 
-    # Iterate over vision IDs for current town
-    for vision_id in id_range:
+    # Fetch pages, or read them from the archive
+    if args.offline:
+        pages = vision_archive.read_pages( town_l, id_range )
+    else:
+        pages = vision.fetch_pages( url_base, id_range )
 
-        url = url_base + str( vision_id )
+    # Iterate over vision IDs for current town
+    for vision_id, future in pages:
 
-        warnings.filterwarnings( 'ignore' )
         try:
-            rsp = requests.get( url, verify=False )
+            html = future.result()
         except Exception as e:
             print( '' )
             print( '==>' )
@@ -126,20 +121,23 @@ if __name__ == '__main__':
             print( '==> {}'.format( str( e ) ) )
             print( '==>' )
             exit()
-        warnings.resetwarnings()
 
-        # If we got the URL we requested...
-        if ( rsp.url == url ):
+        # If we got the page we requested...
+        if html is not None:
+
+            # Archive the page
+            if not args.offline:
+                vision_archive.store_page( town_l, vision_id, html )
 
             # Parse the HTML
-            soup = BeautifulSoup( rsp.text, 'html.parser' )
+            page = vision.ParcelPage( html )
 
             # Find IDs of all building tables
-            building_count = vision.scrape_element( soup, 'span', 'MainContent_lblBldCount' )
-            ls_building_ids, not_used_1, not_used_2, not_used_3 = vision.find_all_building_ids( soup, building_count )
+            building_count = page.scrape_element( 'span', 'MainContent_lblBldCount' )
+            ls_building_ids, not_used_1, not_used_2, not_used_3 = page.find_all_building_ids( building_count )
 
             # Extract labels from tables
-            df_labels = extract_labels( soup, ls_building_ids, town_l, df_labels, ls_labels )
+            df_labels = extract_labels( page, ls_building_ids, town_l, df_labels, ls_labels )
 
         # Periodically save progress
         save_counter += 1
@@ -2,10 +2,6 @@
 
 import argparse
 import os
-import requests
-from bs4 import BeautifulSoup
-
-import warnings
 
 import pandas as pd
 pd.set_option( 'display.max_columns', 500 )
@@ -16,6 +12,7 @@ sys.path.append( '../util' )
 import printctl
 import util
 import vision
+import vision_archive
 
 
 LABEL = 'label'
@@ -25,21 +22,15 @@ SAVE_FREQUENCY = 50
 
 
 # Extract labels from building tables on current HTML page
-def extract_labels( soup, ls_building_ids, town_l, df_labels ):
+def extract_labels( page, ls_building_ids, town_l, df_labels ):
 
     for dc_ids in ls_building_ids:
-        table = soup.find( 'table', id=dc_ids[vision.BUILDING_TABLE_ID] )
 
-        if table:
-            # Iterate over rows
-            trs = table.find_all( 'tr' )
-            for tr in trs:
-                # If current row has 2 cells and first cell matches label...
-                tds = tr.find_all( 'td' )
-                if ( len( tds ) == 2 ):
+        # Iterate over rows that have 2 cells
+        for s_label, s_value in page.building_rows( dc_ids[vision.BUILDING_TABLE_ID] ):
 
-                    # Save the label in the dataframe
-                    df_labels = df_labels.append( { LABEL: tds[0].string }, ignore_index=True )
+            # Save the label in the dataframe
+            df_labels = df_labels.append( { LABEL: s_label }, ignore_index=True )
 
     df_labels = df_labels.drop_duplicates()
     return df_labels
@@ -65,6 +56,8 @@ if __name__ == '__main__':
     parser.add_argument( '-l', dest='label_filename',  help='Output filename - Name of label database file', required=True )
     parser.add_argument( '-t', dest='towns',  help='List of towns to include', required=True )
     parser.add_argument( '-c', dest='create', action='store_true', help='Create new database?' )
+    parser.add_argument( '-a', dest='offline', action='store_true', help='Re-parse pages from archive instead of fetching them?' )
+    parser.add_argument( '-u', dest='site_url', help='URL of stand-in for Vision site, such as http://localhost:8765' )
     args = parser.parse_args()
 
     # Retrieve list of towns
@@ -96,19 +89,22 @@ if __name__ == '__main__':
         id_range = df[util.VISION_ID].to_list()
 
         # Prepare URL base
-        url_base = vision.URL_BASE.format( town )
+        url_base = vision.format_url_base( town, args.site_url )
 
         print( '' )
         save_counter = 0
 
-        # Iterate over vision IDs for current town
-        for vision_id in id_range:
+        # Fetch pages, or read them from the archive
+        if args.offline:
+            pages = vision_archive.read_pages( town_l, id_range )
+        else:
+            pages = vision.fetch_pages( url_base, id_range )
 
-            url = url_base + str( vision_id )
+        # Iterate over vision IDs for current town
+        for vision_id, future in pages:
 
-            warnings.filterwarnings( 'ignore' )
             try:
-                rsp = requests.get( url, verify=False )
+                html = future.result()
             except Exception as e:
                 print( '' )
                 print( '==>' )
@@ -116,20 +112,23 @@ if __name__ == '__main__':
                 print( '==> {}'.format( str( e ) ) )
                 print( '==>' )
                 exit()
-            warnings.resetwarnings()
 
-            # If we got the URL we requested...
-            if ( rsp.url == url ):
+            # If we got the page we requested...
+            if html is not None:
+
+                # Archive the page
+                if not args.offline:
+                    vision_archive.store_page( town_l, vision_id, html )
 
                 # Parse the HTML
-                soup = BeautifulSoup( rsp.text, 'html.parser' )
+                page = vision.ParcelPage( html )
 
                 # Find IDs of all building tables
-                building_count = vision.scrape_element( soup, 'span', 'MainContent_lblBldCount' )
-                ls_building_ids, not_used_1, not_used_2, not_used_3 = vision.find_all_building_ids( soup, building_count )
+                building_count = page.scrape_element( 'span', 'MainContent_lblBldCount' )
+                ls_building_ids, not_used_1, not_used_2, not_used_3 = page.find_all_building_ids( building_count )
 
                 # Extract labels from tables
-                df_labels = extract_labels( soup, ls_building_ids, town_l, df_labels )
+                df_labels = extract_labels( page, ls_building_ids, town_l, df_labels )
 
             # Periodically save progress
             save_counter += 1
@@ -1,86 +1,35 @@
 # Copyright 2023 Energize Andover.  All rights reserved.
 
 import argparse
-import requests
-from bs4 import BeautifulSoup
 
-import warnings
-
-import pandas as pd
-pd.set_option( 'display.max_columns', 500 )
-pd.set_option( 'display.width', 1000 )
-
-import re
 import signal
+import bisect
+import datetime
+import urllib.parse
 
 import sys
 sys.path.append('../util')
 import util
 import vision
-import printctl
+import vision_archive
 
 SAVE_INTERVAL = 500
 
 CONTINUE_AT_TABLE = '_ContinueAtVisionId'
+PARSED_PAGES_TABLE = '_ParsedVisionPages'
+EMPTY_RANGES_TABLE = '_EmptyVisionIdRanges'
 
-#
-# Lists of labels that we use to identify values of interest in HTML tables.
-# - To determine whether these lists need to be updated, run vision_labels.py.
-# - To determine whether a specific town uses one or more specific labels, run vision_examples.py.
-#
+PAGE_DIGEST = 'page_digest'
+PARSER_VERSION = 'parser_version'
+FIRST_VSID = 'first_' + util.VISION_ID
+LAST_VSID = 'last_' + util.VISION_ID
+RECORDED_AT = 'recorded_at'
 
-LS_STYL = \
-[
-    'STYLE',
-    'Style',
-    'Style:',
-]
-LS_OCCU = \
-[
-    'Occupancy',
-]
-LS_HEAT = \
-[
-    'Heat Type:',
-    'Heating Type',
-]
-LS_FUEL = \
-[
-    'Heat Fuel',
-    'Heat Fuel:',
-    'Heating Fuel',
-]
-LS_AIRC = \
-[
-    'AC Type',
-    'AC Type:',
-]
-LS_HTAC = \
-[
-    'Heat/AC',
-]
-LS_FLR1 = \
-[
-    '1st Floor Use:',
-]
-LS_RESU = \
-[
-    'Res/Com Units:',
-    'Residential Units',
-    'Residential Units:',
-]
-LS_KTCH = \
-[
-    'Num Kitchens',
-    'Total Kitchens',
-]
-LS_BATH = \
-[
-    'Total Baths',
-    'Total Bthrms:',
-    'Total Full Bthrms:',
-    'Ttl Bathrms:',
-]
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Discovery probes a sample of IDs in each block, then requests every ID of blocks in which a parcel was found, and of blocks next to them
+DISCOVERY_BLOCK_SIZE = 100
+DISCOVERY_WINDOW_BLOCKS = 10
 
 # Column labels
 VSID = util.VISION_ID
@@ -155,130 +104,201 @@ COLS = \
 ]
 
 
-def save_continue_at():
+# Columns of tables that hold scraped rows and progress
+def get_table_columns():
+    return \
+    {
+        parcels_table_name: COLS,
+        PARSED_PAGES_TABLE: [VSID, PAGE_DIGEST, PARSER_VERSION],
+        EMPTY_RANGES_TABLE: [FIRST_VSID, LAST_VSID, RECORDED_AT],
+        CONTINUE_AT_TABLE: [VSID],
+    }
 
-    # If not running in refresh mode, update continue-at table
-    if not args.refresh:
-        printctl.off()
-        util.create_table( CONTINUE_AT_TABLE, conn, cur, df=pd.DataFrame( data={ VSID: [vision_id] } ) )
-        printctl.on()
 
+# Create tables that hold scraped rows and progress, if they do not already exist
+def create_tables():
 
-def save_progress( df ):
+    ls_int_columns = [VSID, FIRST_VSID, LAST_VSID]
 
-    if len( df ):
+    for table_name, columns in get_table_columns().items():
+        create_sql = 'CREATE TABLE IF NOT EXISTS ' + table_name + ' ( id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE'
+        for col_name in columns:
+            create_sql += ', "{0}" {1}'.format( col_name, 'INT' if col_name in ls_int_columns else 'TEXT' )
+        create_sql += ' )'
+        cur.execute( create_sql )
 
-        # Reorganize rows
-        df[VSID] = df[VSID].astype( int )
-        df = df.drop_duplicates( subset=[VSID], keep='last' )
-        df = df.sort_values( by=[VSID] )
+    # Empty ranges recorded by earlier versions have no timestamp, and are treated as expired
+    ls_range_columns = [row[1] for row in cur.execute( 'PRAGMA table_info( {} )'.format( EMPTY_RANGES_TABLE ) )]
+    if RECORDED_AT not in ls_range_columns:
+        cur.execute( 'ALTER TABLE {0} ADD COLUMN "{1}" TEXT'.format( EMPTY_RANGES_TABLE, RECORDED_AT ) )
 
-        # Report size of output
-        print( '' )
-        print( 'Saving {} VISION IDs'.format( len( df ) ) )
+    # Rows are keyed by Vision ID; tables written by earlier versions may need to be indexed
+    for table_name in [parcels_table_name, PARSED_PAGES_TABLE]:
+        index_name = '{0}_{1}'.format( table_name, VSID )
+        if not cur.execute( "SELECT 1 FROM sqlite_master WHERE type='index' AND name=?", ( index_name, ) ).fetchone():
+            cur.execute( 'DELETE FROM {0} WHERE id NOT IN ( SELECT MAX( id ) FROM {0} GROUP BY "{1}" )'.format( table_name, VSID ) )
+            cur.execute( 'CREATE UNIQUE INDEX {0} ON {1} ( "{2}" )'.format( index_name, table_name, VSID ) )
 
-        # Preserve current progress in database
-        util.create_table( parcels_table_name, conn, cur, df=df )
-        print( '' )
+    conn.commit()
 
-    # Save vision ID at which to continue discovery
-    save_continue_at()
 
+# Generate SQL to insert rows, replacing values of rows with the same key, which is the first column
+def make_upsert_sql( table_name, columns ):
+    s_columns = ', '.join( '"{0}"'.format( col_name ) for col_name in columns )
+    s_values = ', '.join( ['?'] * len( columns ) )
+    s_updates = ', '.join( '"{0}"=excluded."{0}"'.format( col_name ) for col_name in columns[1:] )
+    return 'INSERT INTO {0} ( {1} ) VALUES ( {2} ) ON CONFLICT ( "{3}" ) DO UPDATE SET {4}'.format( table_name, s_columns, s_values, columns[0], s_updates )
 
-b_save_and_exit_done = False
-def save_and_exit( signum, frame ):
 
-    # Suppress repeat execution of handler
-    global b_save_and_exit_done
-    if b_save_and_exit_done:
-        sys.exit()
-    else:
-        b_save_and_exit_done = True
+# Record range of Vision IDs known to be empty, merging it with overlapping and adjacent ranges
+# - A merged range keeps the earliest timestamp of the ranges it covers, so that it expires no later than any of them
+def add_empty_range( first_id, last_id, recorded_at=None ):
 
-    # Report current status
-    print( '' )
-    print( 'Stopping at VISION ID {}'.format( vision_id ) )
+    first_id = int( first_id )
+    last_id = int( last_id )
+    recorded_at = recorded_at or datetime.datetime.now().strftime( TIMESTAMP_FORMAT )
 
-    # Save what we have scraped
-    save_progress( df )
+    # Find sorted ranges that overlap or adjoin the new one, and replace them with their union
+    i_first = bisect.bisect_left( ls_empty_lasts, first_id - 1 )
+    i_last = bisect.bisect_right( ls_empty_firsts, last_id + 1 )
+    ls_covered = ls_empty_ranges[i_first:i_last] + [( first_id, last_id, recorded_at )]
+    merged = ( min( r[0] for r in ls_covered ), max( r[1] for r in ls_covered ), min( r[2] for r in ls_covered ) )
 
-    # Report elapsed time
-    util.report_elapsed_time()
-    sys.exit()
+    ls_empty_ranges[i_first:i_last] = [merged]
+    ls_empty_firsts[i_first:i_last] = [merged[0]]
+    ls_empty_lasts[i_first:i_last] = [merged[1]]
+
+
+# Determine whether Vision ID lies in a range known to be empty
+def is_known_empty( n ):
+    i = bisect.bisect_right( ls_empty_firsts, n ) - 1
+    return ( i >= 0 ) and ( n <= ls_empty_ranges[i][1] )
+
+
+# Discover parcels adaptively, yielding ( vision_id, future ) pairs like vision.fetch_pages()
+# - Only IDs that were requested and found empty are recorded as empty, so IDs left unprobed are tried again by later runs
+def discover_pages( range_min, range_max ):
+
+    global continue_at_id
+    global n_skipped
+
+    # Results of requested IDs, by Vision ID: whether a parcel was found
+    dc_found = {}
 
+    # Blocks carried from previous windows, as [block range, IDs to request, fully requested?, parcel found?]
+    # - The last block, and the unfilled blocks before it, are filled in turn if parcels are found next to them
+    ls_prev_blocks = []
 
-# Scrape cell of Building Attributes table, identified by label regex
-def scrape_building_attribute( soup, building_id, ls_labels, is_numeric=False ):
+    window_size = DISCOVERY_BLOCK_SIZE * DISCOVERY_WINDOW_BLOCKS
 
-    s_attribute = ''
+    for window_start in range( range_min, range_max, window_size ):
 
-    table = soup.find( 'table', id=building_id )
+        window_end = min( window_start + window_size, range_max )
 
-    if table:
-        # Iterate over rows
-        trs = table.find_all( 'tr' )
-        for tr in trs:
-            # If current row has 2 cells and first cell matches label...
-            tds = tr.find_all( 'td' )
-            if ( len( tds ) == 2 ) and ( tds[0].string in ls_labels ):
-                # Save the attribute and terminate search
-                s_attribute = str( tds[1].string ).strip()
-                break
+        # Find IDs of each block in window that are not known to be empty
+        ls_blocks = list( ls_prev_blocks )
+        for block_start in range( window_start, window_end, DISCOVERY_BLOCK_SIZE ):
+            block_range = range( block_start, min( block_start + DISCOVERY_BLOCK_SIZE, window_end ) )
+            ls_ids = [n for n in block_range if not is_known_empty( n )]
+            n_skipped += len( block_range ) - len( ls_ids )
+            ls_blocks.append( [block_range, ls_ids, False, False] )
 
-    if is_numeric:
+        # If interrupted, resume at the start of the first block, including blocks carried from previous windows
+        continue_at_id = ls_blocks[0][0][0]
 
-        # Replace letter O with zero (e.g. 'O1' - thanks, Tewksbury)
-        s_attribute = s_attribute.replace( 'O', '0' )
+        # Probe every nth ID, and the last, of each new block
+        ls_requested_blocks = list( range( len( ls_prev_blocks ), len( ls_blocks ) ) )
+        ls_requests = [n for i_block in ls_requested_blocks for n in ls_blocks[i_block][1] if ( ( n - ls_blocks[i_block][0][0] ) % args.probe_stride == 0 ) or ( n == ls_blocks[i_block][0][-1] )]
 
-        # Strip trailing non-numeric text (e.g. '2 Full' - thanks, Quincy)
-        s_attribute = re.sub( r'(^\d+)(.*)', r'\1', s_attribute )
+        # Blocks whose neighbours are to be checked, starting with the last carried block, whose parcels may adjoin new blocks
+        ls_checked_blocks = ls_requested_blocks + ( [len( ls_prev_blocks ) - 1] if ls_prev_blocks else [] )
 
-    return s_attribute
+        while ls_requests:
 
+            for vision_id, future in vision.fetch_pages( url_base, ls_requests, n_workers=args.workers, session=session, limiter=limiter ):
+                yield vision_id, future
+                dc_found[vision_id] = future.result() is not None
 
-# Scrape and summarize building values
-def scrape_buildings( soup, ls_building_ids, sr_row ):
+                # Remember requested ID as empty, unless it held a parcel when last scraped
+                if not dc_found[vision_id] and ( vision_id not in st_vision_ids ):
+                    add_empty_range( vision_id, vision_id )
 
-    # Initialize tallies
-    n_occu = 0
-    n_bath = 0
-    n_ktch = 0
-    n_area = 0
+            # Note blocks of requested IDs in which parcels were found
+            for i_block in ls_requested_blocks:
+                block = ls_blocks[i_block]
+                block[3] = any( dc_found.get( n ) for n in block[1] )
 
-    for dc_ids in ls_building_ids:
+            # Request remaining IDs of blocks in which parcels were found, and of blocks next to them
+            st_fill = set()
+            for i_block in ls_checked_blocks:
+                if ls_blocks[i_block][3]:
+                    st_fill.update( i for i in range( max( i_block - 1, 0 ), min( i_block + 2, len( ls_blocks ) ) ) if not ls_blocks[i][2] )
 
-        building_id = dc_ids[vision.BUILDING_TABLE_ID]
-        area_id = dc_ids[vision.BUILDING_AREA_ID]
+            ls_requested_blocks = sorted( st_fill )
+            ls_requests = []
+            for i_block in ls_requested_blocks:
+                ls_blocks[i_block][2] = True
+                ls_requests += [n for n in ls_blocks[i_block][1] if n not in dc_found]
+            ls_checked_blocks = ls_requested_blocks
 
-        # Attempt to extract field value and add to total
-        scr_occu = scrape_building_attribute( soup, building_id, LS_OCCU, is_numeric=True )
-        if len( scr_occu ):
-            n_occu += int( float( scr_occu ) )
+        # Carry last block into next window, with unfilled blocks before it, forgetting results of the others
+        i_carry = len( ls_blocks ) - 1
+        while ( i_carry > 0 ) and not ls_blocks[i_carry - 1][2]:
+            i_carry -= 1
+        ls_prev_blocks = ls_blocks[i_carry:]
+        dc_found = { n: dc_found[n] for block in ls_prev_blocks for n in block[1] if n in dc_found }
 
-        # Attempt to extract field value and add to total
-        scr_bath = scrape_building_attribute( soup, building_id, LS_BATH, is_numeric=True )
-        if len( scr_bath ):
-            n_bath += int( float( scr_bath ) )
+    continue_at_id = range_max
 
-        # Attempt to extract field value and add to total
-        scr_ktch = scrape_building_attribute( soup, building_id, LS_KTCH, is_numeric=True )
-        if len( scr_ktch ):
-            n_ktch += int( float( scr_ktch ) )
 
-        # Attempt to extract field value and add to total
-        scr_area = vision.scrape_element( soup, 'span', area_id )
-        if scr_area:
-            s = str( scr_area.string.strip().replace( ',', '' ) )
-            if len( s ):
-                n_area += int( float( s ) )
+# Save buffered rows, with records of parsed pages, empty ranges, and where to continue discovery, in one transaction
+def save_progress():
 
-    # Insert totals in row
-    sr_row[TOT_OCCU] = n_occu
-    sr_row[TOT_BATH] = n_bath
-    sr_row[TOT_KTCH] = n_ktch
-    sr_row[TOT_AREA] = n_area
+    global ls_rows
+    global ls_parsed_rows
 
-    return sr_row
+    # Archive fetched pages first, so that saved rows never refer to pages missing from the archive
+    vision_archive.flush_archive()
+
+    dc_columns = get_table_columns()
+
+    with conn:
+        cur.executemany( make_upsert_sql( parcels_table_name, dc_columns[parcels_table_name] ), ls_rows )
+        cur.executemany( make_upsert_sql( PARSED_PAGES_TABLE, dc_columns[PARSED_PAGES_TABLE] ), ls_parsed_rows )
+
+        cur.execute( 'DELETE FROM ' + EMPTY_RANGES_TABLE )
+        cur.executemany( 'INSERT INTO {0} ( "{1}", "{2}", "{3}" ) VALUES ( ?, ?, ? )'.format( EMPTY_RANGES_TABLE, FIRST_VSID, LAST_VSID, RECORDED_AT ), ls_empty_ranges )
+
+        # If running in discovery mode, update continue-at table
+        if b_discover:
+            cur.execute( 'DELETE FROM ' + CONTINUE_AT_TABLE )
+            cur.execute( 'INSERT INTO {0} ( "{1}" ) VALUES ( ? )'.format( CONTINUE_AT_TABLE, VSID ), ( continue_at_id, ) )
+
+    ls_rows = []
+    ls_parsed_rows = []
+
+
+b_save_and_exit_done = False
+def save_and_exit( signum, frame ):
+
+    # Suppress repeat execution of handler
+    global b_save_and_exit_done
+    if b_save_and_exit_done:
+        sys.exit()
+    else:
+        b_save_and_exit_done = True
+
+    # Report current status
+    print( '' )
+    print( 'Stopping at VISION ID {}'.format( vision_id ) )
+
+    # Save what we have scraped
+    save_progress()
+    print( 'Saved {} VISION IDs'.format( cur.execute( 'SELECT COUNT(*) FROM ' + parcels_table_name ).fetchone()[0] ) )
+
+    # Report elapsed time
+    util.report_elapsed_time()
+    sys.exit()
 
 
 ######################
@@ -291,6 +311,13 @@ if __name__ == '__main__':
     parser.add_argument( '-v', dest='vision_id_range',  help='Range of Vision IDs to request' )
     parser.add_argument( '-c', dest='create', action='store_true', help='Create new database?' )
     parser.add_argument( '-r', dest='refresh', action='store_true', help='Refresh records in existing database?' )
+    parser.add_argument( '-j', dest='workers', type=int, default=1, help='Maximum number of pages to request concurrently' )
+    parser.add_argument( '-q', dest='requests_per_second', type=float, help='Maximum number of requests per second (default: unlimited)' )
+    parser.add_argument( '-a', dest='offline', action='store_true', help='Re-parse pages from archive instead of fetching them?' )
+    parser.add_argument( '-p', dest='probe_stride', type=int, default=10, help='Interval between IDs probed during discovery (1 requests every ID)' )
+    parser.add_argument( '-s', dest='budget_filename', help='File through which -q limit is shared with other processes requesting from the same host' )
+    parser.add_argument( '-u', dest='site_url', help='URL of stand-in for Vision site, such as http://localhost:8765' )
+    parser.add_argument( '-t', dest='empty_ttl_days', type=float, default=30, help='Days after which Vision IDs found empty are requested again (default: 30)' )
     args = parser.parse_args()
 
     # Open the database
@@ -298,18 +325,30 @@ if __name__ == '__main__':
     db_filename = '../db/vision_{}.sqlite'.format( municipality )
     conn, cur, engine = util.open_database( db_filename, args.create )
 
-    # Read pre-existing table from database
+    # Create tables if necessary
     parcels_table_name = 'Vision_Raw_' + municipality.capitalize()
-    try:
-        df = pd.read_sql_table( parcels_table_name, engine, index_col=util.ID, parse_dates=True )
-    except:
-        df = pd.DataFrame( columns=COLS )
+    create_tables()
+
+    # Read Vision IDs of pre-existing rows
+    ls_vision_ids = [row[0] for row in cur.execute( 'SELECT "{0}" FROM {1} ORDER BY "{0}"'.format( VSID, parcels_table_name ) )]
+    st_vision_ids = set( ls_vision_ids )
+
+    # Read record of archived pages from which rows were parsed
+    dc_parsed = {}
+    for vsid, digest, version in cur.execute( 'SELECT "{0}", "{1}", "{2}" FROM {3}'.format( VSID, PAGE_DIGEST, PARSER_VERSION, PARSED_PAGES_TABLE ) ):
+        dc_parsed[vsid] = ( digest, version )
 
-    # Read continuation table from database
-    try:
-        df_continue = pd.read_sql_table( CONTINUE_AT_TABLE, engine, index_col=util.ID, parse_dates=True )
-    except:
-        df_continue = pd.DataFrame()
+    # Read ranges of Vision IDs known to be empty, dropping those that have expired
+    ls_empty_ranges = []
+    ls_empty_firsts = []
+    ls_empty_lasts = []
+    s_expiry = ( datetime.datetime.now() - datetime.timedelta( days=args.empty_ttl_days ) ).strftime( TIMESTAMP_FORMAT )
+    for first_id, last_id, recorded_at in cur.execute( 'SELECT "{0}", "{1}", "{2}" FROM {3}'.format( FIRST_VSID, LAST_VSID, RECORDED_AT, EMPTY_RANGES_TABLE ) ).fetchall():
+        if recorded_at and ( recorded_at >= s_expiry ):
+            add_empty_range( first_id, last_id, recorded_at )
+
+    # Read Vision ID at which to continue discovery
+    ls_continue = [row[0] for row in cur.execute( 'SELECT "{0}" FROM {1}'.format( VSID, CONTINUE_AT_TABLE ) )]
 
     # Determine lower and upper bounds of Vision IDs to request
     if args.vision_id_range:
@@ -322,9 +361,15 @@ if __name__ == '__main__':
     vision_id_range[1] += 1
 
     # Determine range of Vision IDs to request
-    if args.refresh:
+    b_discover = not ( args.refresh or args.offline )
+    if args.offline:
+        # Offline mode - re-parse archived pages, optionally restricted by specified vision ID bounds
+        id_range = list( vision_archive.read_latest_digests( municipality ) )
+        if args.vision_id_range:
+            id_range = [ n for n in id_range if ( ( n >= vision_id_range[0] ) and ( n < vision_id_range[1] ) ) ]
+    elif args.refresh:
         # Refresh mode - update existing records, optionally restricted by specified vision ID bounds
-        id_range = df[VSID].to_list()
+        id_range = ls_vision_ids
         if args.vision_id_range:
             id_range = [ n for n in id_range if ( ( n >= vision_id_range[0] ) and ( n < vision_id_range[1] ) ) ]
     else:
@@ -332,16 +377,19 @@ if __name__ == '__main__':
         if args.create:
             # Create mode - start at lower bound
             range_min = vision_id_range[0]
-        elif len( df_continue ):
+        elif len( ls_continue ):
             # Continue mode - start at saved value
-            range_min = df_continue[VSID].iloc[0]
+            range_min = ls_continue[0]
         else:
             # Continue mode - start value not available, use lower bound
             range_min = vision_id_range[0]
         id_range = range( range_min, vision_id_range[1] )
+        continue_at_id = range_min
 
     print( '' )
-    s_doing_what =  '{} {}'.format( 'Refreshing' , len( id_range ) ) if ( len( df ) and args.refresh ) else 'Discovering'
+    s_doing_what =  '{} {}'.format( 'Refreshing' , len( id_range ) ) if ( len( ls_vision_ids ) and args.refresh ) else 'Discovering'
+    if args.offline:
+        s_doing_what = 'Re-parsing {} archived'.format( len( id_range ) )
     if len( id_range ):
         print( '{} VISION IDs in range {} to {}'.format( s_doing_what, id_range[0], id_range[-1] ) )
     else:
@@ -349,36 +397,53 @@ if __name__ == '__main__':
     print( '' )
 
     # Prepare URL base
-    url_base = vision.URL_BASE.format( municipality )
+    url_base = vision.format_url_base( municipality, args.site_url )
 
     # Initialize counters
-    n_processed = 0 if args.refresh else len( df )
+    n_processed = len( ls_vision_ids ) if b_discover else 0
     n_last_reported = -1
     n_tried = 0
-    n_saved = n_processed
+    n_unchanged = 0
+    n_skipped = 0
     ls_could_not_refresh = []
 
+    # Initialize buffers of rows to be saved
+    ls_rows = []
+    ls_parsed_rows = []
+
     # Set condition handler
     signal.signal( signal.SIGINT, save_and_exit )
 
-    for vision_id in id_range:
+    # Read pages from the archive, or fetch them concurrently through a shared session; parse them here
+    if args.offline:
+        pages = vision_archive.read_pages( municipality, id_range )
+    else:
+        session = vision.make_session( args.workers )
+        limiter = vision.RateLimiter( args.requests_per_second, budget_filename=args.budget_filename, key=urllib.parse.urlparse( url_base ).netloc )
+        if args.refresh:
+            pages = vision.fetch_pages( url_base, id_range, n_workers=args.workers, session=session, limiter=limiter )
+        else:
+            pages = discover_pages( range_min, vision_id_range[1] )
+
+    for vision_id, future in pages:
 
         if ( ( n_processed % 50 == 0 ) and ( n_processed != n_last_reported ) ) or ( n_tried % 100 == 0 ):
             n_last_reported = n_processed
             util.report_elapsed_time( prefix='' )
             s_status = ' Tried {} ({}%) and processed {} ({}%) of {}; requesting VISION ID {}'.format( n_tried, round( 100 * n_tried / len( id_range ), 2 ), n_processed, round( 100 * n_processed / len( id_range ), 2 ), len( id_range ), vision_id )
-            if args.refresh and ( n_tried != n_processed ):
+            if n_unchanged:
+                s_status += '\n {} pages unchanged since last parsed'.format( n_unchanged )
+            if n_skipped:
+                s_status += '\n {} VISION IDs skipped as known to be empty'.format( n_skipped )
+            if ls_could_not_refresh:
                 s_status += '\n !!! Refresh could not process {} VISION IDs: {}'.format( len( ls_could_not_refresh ), ls_could_not_refresh )
             print( s_status )
 
-            # Save current vision ID at which to continue if this process is interrupted
-            save_continue_at()
-
-        url = url_base + str( vision_id )
+            # Save what we have scraped, and where to continue if this process is interrupted
+            save_progress()
 
-        warnings.filterwarnings( 'ignore' )
         try:
-            rsp = requests.get( url, verify=False )
+            html = future.result()
         except Exception as e:
             print( '' )
             print( '==>' )
@@ -386,64 +451,35 @@ if __name__ == '__main__':
             print( '==> {}'.format( str( e ) ) )
             print( '==>' )
             save_and_exit( None, None )
-        warnings.resetwarnings()
-
-        if ( rsp.url == url ):
-
-            # Parse the HTML
-            soup = BeautifulSoup( rsp.text, 'html.parser' )
-
-            # Find IDs of all building tables and areas
-            building_count = vision.scrape_element( soup, 'span', 'MainContent_lblBldCount' )
-            ls_building_ids, first_building_id, first_area_id, first_year_id = vision.find_all_building_ids( soup, building_count )
-
-            # Initialize new dataframe row
-            sr_row = pd.Series( index=COLS, dtype=object )
-            sr_row[VSID] = vision_id
-
-            # Extract values
-            sr_row[ACCT] = vision.scrape_element( soup, 'span', 'MainContent_lblAcctNum' )
-            sr_row[MBLU] = vision.scrape_element( soup, 'span', 'MainContent_lblMblu' )
-            sr_row[LOCN] = vision.scrape_element( soup, 'span', 'MainContent_lblTab1Title' )
-            sr_row[OWN1] = vision.scrape_element( soup, 'span', 'MainContent_lblOwner' )
-            sr_row[OWN2] = vision.scrape_element( soup, 'span', 'MainContent_lblCoOwner' )
-            sr_row[OADR], sr_row[OZIP] = vision.scrape_address( soup, 'span', 'MainContent_lblAddr1' )
-            sr_row[ASMT] = vision.scrape_element( soup, 'span', 'MainContent_lblGenAssessment' )
-            sr_row[STYL] = scrape_building_attribute( soup, first_building_id, LS_STYL )
-            sr_row[OCCU] = scrape_building_attribute( soup, first_building_id, LS_OCCU, is_numeric=True )
-            sr_row[HEAT] = scrape_building_attribute( soup, first_building_id, LS_HEAT )
-            sr_row[FUEL] = scrape_building_attribute( soup, first_building_id, LS_FUEL )
-            sr_row[AIRC] = scrape_building_attribute( soup, first_building_id, LS_AIRC )
-            sr_row[HTAC] = scrape_building_attribute( soup, first_building_id, LS_HTAC )
-            sr_row[FLR1] = scrape_building_attribute( soup, first_building_id, LS_FLR1 )
-            sr_row[RESU] = scrape_building_attribute( soup, first_building_id, LS_RESU )
-            sr_row[KTCH] = scrape_building_attribute( soup, first_building_id, LS_KTCH, is_numeric=True )
-            sr_row[BATH] = scrape_building_attribute( soup, first_building_id, LS_BATH, is_numeric=True )
-            sr_row[LAND] = vision.scrape_element( soup, 'span', 'MainContent_lblUseCode' )
-            sr_row[DESC] = vision.scrape_element( soup, 'span', 'MainContent_lblUseCodeDescription' )
-            sr_row[ACRE] = vision.scrape_element( soup, 'span', 'MainContent_lblLndAcres' )
-            sr_row[SLPR] = vision.scrape_element( soup, 'span', 'MainContent_lblPrice' )
-            sr_row[SLDT] = vision.scrape_element( soup, 'span', 'MainContent_lblSaleDate' )
-            sr_row[ZONE] = vision.scrape_element( soup, 'span', 'MainContent_lblZone' )
-            sr_row[YEAR] = vision.scrape_element( soup, 'span', first_year_id )
-            sr_row[AREA] = vision.scrape_element( soup, 'span', first_area_id )
-            sr_row[BLDS] = building_count
-
-            # Extract summary building values
-            sr_row = scrape_buildings( soup, ls_building_ids, sr_row )
-
-            # Load new row into dataframe
-            df = df.append( sr_row, ignore_index=True )
-
-            # Increment count
-            n_processed += 1
-
-            # Intermittently save what we have scraped
-            if n_processed - n_saved >= SAVE_INTERVAL:
-                save_progress( df )
-                n_saved = n_processed if args.refresh else len( df )
+
+        if html is not None:
+
+            # Archive the page
+            digest = vision_archive.page_digest( html ) if args.offline else vision_archive.store_page( municipality, vision_id, html )
+
+            # If page and parser are unchanged since this row was last parsed, there is nothing to do
+            if dc_parsed.get( vision_id ) == ( digest, vision.PARSER_VERSION ):
+                n_unchanged += 1
+
+            else:
+                # Parse the HTML into a new row
+                dc_record = vision.parse_parcel_page( html )
+                dc_record[VSID] = vision_id
+
+                # Buffer the row for saving
+                ls_rows.append( [dc_record[col_name] for col_name in COLS] )
+                ls_parsed_rows.append( [vision_id, digest, vision.PARSER_VERSION] )
+                dc_parsed[vision_id] = ( digest, vision.PARSER_VERSION )
+
+                # Increment count
+                n_processed += 1
+
+                # Save what we have scraped if buffer is full
+                if len( ls_rows ) >= SAVE_INTERVAL:
+                    save_progress()
 
         elif args.refresh:
+            # Keep the existing row; the page may be missing only temporarily
             ls_could_not_refresh.append( vision_id )
 
         # Increment count
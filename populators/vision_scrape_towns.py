@@ -0,0 +1,252 @@
+# Copyright 2025 Energize Lawrence.  All rights reserved.
+
+import argparse
+import os
+import re
+import sys
+import time
+import signal
+import subprocess
+import threading
+import collections
+
+sys.path.append( '../util' )
+import util
+
+
+#
+# Scrape Vision data for several towns concurrently, by running vision_scrape.py once per town and queue.
+# - Refresh of existing Vision IDs and discovery of new Vision IDs are separate queues; refresh jobs start first.
+# - Jobs for one town run one at a time, because they write the same database.
+# - All jobs share one request budget for the Vision host, through a budget file.
+# - Progress and throughput of all jobs are reported together in one table.
+#
+
+REFRESH = 'refresh'
+DISCOVERY = 'discovery'
+
+# Queues in order of priority, with the vision_scrape.py options that select them
+QUEUES = \
+{
+    REFRESH: ['-r'],
+    DISCOVERY: [],
+}
+
+# Job states
+WAITING = 'waiting'
+RUNNING = 'running'
+DONE = 'done'
+NOTHING_TO_DO = 'nothing to do'
+FAILED = 'failed'
+
+BUDGET_FILENAME = '../db/vision_budget.sqlite'
+DB_FILENAME_FORMAT = '../db/vision_{}.sqlite'
+TAIL_LINES = 20
+
+# Lines printed by vision_scrape.py
+STATUS_PATTERN = re.compile( r' Tried (\d+) \(.*\) and processed (\d+) \(.*\) of (\d+)' )
+SAVED_PATTERN = re.compile( r'^Saved (\d+) VISION IDs' )
+NOTHING_TO_DO_PATTERN = re.compile( r'^No VISION IDs to process' )
+EXCEPTION_PATTERN = re.compile( r'Exiting due to exception' )
+
+
+# Make job to run one queue of one town
+def make_job( town, queue ):
+
+    job = \
+    {
+        'town': town,
+        'queue': queue,
+        'status': WAITING,
+        'tried': 0,
+        'processed': 0,
+        'total': 0,
+        'saved': None,
+        'start_time': None,
+        'end_time': None,
+        'b_exception': False,
+        'b_nothing_to_do': False,
+        'tail': collections.deque( maxlen=TAIL_LINES ),
+        'process': None,
+        'reader': None,
+    }
+
+    return job
+
+
+# Collect output of running job, updating its progress counters
+def read_job_output( job ):
+
+    for line in job['process'].stdout:
+
+        line = line.rstrip()
+        job['tail'].append( line )
+
+        match = STATUS_PATTERN.search( line )
+        if match:
+            job['tried'], job['processed'], job['total'] = [int( s ) for s in match.groups()]
+
+        match = SAVED_PATTERN.search( line )
+        if match:
+            job['saved'] = int( match.group( 1 ) )
+
+        if NOTHING_TO_DO_PATTERN.search( line ):
+            job['b_nothing_to_do'] = True
+
+        if EXCEPTION_PATTERN.search( line ):
+            job['b_exception'] = True
+
+
+# Start vision_scrape.py for job
+def start_job( job ):
+
+    command = [sys.executable, '-u', 'vision_scrape.py', '-m', job['town'], '-j', str( args.workers )] + QUEUES[job['queue']]
+    if args.vision_id_range:
+        command += ['-v', args.vision_id_range]
+    if args.probe_stride:
+        command += ['-p', str( args.probe_stride )]
+    if args.site_url:
+        command += ['-u', args.site_url]
+    if args.requests_per_second:
+        command += ['-q', str( args.requests_per_second ), '-s', BUDGET_FILENAME]
+
+    job['process'] = subprocess.Popen( command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True )
+    job['reader'] = threading.Thread( target=read_job_output, args=( job, ), daemon=True )
+    job['reader'].start()
+    job['status'] = RUNNING
+    job['start_time'] = time.time()
+
+
+# Record outcome of job if it has finished
+def check_job( job ):
+
+    if job['process'].poll() is None:
+        return False
+
+    job['reader'].join()
+    job['end_time'] = time.time()
+
+    if job['b_nothing_to_do']:
+        job['status'] = NOTHING_TO_DO
+    elif job['process'].returncode or job['b_exception']:
+        job['status'] = FAILED
+        print( '' )
+        print( '!!! {} {} failed; last output:'.format( job['town'], job['queue'] ) )
+        for line in job['tail']:
+            print( '  ' + line )
+    else:
+        job['status'] = DONE
+
+    return True
+
+
+# Determine whether job may start now
+def is_ready( job, ls_jobs, n_running ):
+
+    if ( job['status'] != WAITING ) or ( args.towns_at_once and ( n_running >= args.towns_at_once ) ):
+        return False
+
+    for other in ls_jobs:
+        if other['town'] == job['town']:
+            # Another job for this town is running, or an earlier queue of this town has not finished
+            if ( other['status'] == RUNNING ) or ( ( other['status'] == WAITING ) and ( list( QUEUES ).index( other['queue'] ) < list( QUEUES ).index( job['queue'] ) ) ):
+                return False
+
+    return True
+
+
+# Report progress and throughput of all jobs
+def report_progress( ls_jobs ):
+
+    print( '' )
+    print( '=======> Vision scrape progress' )
+    util.report_elapsed_time( prefix='' )
+    print( '' )
+    print( ' {:<16}{:<11}{:<15}{:>10}{:>11}{:>10}{:>10}{:>9}'.format( 'Town', 'Queue', 'Status', 'Tried', 'Processed', 'Total', 'Saved', 'Pages/s' ) )
+
+    n_tried = 0
+    n_processed = 0
+
+    for job in ls_jobs:
+
+        f_job_rate = 0
+        if job['start_time']:
+            f_elapsed = ( job['end_time'] or time.time() ) - job['start_time']
+            f_job_rate = job['tried'] / f_elapsed if f_elapsed else 0
+
+        n_tried += job['tried']
+        n_processed += job['processed']
+
+        s_saved = '' if job['saved'] is None else str( job['saved'] )
+        print( ' {:<16}{:<11}{:<15}{:>10}{:>11}{:>10}{:>10}{:>9.2f}'.format( job['town'], job['queue'], job['status'], job['tried'], job['processed'], job['total'], s_saved, f_job_rate ) )
+
+    print( ' {:<42}{:>10}{:>11}{:>20}{:>9.2f}'.format( 'All towns', n_tried, n_processed, '', n_tried / ( time.time() - util.START_TIME ) ) )
+    sys.stdout.flush()
+
+
+######################
+
+# Main program
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser( description='Scrape parcel assessment data of several towns from Vision Government Solutions website' )
+    parser.add_argument( '-t', dest='towns', help='Comma-separated list of municipalities in MA', required=True )
+    parser.add_argument( '-q', dest='requests_per_second', type=float, default=4, help='Maximum number of requests per second to Vision host, shared by all towns (0 for unlimited)' )
+    parser.add_argument( '-j', dest='workers', type=int, default=2, help='Maximum number of pages to request concurrently per town' )
+    parser.add_argument( '-n', dest='towns_at_once', type=int, help='Maximum number of towns to scrape at once (default: all)' )
+    parser.add_argument( '-v', dest='vision_id_range',  help='Range of Vision IDs to request' )
+    parser.add_argument( '-p', dest='probe_stride', type=int, help='Interval between IDs probed during discovery' )
+    parser.add_argument( '-u', dest='site_url', help='URL of stand-in for Vision site, such as http://localhost:8765' )
+    parser.add_argument( '-i', dest='report_interval', type=float, default=60, help='Seconds between progress reports' )
+    args = parser.parse_args()
+
+    # Make jobs, in order of priority; refresh only towns that have been scraped before
+    ls_towns = [s.strip().lower() for s in args.towns.split( ',' ) if s.strip()]
+    ls_jobs = []
+    for queue in QUEUES:
+        for town in ls_towns:
+            if ( queue != REFRESH ) or os.path.exists( DB_FILENAME_FORMAT.format( town ) ):
+                ls_jobs.append( make_job( town, queue ) )
+
+    print( '' )
+    print( 'Scraping {} towns: {}'.format( len( ls_towns ), ', '.join( ls_towns ) ) )
+    if args.requests_per_second:
+        print( 'Sharing limit of {} requests per second to Vision host'.format( args.requests_per_second ) )
+
+    # Interrupts are also delivered to jobs, which save their progress and exit; wait for them to finish
+    b_interrupted = False
+    def interrupt( signum, frame ):
+        global b_interrupted
+        b_interrupted = True
+    signal.signal( signal.SIGINT, interrupt )
+
+    # Run jobs until all are finished
+    last_report_time = time.time()
+
+    while any( job['status'] in ( WAITING, RUNNING ) for job in ls_jobs ):
+
+        # Collect finished jobs
+        for job in ls_jobs:
+            if job['status'] == RUNNING:
+                check_job( job )
+
+        # Start ready jobs in order of priority
+        if not b_interrupted:
+            for job in ls_jobs:
+                n_running = len( [other for other in ls_jobs if other['status'] == RUNNING] )
+                if is_ready( job, ls_jobs, n_running ):
+                    start_job( job )
+        elif not any( job['status'] == RUNNING for job in ls_jobs ):
+            break
+
+        # Report progress periodically
+        if time.time() - last_report_time >= args.report_interval:
+            last_report_time = time.time()
+            report_progress( ls_jobs )
+
+        time.sleep( 0.5 )
+
+    report_progress( ls_jobs )
+
+    # Report elapsed time
+    util.report_elapsed_time()
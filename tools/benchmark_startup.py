@@ -0,0 +1,72 @@
+# Copyright 2025 Energize Lawrence.  All rights reserved.
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import statistics
+
+
+# Time one fresh interpreter importing the specified module
+def time_import( module, directory ):
+    start = time.perf_counter()
+    result = subprocess.run( [sys.executable, '-X', 'importtime', '-c', 'import ' + module], cwd=directory, capture_output=True, text=True )
+    elapsed = time.perf_counter() - start
+
+    if result.returncode:
+        print( result.stderr.strip().splitlines()[-1] )
+        exit( 1 )
+
+    return elapsed, result.stderr
+
+
+# Report top-level imports that contribute most to cumulative import time
+def find_slowest_imports( importtime_output, n_top ):
+
+    ls_imports = []
+
+    for line in importtime_output.splitlines():
+        if not line.startswith( 'import time:' ) or 'cumulative' in line:
+            continue
+
+        # Format is 'import time: self | cumulative | indented package name'
+        fields = line[len( 'import time:' ):].split( '|' )
+        name = fields[2].rstrip()
+
+        # Skip nested imports, which are already counted in their parents
+        if name.startswith( '   ' ):
+            continue
+
+        ls_imports.append( ( int( fields[1] ), name.strip() ) )
+
+    return sorted( ls_imports, reverse=True )[:n_top]
+
+
+# Main program
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser( description='Measure startup time of shared modules' )
+    parser.add_argument( '-m', dest='modules', default='util', help='Comma-separated list of modules to import' )
+    parser.add_argument( '-d', dest='directory', default='../util', help='Directory from which to import modules' )
+    parser.add_argument( '-n', dest='repeat', type=int, default=5, help='Number of timed runs per module' )
+    parser.add_argument( '-t', dest='top', type=int, default=10, help='Number of slowest imports to report' )
+    args = parser.parse_args()
+
+    directory = os.path.abspath( args.directory )
+
+    for module in args.modules.split( ',' ):
+
+        # Warm up, so that compiled bytecode is cached
+        time_import( module, directory )
+
+        ls_times = []
+        for i in range( args.repeat ):
+            elapsed, importtime_output = time_import( module, directory )
+            ls_times.append( elapsed )
+
+        print( '' )
+        print( 'import {0}: median {1:.3f}s, min {2:.3f}s, max {3:.3f}s over {4} run(s)'.format( module, statistics.median( ls_times ), min( ls_times ), max( ls_times ), args.repeat ) )
+
+        for usec, name in find_slowest_imports( importtime_output, args.top ):
+            print( '  {0:8.3f}s  {1}'.format( usec / 1e6, name ) )
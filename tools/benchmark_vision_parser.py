@@ -0,0 +1,207 @@
+# Copyright 2025 Energize Lawrence.  All rights reserved.
+
+import argparse
+import glob
+import os
+import re
+import time
+
+from bs4 import BeautifulSoup
+
+import sys
+sys.path.append( '../util' )
+import util
+import vision
+
+
+# Original BeautifulSoup implementation of vision.parse_parcel_page(), kept as reference
+
+# Scrape HTML element by id
+def scrape_element( soup, tag, id ):
+    element = soup.find( tag, id=id )
+    text = element.string if element else ''
+    return text
+
+# Scrape multi-line HTML element
+def scrape_lines( soup, tag, id, sep=', ' ):
+    ls_lines = []
+    lines = soup.find( tag, id=id )
+    for line in lines:
+        s = line.string
+        if s:
+            s = s.strip()
+            if s:
+                ls_lines.append( s.strip() )
+    text = sep.join( ls_lines )
+    return text
+
+# Scrape multi-line address
+def scrape_address( soup, tag, id ):
+    address = scrape_lines( soup, tag, id )
+    match = re.search( r'\d{5}(-\d{4})?$', address )
+    zip = match.group() if match else ''
+    return address, zip
+
+
+# Find HTML IDs associated with building tables, areas, and years
+def find_all_building_ids( soup, building_count ):
+
+    ls_building_ids = []
+    first_building_id = ''
+    first_area_id = ''
+    first_year_id = ''
+
+    try:
+        range_max = min( 5 + ( 3 * int( building_count ) ), 100 )
+    except:
+        range_max = 100
+
+    for n_index in range( 1, range_max ):
+
+        dc_ids = { vision.BUILDING_TABLE_ID: '', vision.BUILDING_AREA_ID: '' }
+
+        building_id = vision.BUILDING_TABLE_ID_FORMAT.format( n_index )
+        if soup.find( 'table', id=building_id ):
+            dc_ids[vision.BUILDING_TABLE_ID] = building_id
+            if first_building_id == '':
+                first_building_id = building_id
+
+        area_id = vision.BUILDING_AREA_ID_FORMAT.format( n_index )
+        if soup.find( 'span', id=area_id ):
+            dc_ids[vision.BUILDING_AREA_ID] = area_id
+            if first_area_id == '':
+                first_area_id = area_id
+
+        year_id = vision.BUILDING_YEAR_ID_FORMAT.format( n_index )
+        if soup.find( 'span', id=year_id ):
+            if first_year_id == '':
+                first_year_id = year_id
+
+        if dc_ids[vision.BUILDING_TABLE_ID] or dc_ids[vision.BUILDING_AREA_ID]:
+            ls_building_ids.append( dc_ids )
+
+    return ls_building_ids, first_building_id, first_area_id, first_year_id
+
+
+# Scrape cell of Building Attributes table, identified by label regex
+def scrape_building_attribute( soup, building_id, ls_labels, is_numeric=False ):
+
+    s_attribute = ''
+
+    table = soup.find( 'table', id=building_id )
+
+    if table:
+        trs = table.find_all( 'tr' )
+        for tr in trs:
+            tds = tr.find_all( 'td' )
+            if ( len( tds ) == 2 ) and ( tds[0].string in ls_labels ):
+                s_attribute = str( tds[1].string ).strip()
+                break
+
+    if is_numeric:
+        s_attribute = s_attribute.replace( 'O', '0' )
+        s_attribute = re.sub( r'(^\d+)(.*)', r'\1', s_attribute )
+
+    return s_attribute
+
+
+# Parse page into record, as vision_scrape.py did
+def parse_parcel_page( html ):
+
+    soup = BeautifulSoup( html, 'html.parser' )
+
+    building_count = scrape_element( soup, 'span', 'MainContent_lblBldCount' )
+    ls_building_ids, first_building_id, first_area_id, first_year_id = find_all_building_ids( soup, building_count )
+
+    dc_record = {}
+    for s_column, s_id in vision.PARCEL_SPAN_IDS.items():
+        dc_record[s_column] = scrape_element( soup, 'span', s_id )
+    dc_record[util.OWNER_ADDRESS], dc_record[util.OWNER_ZIP] = scrape_address( soup, 'span', 'MainContent_lblAddr1' )
+
+    for s_column, ( ls_labels, is_numeric ) in vision.FIRST_BUILDING_ATTRIBUTES.items():
+        dc_record[s_column] = scrape_building_attribute( soup, first_building_id, ls_labels, is_numeric=is_numeric )
+    dc_record[util.YEAR_BUILT] = scrape_element( soup, 'span', first_year_id )
+    dc_record[util.LIVING_AREA] = scrape_element( soup, 'span', first_area_id )
+    dc_record[util.BUILDING_COUNT] = building_count
+
+    for s_column, ls_labels in vision.TOTAL_BUILDING_ATTRIBUTES.items():
+        n_total = 0
+        for dc_ids in ls_building_ids:
+            s_value = scrape_building_attribute( soup, dc_ids[vision.BUILDING_TABLE_ID], ls_labels, is_numeric=True )
+            if len( s_value ):
+                n_total += int( float( s_value ) )
+        dc_record[s_column] = n_total
+
+    n_area = 0
+    for dc_ids in ls_building_ids:
+        scr_area = scrape_element( soup, 'span', dc_ids[vision.BUILDING_AREA_ID] )
+        if scr_area:
+            s = str( scr_area.string.strip().replace( ',', '' ) )
+            if len( s ):
+                n_area += int( float( s ) )
+    dc_record[util.TOTAL_AREA] = n_area
+
+    return dc_record
+
+
+# Parse all pages with specified parser, returning records and pages per second
+def time_parser( parse, ls_pages, repeat ):
+
+    ls_elapsed = []
+
+    for i in range( repeat ):
+        start = time.perf_counter()
+        ls_records = [parse( html ) for html in ls_pages]
+        ls_elapsed.append( time.perf_counter() - start )
+
+    return ls_records, len( ls_pages ) / min( ls_elapsed )
+
+
+# Convert record values to plain strings, for comparison
+def plain_record( dc_record ):
+    return { k: ( str( v ) if isinstance( v, str ) else v ) for k, v in dc_record.items() }
+
+
+# Main program
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser( description='Measure Vision parcel page parsing speed, and check results against reference implementation' )
+    parser.add_argument( '-d', dest='directory', help='Directory of saved Vision parcel pages (*.html)', required=True )
+    parser.add_argument( '-n', dest='repeat', type=int, default=3, help='Number of timed runs per parser' )
+    args = parser.parse_args()
+
+    # Read saved pages
+    ls_filenames = sorted( glob.glob( os.path.join( args.directory, '*.html' ) ) )
+    ls_pages = []
+    for filename in ls_filenames:
+        with open( filename, encoding='utf-8', errors='replace' ) as f:
+            ls_pages.append( f.read() )
+
+    if not ls_pages:
+        exit( 'No pages found in {}'.format( args.directory ) )
+
+    print( '' )
+    print( 'Parsing {} pages, {:.1f} KB on average'.format( len( ls_pages ), sum( len( s ) for s in ls_pages ) / len( ls_pages ) / 1024 ) )
+
+    ls_reference, reference_rate = time_parser( parse_parcel_page, ls_pages, args.repeat )
+    ls_current, current_rate = time_parser( vision.parse_parcel_page, ls_pages, args.repeat )
+
+    print( 'Reference (BeautifulSoup, html.parser): {:.1f} pages/s'.format( reference_rate ) )
+    print( 'Current (lxml, single pass): {:.1f} pages/s'.format( current_rate ) )
+    print( 'Speedup: {:.1f}x'.format( current_rate / reference_rate ) )
+
+    # Compare records
+    n_differ = 0
+    for filename, dc_reference, dc_current in zip( ls_filenames, ls_reference, ls_current ):
+        dc_reference = plain_record( dc_reference )
+        dc_current = plain_record( dc_current )
+        if dc_reference != dc_current:
+            n_differ += 1
+            print( '' )
+            print( 'Records differ: {}'.format( os.path.basename( filename ) ) )
+            for s_column in dc_reference:
+                if dc_reference[s_column] != dc_current.get( s_column ):
+                    print( '  {}: {!r} != {!r}'.format( s_column, dc_reference[s_column], dc_current.get( s_column ) ) )
+
+    print( '' )
+    print( 'Identical' if n_differ == 0 else '{} of {} records differ'.format( n_differ, len( ls_pages ) ) )
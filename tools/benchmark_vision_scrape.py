@@ -0,0 +1,146 @@
+# Copyright 2025 Energize Lawrence.  All rights reserved.
+
+import argparse
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; CPU time of scripts is not reported
+    resource = None
+
+import sys
+sys.path.append( '../util' )
+import util
+import vision
+
+import vision_standin
+
+
+#
+# Measure throughput of Vision scraping scripts against a local stand-in for the Vision website
+# - Each script runs as it would in production, from a scratch directory with its own db and test directories.
+# - Pages per second and CPU time per page are computed from the pages served by the stand-in.
+# - Discovery results are checked against the recorded pages.
+#
+
+TOWN = 'standin'
+POPULATORS_DIR = os.path.abspath( '../populators' )
+UTIL_DIR = os.path.abspath( '../util' )
+
+EXAMPLE_LABELS = ','.join( vision.LS_BATH )
+
+
+# Return CPU time used so far by finished child processes
+def children_cpu_time():
+    if resource is None:
+        return None
+    usage = resource.getrusage( resource.RUSAGE_CHILDREN )
+    return usage.ru_utime + usage.ru_stime
+
+
+# Run one script from scratch populators directory, and report its throughput
+def run_script( s_descr, script, ls_args, server, work_dir ):
+
+    command = [sys.executable, os.path.join( POPULATORS_DIR, script )] + ls_args
+    env = dict( os.environ, PYTHONPATH=os.pathsep.join( [UTIL_DIR] + [s for s in [os.environ.get( 'PYTHONPATH' )] if s] ) )
+
+    server.take_counts()
+    cpu_start = children_cpu_time()
+    start = time.perf_counter()
+    result = subprocess.run( command, cwd=os.path.join( work_dir, 'populators' ), env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True )
+    elapsed = time.perf_counter() - start
+    cpu_time = None if cpu_start is None else children_cpu_time() - cpu_start
+    dc_counts = server.take_counts()
+
+    n_pages = dc_counts.get( vision_standin.PAGES, 0 )
+    n_requests = n_pages + dc_counts.get( vision_standin.REDIRECTS, 0 ) + dc_counts.get( vision_standin.ERRORS, 0 )
+
+    s_cpu = '' if ( cpu_time is None ) or not n_pages else '{:.1f}'.format( 1000 * cpu_time / n_pages )
+    print( ' {:<36}{:>9.2f}{:>9}{:>10}{:>9.1f}{:>11}'.format( s_descr, elapsed, n_pages, n_requests, n_pages / elapsed, s_cpu ) )
+
+    if result.returncode:
+        print( '' )
+        print( '!!! {} failed; last output:'.format( s_descr ) )
+        for line in result.stdout.splitlines()[-20:]:
+            print( '  ' + line )
+        print( '' )
+
+    return result.returncode == 0
+
+
+# Count rows scraped into scratch database, and how many recorded pages in the requested range they cover
+def check_discovery( work_dir, dc_pages, vision_id_range ):
+
+    conn = sqlite3.connect( os.path.join( work_dir, 'db', 'vision_{}.sqlite'.format( TOWN ) ) )
+    ls_found = [row[0] for row in conn.execute( 'SELECT "{}" FROM Vision_Raw_{}'.format( util.VISION_ID, TOWN.capitalize() ) )]
+    conn.close()
+
+    ls_expected = [vision_id for vision_id in dc_pages if vision_id_range[0] <= vision_id <= vision_id_range[1]]
+    n_missing = len( set( ls_expected ) - set( ls_found ) )
+    s_check = 'ok' if n_missing == 0 else '{} missing'.format( n_missing )
+
+    print( ' {:<36}found {} of {} recorded pages: {}'.format( '', len( ls_found ), len( ls_expected ), s_check ) )
+
+
+# Main program
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser( description='Measure throughput of Vision scraping scripts against a local stand-in for the Vision website' )
+    parser.add_argument( '-d', dest='directory', help='Directory of recorded pages, named <vision_id>.html' )
+    parser.add_argument( '-t', dest='town', help='Town whose archived pages are to be served, if no directory is specified' )
+    parser.add_argument( '-l', dest='latency', type=float, default=0, help='Average delay of each response, in seconds' )
+    parser.add_argument( '-e', dest='error_rate', type=float, default=0, help='Fraction of requests that fail with a retryable HTTP error' )
+    parser.add_argument( '-j', dest='workers', default='1,4', help='Comma-separated numbers of concurrent requests to try with vision_scrape.py' )
+    parser.add_argument( '-v', dest='vision_id_range', help='Range of Vision IDs to discover (default: 1 to highest recorded ID)' )
+    parser.add_argument( '-p', dest='probe_stride', type=int, help='Interval between IDs probed during discovery' )
+    parser.add_argument( '-k', dest='keep', action='store_true', help='Keep scratch directory?' )
+    args = parser.parse_args()
+
+    if not ( args.directory or args.town ):
+        parser.error( 'Specify a directory (-d) or an archived town (-t)' )
+
+    # Read recorded pages and start stand-in
+    dc_pages = vision_standin.read_pages( args.directory, args.town )
+    vision_standin.describe_pages( dc_pages )
+    server = vision_standin.start_server( dc_pages, latency=args.latency, error_rate=args.error_rate )
+
+    if args.vision_id_range:
+        vision_id_range = [int( s ) for s in args.vision_id_range.split( ',' )]
+    else:
+        vision_id_range = [1, max( dc_pages )]
+    s_range = '{},{}'.format( *vision_id_range )
+
+    # Prepare scratch directory, laid out like the repository
+    work_dir = tempfile.mkdtemp( prefix='vision_benchmark_' )
+    for s_dir in ['populators', 'db', 'test']:
+        os.makedirs( os.path.join( work_dir, s_dir ) )
+
+    print( '' )
+    print( 'Stand-in at {}, latency {}s, error rate {}; scratch directory {}'.format( server.site_url, args.latency, args.error_rate, work_dir ) )
+    print( '' )
+    print( ' {:<36}{:>9}{:>9}{:>10}{:>9}{:>11}'.format( 'Script', 'Seconds', 'Pages', 'Requests', 'Pages/s', 'CPU ms/pg' ) )
+
+    ls_site = ['-u', server.site_url]
+    ls_probe = ['-p', str( args.probe_stride )] if args.probe_stride else []
+
+    for s_workers in args.workers.split( ',' ):
+        ls_workers = ['-j', s_workers]
+        if run_script( 'vision_scrape.py discovery -j {}'.format( s_workers ), 'vision_scrape.py', ['-m', TOWN, '-c', '-v', s_range] + ls_workers + ls_probe + ls_site, server, work_dir ):
+            check_discovery( work_dir, dc_pages, vision_id_range )
+        run_script( 'vision_scrape.py refresh -j {}'.format( s_workers ), 'vision_scrape.py', ['-m', TOWN, '-r'] + ls_workers + ls_site, server, work_dir )
+
+    run_script( 'vision_labels.py', 'vision_labels.py', ['-l', '../db/vision_labels.sqlite', '-c', '-t', TOWN] + ls_site, server, work_dir )
+    run_script( 'vision_examples.py', 'vision_examples.py', ['-o', '../db/vision_examples.sqlite', '-c', '-t', TOWN, '-e', EXAMPLE_LABELS] + ls_site, server, work_dir )
+
+    server.shutdown()
+
+    if not args.keep:
+        shutil.rmtree( work_dir, ignore_errors=True )
+
+    util.report_elapsed_time()
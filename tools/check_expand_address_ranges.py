@@ -0,0 +1,146 @@
+# Copyright 2025 Energize Lawrence.  All rights reserved.
+
+import argparse
+import re
+import time
+
+import pandas as pd
+
+import sys
+sys.path.append( '../util' )
+import util
+
+
+# Original row-at-a-time implementation of util.expand_address_ranges(), kept as reference
+
+# Add row to expanded address range
+def add_address_row( address_number, street, row, df_expanded ):
+    new_address = str( address_number ) + ' ' + street
+    new_row = row.copy()
+    new_row[util.NORMALIZED_ADDRESS] = new_address
+    df_expanded = df_expanded.append( new_row, ignore_index=True )
+    return( df_expanded )
+
+
+# Expand dataframe such that each address range entry is replaced by a series of entries representing the range
+def expand_address_ranges( df ):
+
+    # Extract entries that represent implied address ranges, expressed as '<number>[letter]-<number>[letter]'
+    df_ranges = df.copy()
+    df_ranges = df_ranges[ df_ranges[util.NORMALIZED_ADDRESS].str.match( '^\d+[A-Z]*-\d+[A-Z]* .*$' ) ]
+
+    # Generate a new dataframe that expands the ranges into individual addresses
+    df_expanded = pd.DataFrame( columns=df_ranges.columns )
+
+    for index, row in df_ranges.iterrows():
+
+        # Extract numeric address range
+        address_range = row[util.NORMALIZED_ADDRESS].split()[0].split( '-' )
+        range_first = int( re.search( '^\d*', address_range[0] ).group(0) )
+        range_last = int( re.search( '^\d*', address_range[1] ).group(0) )
+
+        # Extract street
+        words = row[util.NORMALIZED_ADDRESS].split()[1:]
+        num_suffix = words.pop() if ( len( words ) and re.search( '^[A-Z]$', words[-1] ) ) else ''
+        street = ' '.join( words )
+
+        # Iterate over all numbers in the address range, incrementing by 2
+        for num in range( range_first, range_last + 1, 2 ):
+            df_expanded = add_address_row( str( num ) + num_suffix, street, row, df_expanded )
+
+        # Determine whether either range specifier contains a letter
+        letter_in_range_first = re.search( '[A-Z]', address_range[0] )
+        letter_in_range_last = re.search( '[A-Z]', address_range[1] )
+
+        # Include row representing second of two consecutive integer range specifiers
+        if ( range_last == range_first + 1 ) and not ( letter_in_range_first or letter_in_range_last ):
+            df_expanded = add_address_row( range_last, street, row, df_expanded )
+
+        # Include literal range specifier containing letter, but only if numbers are equal
+        if ( range_first == range_last ):
+            if letter_in_range_first:
+                df_expanded = add_address_row( address_range[0], street, row, df_expanded )
+            if letter_in_range_last:
+                df_expanded = add_address_row( address_range[1], street, row, df_expanded )
+
+    # Extract entries that represent explicit address ranges, expressed as '<number>[letter]-<number>[letter]-<number>[letter]...'
+    df_ranges = df.copy()
+    df_ranges = df_ranges[ df_ranges[util.NORMALIZED_ADDRESS].str.match( '^\d+[A-Z]*-\d+[A-Z]*(-\d+[A-Z]*)+ .*$' ) ]
+
+    # Iterate over explicit attress ranges
+    for index, row in df_ranges.iterrows():
+
+        # Extract street
+        street = ' '.join( row[util.NORMALIZED_ADDRESS].split()[1:] )
+
+        # Extract range parts
+        address_range = row[util.NORMALIZED_ADDRESS].split()[0].split( '-' )
+
+        # Iterate over range parts, adding a row for each
+        for range_part in address_range:
+            df_expanded = add_address_row( range_part, street, row, df_expanded )
+
+    # Extract entries that represent ranges of occupancy identifiers, such as '95 A-B NEWTON ST'
+    df_ranges = df.copy()
+    df_ranges = df_ranges[ df_ranges[util.NORMALIZED_ADDRESS].str.match( '^\d+ [A-Z]-[A-Z] .*$' ) ]
+
+    # Iterate over addresses with alphabetical ranges
+    for index, row in df_ranges.iterrows():
+
+        # Extract parts: address number, alphabetical range, and street name
+        parts = row[util.NORMALIZED_ADDRESS].split()
+        number = parts[0]
+        alpha_range = parts[1].split( '-' )
+        street = ' '.join( parts[2:] )
+
+        # Construct list of letters in range
+        letters_in_range = [chr(i) for i in range( ord( alpha_range[0] ), ord( alpha_range[1] ) + 1 )]
+
+        # Iterate over letters, adding two entries for each: '<number> <letter>' and '<number><letter>'
+        for letter in letters_in_range:
+            address_number = ''.join( [number, letter] )
+            df_expanded = add_address_row( address_number, street, row, df_expanded )
+
+    df_no_ranges = df.loc[ df.index.difference( df_ranges.index ) ]
+    df_expanded = df_expanded.append( df_no_ranges, ignore_index=True )
+
+    return( df_expanded )
+
+
+# Compare reference and current implementations on one dataframe
+def compare( s_descr, df ):
+
+    start = time.time()
+    df_reference = expand_address_ranges( df )
+    reference_time = time.time() - start
+
+    start = time.time()
+    df_current = util.expand_address_ranges( df )
+    current_time = time.time() - start
+
+    print( '' )
+    print( '{0}: {1} rows expanded to {2}'.format( s_descr, len( df ), len( df_current ) ) )
+    print( 'Reference: {0:.3f}s, current: {1:.3f}s'.format( reference_time, current_time ) )
+
+    pd.testing.assert_frame_equal( df_reference, df_current )
+    print( 'Identical' )
+
+
+# Main program
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser( description='Check vectorized address range expansion against reference implementation' )
+    parser.add_argument( '-m', dest='master_filename', help='Master database filename', required=True )
+    args = parser.parse_args()
+
+    # Read parcels table as prepared for merge
+    conn, cur, engine = util.open_database( args.master_filename, False )
+    df_parcels = util.read_parcels_table_for_merge( engine )
+    df_parcels[util.CONFIDENCE] = util.CONFIDENCE_HIGH
+
+    # Full and truncated addresses, as expanded by merge_with_assessment_data()
+    compare( 'Full addresses', df_parcels )
+    df_parcels[util.NORMALIZED_ADDRESS] = df_parcels[util.RIGHT_ADDR_TRUNC]
+    compare( 'Truncated addresses', df_parcels )
+
+    util.report_elapsed_time()
@@ -0,0 +1,181 @@
+# Copyright 2025 Energize Lawrence.  All rights reserved.
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import collections
+import http.server
+import urllib.parse
+
+import sys
+sys.path.append( '../util' )
+import util
+
+
+#
+# Local fake of the Azure Maps and Nominatim geocoding services, for testing lawrence_geolocate.py
+# - Azure Maps: GET /search/address/json and POST /search/address/batch/sync/json
+# - Nominatim: GET /search
+#
+# Results are deterministic, computed from a hash of the query:
+# - Only plain addresses are found, such as '12 ESSEX ST, LAWRENCE, MA'.  Addresses with apartment numbers or letters,
+#   hyphenated street numbers, or street numbers with letters are not, so the geocoder must retry simplified variants.
+# - A configurable fraction of plain addresses is unknown to Azure Maps, and must be found by Nominatim.
+# - A configurable fraction of plain addresses is found outside Lawrence.
+#
+
+PLAIN_ADDRESS_PATTERN = re.compile( r'^\d+( [A-Z]+)* [A-Z]{2,}, LAWRENCE, MA$' )
+OUTSIDE_ZIP = '01810'
+
+# Counters of requests served
+AZURE = 'azure requests'
+AZURE_BATCH = 'azure batch requests'
+AZURE_QUERIES = 'azure queries'
+NOMINATIM = 'nominatim requests'
+
+
+# Map query to a number in [0,1)
+def hash_fraction( s_query, s_salt='' ):
+    return int( hashlib.sha256( ( s_salt + s_query ).encode( 'utf-8' ) ).hexdigest()[:8], 16 ) / 0x100000000
+
+
+# Look up query; return ( latitude, longitude, zip ) or None
+def look_up( server, s_query, b_azure ):
+
+    s_query = s_query.upper()
+
+    if not PLAIN_ADDRESS_PATTERN.match( s_query ):
+        return None
+
+    if b_azure and ( hash_fraction( s_query, 'azure' ) < server.azure_miss_rate ):
+        return None
+
+    zip = OUTSIDE_ZIP if hash_fraction( s_query, 'zip' ) < server.outside_rate else util.LAWRENCE_ZIPS[int( 4 * hash_fraction( s_query, 'lawrence' ) )]
+    latitude = round( 42.68 + 0.05 * hash_fraction( s_query, 'lat' ), 6 )
+    longitude = round( -71.19 + 0.07 * hash_fraction( s_query, 'long' ), 6 )
+
+    return latitude, longitude, zip
+
+
+# Format Azure Maps search response
+def azure_response( server, s_query ):
+    location = look_up( server, s_query, True )
+    ls_results = [{ 'position': { 'lat': location[0], 'lon': location[1] }, 'address': { 'postalCode': location[2] } }] if location else []
+    return { 'summary': { 'query': s_query, 'numResults': len( ls_results ) }, 'results': ls_results }
+
+
+# Handle requests for geocoding
+class FakeGeocoderRequestHandler( http.server.BaseHTTPRequestHandler ):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message( self, format, *args ):
+        pass
+
+    def send_json( self, status, value ):
+        data = json.dumps( value ).encode( 'utf-8' )
+        self.send_response( status )
+        self.send_header( 'Content-Type', 'application/json' )
+        self.send_header( 'Content-Length', str( len( data ) ) )
+        self.end_headers()
+        self.wfile.write( data )
+
+    def simulate( self ):
+
+        # Simulate service latency and transient failures; return True if request fails
+        if self.server.latency:
+            time.sleep( random.uniform( 0.5, 1.5 ) * self.server.latency )
+
+        if random.random() < self.server.error_rate:
+            self.send_json( 503, { 'error': 'Service unavailable' } )
+            return True
+
+        return False
+
+    def do_GET( self ):
+
+        url = urllib.parse.urlparse( self.path )
+        dc_params = { k: v[0] for k, v in urllib.parse.parse_qs( url.query ).items() }
+
+        if url.path == '/search/address/json':
+            self.server.count( AZURE )
+            if not self.simulate():
+                self.send_json( 200, azure_response( self.server, dc_params.get( 'query', '' ) ) )
+
+        elif url.path == '/search':
+            self.server.count( NOMINATIM )
+            if not self.simulate():
+                location = look_up( self.server, dc_params.get( 'q', '' ), False )
+                ls_locations = [{ 'lat': str( location[0] ), 'lon': str( location[1] ), 'address': { 'postcode': location[2] } }] if location else []
+                self.send_json( 200, ls_locations )
+
+        else:
+            self.send_json( 404, { 'error': 'Not found' } )
+
+    def do_POST( self ):
+
+        url = urllib.parse.urlparse( self.path )
+        body = json.loads( self.rfile.read( int( self.headers.get( 'Content-Length', 0 ) ) ) or '{}' )
+
+        if url.path == '/search/address/batch/sync/json':
+            self.server.count( AZURE_BATCH )
+            if not self.simulate():
+                ls_items = []
+                for dc_item in body.get( 'batchItems', [] ):
+                    self.server.count( AZURE_QUERIES )
+                    s_query = urllib.parse.parse_qs( dc_item['query'].lstrip( '?' ) ).get( 'query', [''] )[0]
+                    ls_items.append( { 'statusCode': 200, 'response': azure_response( self.server, s_query ) } )
+                self.send_json( 200, { 'batchItems': ls_items } )
+
+        else:
+            self.send_json( 404, { 'error': 'Not found' } )
+
+
+# HTTP server holding simulation parameters and request counters
+class FakeGeocoderServer( http.server.ThreadingHTTPServer ):
+
+    daemon_threads = True
+
+    def __init__( self, port=0, latency=0, error_rate=0, azure_miss_rate=0, outside_rate=0 ):
+        super().__init__( ( '127.0.0.1', port ), FakeGeocoderRequestHandler )
+        self.latency = latency
+        self.error_rate = error_rate
+        self.azure_miss_rate = azure_miss_rate
+        self.outside_rate = outside_rate
+        self.lock = threading.Lock()
+        self.dc_counts = collections.Counter()
+
+    def count( self, s_what ):
+        with self.lock:
+            self.dc_counts[s_what] += 1
+
+    @property
+    def site_url( self ):
+        return 'http://127.0.0.1:{}'.format( self.server_address[1] )
+
+
+# Main program
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser( description='Serve fake Azure Maps and Nominatim geocoding responses locally' )
+    parser.add_argument( '-p', dest='port', type=int, default=8766, help='Port on which to listen' )
+    parser.add_argument( '-l', dest='latency', type=float, default=0, help='Average delay of each response, in seconds' )
+    parser.add_argument( '-e', dest='error_rate', type=float, default=0, help='Fraction of requests that fail with a retryable HTTP error' )
+    parser.add_argument( '-m', dest='azure_miss_rate', type=float, default=0.1, help='Fraction of plain addresses unknown to Azure Maps' )
+    parser.add_argument( '-o', dest='outside_rate', type=float, default=0.02, help='Fraction of plain addresses found outside Lawrence' )
+    args = parser.parse_args()
+
+    server = FakeGeocoderServer( port=args.port, latency=args.latency, error_rate=args.error_rate, azure_miss_rate=args.azure_miss_rate, outside_rate=args.outside_rate )
+    print( '' )
+    print( 'Serving fake geocoder at {}'.format( server.site_url ) )
+    print( 'Use -a {0} -n {0} with lawrence_geolocate.py'.format( server.site_url ) )
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print( '' )
+        print( 'Requests: {}'.format( dict( server.dc_counts ) ) )
@@ -0,0 +1,212 @@
+# Copyright 2025 Energize Lawrence.  All rights reserved.
+
+import argparse
+import glob
+import os
+import re
+import random
+import threading
+import time
+import collections
+import http.server
+import urllib.parse
+
+import sys
+sys.path.append( '../util' )
+import util
+import vision
+import vision_archive
+
+
+#
+# Local stand-in for the Vision Government Solutions website, serving recorded parcel pages
+# - Pages are recorded as '<vision_id>.html' files in a directory, or are read from the Vision page archive.
+# - A request for a Vision ID that has no recorded page is redirected to an error page, as on the real site.
+# - Responses can be delayed, and can fail with retryable HTTP errors, at configurable rates.
+# - Any town name in the URL is served from the same recorded pages.
+#
+
+PARCEL_PATH_PATTERN = re.compile( r'^/(\w+)ma/parcel\.aspx$', re.IGNORECASE )
+ERROR_PATH_FORMAT = '/{}ma/Error.aspx'
+ERROR_PAGE = '<html><head><title>Error</title></head><body><p>There was an error processing your request.</p></body></html>'
+ERROR_STATUS_CODES = [500, 502, 503]
+
+# Counters of responses served
+PAGES = 'pages'
+REDIRECTS = 'redirects'
+ERRORS = 'errors'
+OTHER = 'other'
+
+
+# Read recorded pages from directory of '<vision_id>.html' files
+def read_page_directory( directory ):
+
+    dc_pages = {}
+
+    for filename in glob.glob( os.path.join( directory, '*.html' ) ):
+        s_id = os.path.splitext( os.path.basename( filename ) )[0]
+        if s_id.isdigit():
+            with open( filename, encoding='utf-8', errors='replace' ) as f:
+                dc_pages[int( s_id )] = f.read()
+
+    return dc_pages
+
+
+# Read most recently archived pages of town
+def read_archived_pages( town ):
+    dc_digests = vision_archive.read_latest_digests( town )
+    return { vision_id: vision_archive.read_page( digest ) for vision_id, digest in dc_digests.items() }
+
+
+# Summarize features of recorded pages that exercise the parser: multi-building pages and building table label variants
+def describe_pages( dc_pages ):
+
+    n_multi_building = 0
+    dc_label_counts = collections.Counter()
+
+    ls_labels = [s_label for ls_labels, is_numeric in vision.FIRST_BUILDING_ATTRIBUTES.values() for s_label in ls_labels]
+
+    for html in dc_pages.values():
+        page = vision.ParcelPage( html )
+        building_count = page.scrape_element( 'span', 'MainContent_lblBldCount' )
+        ls_building_ids = page.find_all_building_ids( building_count )[0]
+        if len( ls_building_ids ) > 1:
+            n_multi_building += 1
+        for s_label in { s_label for dc_ids in ls_building_ids for s_label, s_value in page.building_rows( dc_ids[vision.BUILDING_TABLE_ID] ) }:
+            dc_label_counts[s_label] += 1
+
+    print( '' )
+    print( '{} recorded pages, {} with more than one building'.format( len( dc_pages ), n_multi_building ) )
+    print( 'Building table labels recognized by parser, with number of pages using each:' )
+    for s_label in sorted( set( ls_labels ) ):
+        print( '  {:<24}{:>8}'.format( s_label, dc_label_counts[s_label] ) )
+
+
+# Handle requests for parcel pages
+class StandinRequestHandler( http.server.BaseHTTPRequestHandler ):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message( self, format, *args ):
+        pass
+
+    def send_body( self, status, body, content_type='text/html; charset=utf-8' ):
+        data = body.encode( 'utf-8' )
+        self.send_response( status )
+        self.send_header( 'Content-Type', content_type )
+        self.send_header( 'Content-Length', str( len( data ) ) )
+        self.end_headers()
+        self.wfile.write( data )
+
+    def do_GET( self ):
+
+        server = self.server
+        url = urllib.parse.urlparse( self.path )
+        match = PARCEL_PATH_PATTERN.match( url.path )
+        ls_pids = urllib.parse.parse_qs( url.query ).get( 'pid', [] )
+
+        if not ( match and ls_pids and ls_pids[0].isdigit() ):
+            server.count( OTHER )
+            self.send_body( 200, ERROR_PAGE )
+            return
+
+        # Simulate server latency and transient failures
+        if server.latency:
+            time.sleep( random.uniform( 0.5, 1.5 ) * server.latency )
+
+        if random.random() < server.error_rate:
+            server.count( ERRORS )
+            self.send_body( random.choice( ERROR_STATUS_CODES ), ERROR_PAGE )
+            return
+
+        html = server.dc_pages.get( int( ls_pids[0] ) )
+
+        if html is None:
+            # Redirect request for missing page, as the real site does
+            server.count( REDIRECTS )
+            self.send_response( 302 )
+            self.send_header( 'Location', ERROR_PATH_FORMAT.format( match.group( 1 ) ) )
+            self.send_header( 'Content-Length', '0' )
+            self.end_headers()
+        else:
+            server.count( PAGES )
+            self.send_body( 200, html )
+
+
+# HTTP server holding recorded pages, simulation parameters, and response counters
+class StandinServer( http.server.ThreadingHTTPServer ):
+
+    daemon_threads = True
+
+    def __init__( self, dc_pages, port=0, latency=0, error_rate=0 ):
+        super().__init__( ( '127.0.0.1', port ), StandinRequestHandler )
+        self.dc_pages = dc_pages
+        self.latency = latency
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.dc_counts = collections.Counter()
+
+    def count( self, s_what ):
+        with self.lock:
+            self.dc_counts[s_what] += 1
+
+    # Return counts of responses served so far, and reset them
+    def take_counts( self ):
+        with self.lock:
+            dc_counts = dict( self.dc_counts )
+            self.dc_counts.clear()
+        return dc_counts
+
+    @property
+    def site_url( self ):
+        return 'http://127.0.0.1:{}'.format( self.server_address[1] )
+
+
+# Start stand-in server in background thread
+def start_server( dc_pages, port=0, latency=0, error_rate=0 ):
+    server = StandinServer( dc_pages, port=port, latency=latency, error_rate=error_rate )
+    threading.Thread( target=server.serve_forever, daemon=True ).start()
+    return server
+
+
+# Read recorded pages as specified on command line
+def read_pages( directory, town ):
+
+    if directory:
+        dc_pages = read_page_directory( directory )
+    else:
+        dc_pages = read_archived_pages( town )
+
+    if not dc_pages:
+        exit( 'No recorded pages found in {}'.format( directory or 'archive of {}'.format( town ) ) )
+
+    return dc_pages
+
+
+# Main program
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser( description='Serve recorded Vision parcel pages locally, in place of the Vision Government Solutions website' )
+    parser.add_argument( '-d', dest='directory', help='Directory of recorded pages, named <vision_id>.html' )
+    parser.add_argument( '-t', dest='town', help='Town whose archived pages are to be served, if no directory is specified' )
+    parser.add_argument( '-p', dest='port', type=int, default=8765, help='Port on which to listen' )
+    parser.add_argument( '-l', dest='latency', type=float, default=0, help='Average delay of each response, in seconds' )
+    parser.add_argument( '-e', dest='error_rate', type=float, default=0, help='Fraction of requests that fail with a retryable HTTP error' )
+    args = parser.parse_args()
+
+    if not ( args.directory or args.town ):
+        parser.error( 'Specify a directory (-d) or an archived town (-t)' )
+
+    dc_pages = read_pages( args.directory, args.town )
+    describe_pages( dc_pages )
+
+    server = StandinServer( dc_pages, port=args.port, latency=args.latency, error_rate=args.error_rate )
+    print( '' )
+    print( 'Serving {} pages at {}'.format( len( dc_pages ), server.site_url ) )
+    print( 'Use -u {} with vision_scrape.py, vision_labels.py, or vision_examples.py'.format( server.site_url ) )
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print( '' )
+        print( 'Responses: {}'.format( server.take_counts() ) )
@@ -0,0 +1,258 @@
+# Copyright 2025 Energize Lawrence.  All rights reserved.
+
+import time
+import collections
+import urllib.parse
+import concurrent.futures
+
+import requests
+import requests.adapters
+
+import util
+import vision
+
+
+#
+# Concurrent geocoding of street addresses through a sequence of providers
+# - Each provider has its own queue of jobs, its own number of concurrent requests, and its own request rate limit.
+# - Providers that offer a batch endpoint receive queued jobs in batches.
+# - When a provider cannot find an address, a simplified variant of the address is queued as a follow-up job for the same provider.
+# - When a provider has no result for an address or any of its variants, or finds it outside the service area,
+#   the original address is queued for the next provider.
+#
+
+AZURE_URL = 'https://atlas.microsoft.com'
+NOMINATIM_URL = 'https://nominatim.openstreetmap.org'
+
+# Parameters for requests to geocoding services
+GEOCODE_TIMEOUT = 60
+GEOCODE_RETRIES = 3
+GEOCODE_BACKOFF = 2
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+LAT = util.LATITUDE
+LONG = util.LONGITUDE
+ZIP = util.ZIP
+
+# Reasons for which a provider fails to geocode an address
+NOT_FOUND = 'not found'
+OUTSIDE_AREA = 'outside service area'
+
+
+# Send request, retrying transient failures with exponential backoff; return decoded JSON response
+def request_json( session, method, url, limiter, retries=GEOCODE_RETRIES, backoff=GEOCODE_BACKOFF, **kwargs ):
+
+    for n_try in range( retries + 1 ):
+
+        limiter.wait()
+
+        try:
+            response = session.request( method, url, timeout=GEOCODE_TIMEOUT, **kwargs )
+            if ( response.status_code not in RETRY_STATUS_CODES ) or ( n_try == retries ):
+                response.raise_for_status()
+                return response.json()
+        except ( requests.exceptions.ConnectionError, requests.exceptions.Timeout ):
+            if n_try == retries:
+                raise
+
+        time.sleep( backoff * ( 2 ** n_try ) )
+
+
+# Make geocoding result from coordinates and zip code
+def make_result( latitude, longitude, zip ):
+    return { LAT: float( latitude ), LONG: float( longitude ), ZIP: zip }
+
+
+# Azure Maps search service, using its synchronous batch endpoint for more than one query
+class AzureMaps:
+
+    name = 'Azure Maps'
+    batch_size = 100
+
+    def __init__( self, key, url=AZURE_URL, n_workers=4, requests_per_second=10 ):
+        self.key = key
+        self.url = url.rstrip( '/' )
+        self.n_workers = n_workers
+        self.limiter = vision.RateLimiter( requests_per_second )
+
+    # Convert Azure search results to geocoding result
+    def parse_results( self, dc_response ):
+        ls_results = dc_response.get( 'results', [] )
+        if ls_results:
+            dc_result = ls_results[0]
+            return make_result( dc_result['position']['lat'], dc_result['position']['lon'], dc_result['address'].get( 'postalCode' ) )
+        return None
+
+    # Geocode list of queries, returning one result or None for each
+    def geocode( self, session, ls_queries ):
+
+        dc_params = { 'api-version': '1.0', 'subscription-key': self.key }
+
+        if len( ls_queries ) == 1:
+            dc_params.update( { 'query': ls_queries[0], 'limit': 1 } )
+            return [self.parse_results( request_json( session, 'GET', self.url + '/search/address/json', self.limiter, params=dc_params ) )]
+
+        ls_batch_items = [{ 'query': '?' + urllib.parse.urlencode( { 'query': s_query, 'limit': 1 } ) } for s_query in ls_queries]
+        dc_response = request_json( session, 'POST', self.url + '/search/address/batch/sync/json', self.limiter, params=dc_params, json={ 'batchItems': ls_batch_items } )
+
+        ls_results = []
+        for dc_item in dc_response['batchItems']:
+            ls_results.append( self.parse_results( dc_item['response'] ) if dc_item.get( 'statusCode' ) == 200 else None )
+
+        return ls_results
+
+
+# Nominatim search service, which allows only one request at a time, at most one per second
+class Nominatim:
+
+    name = 'Nominatim'
+    batch_size = 1
+
+    def __init__( self, url=NOMINATIM_URL, n_workers=1, requests_per_second=1 ):
+        self.url = url.rstrip( '/' )
+        self.n_workers = n_workers
+        self.limiter = vision.RateLimiter( requests_per_second )
+
+    # Geocode list of queries, returning one result or None for each
+    def geocode( self, session, ls_queries ):
+
+        ls_results = []
+
+        for s_query in ls_queries:
+            dc_params = { 'q': s_query, 'format': 'json', 'addressdetails': 1, 'limit': 1 }
+            ls_locations = request_json( session, 'GET', self.url + '/search', self.limiter, params=dc_params )
+            if ls_locations:
+                dc_location = ls_locations[0]
+                ls_results.append( make_result( dc_location['lat'], dc_location['lon'], dc_location.get( 'address', {} ).get( 'postcode' ) ) )
+            else:
+                ls_results.append( None )
+
+        return ls_results
+
+
+# Create HTTP session shared by all providers
+def make_session( user_agent, n_connections ):
+
+    session = requests.Session()
+    session.headers['User-Agent'] = user_agent
+    adapter = requests.adapters.HTTPAdapter( pool_connections=n_connections, pool_maxsize=n_connections )
+    session.mount( 'https://', adapter )
+    session.mount( 'http://', adapter )
+
+    return session
+
+
+# Geocode addresses concurrently, yielding ( address, result, provider index, street ) as each address is resolved
+# - format_query( street ) converts a street address to the query sent to the providers
+# - validate_zip( zip ) returns the zip code if the result is inside the service area, otherwise None
+# - make_retry_street( street ) returns a simplified variant of the street address to retry, or the same address if there is none
+# - Optional cache, consulted before each request, provides:
+#     look_up( street ): cached result, or None
+#     look_up_failure( street, provider name ): reason for which provider failed to geocode street, or None
+#     add_failure( street, provider name, reason ): record failure
+# Street is the address or variant that was found.  Results found in the cache are yielded with provider index None.
+# Addresses that no provider can find are yielded with result, provider index, and street None.
+def geocode_addresses( ls_addresses, ls_providers, user_agent, format_query, validate_zip, make_retry_street, cache=None ):
+
+    if not ls_addresses:
+        return
+
+    ls_queues = [collections.deque() for provider in ls_providers]
+    ls_resolved = collections.deque()
+
+    # Queue job for provider, unless its outcome is already known from the cache
+    def queue_job( job, i_provider ):
+
+        if cache:
+            result = cache.look_up( job['street'] )
+            if result:
+                ls_resolved.append( ( job['address'], result, None, job['street'] ) )
+                return
+
+            reason = cache.look_up_failure( job['street'], ls_providers[i_provider].name )
+            if reason:
+                next_step( job, i_provider, reason )
+                return
+
+        ls_queues[i_provider].append( job )
+
+    # Move failed job on: retry a simplified variant with the same provider, or the original address with the next provider
+    def next_step( job, i_provider, reason ):
+
+        retry_street = make_retry_street( job['street'] ) if reason == NOT_FOUND else job['street']
+
+        if retry_street != job['street']:
+            print( '   Retry: <{}> -> <{}>'.format( job['street'], retry_street ) )
+            queue_job( { 'address': job['address'], 'street': retry_street }, i_provider )
+        elif i_provider + 1 < len( ls_providers ):
+            queue_job( { 'address': job['address'], 'street': job['address'] }, i_provider + 1 )
+        else:
+            ls_resolved.append( ( job['address'], None, None, None ) )
+
+    session = make_session( user_agent, sum( provider.n_workers for provider in ls_providers ) )
+    ls_executors = [concurrent.futures.ThreadPoolExecutor( max_workers=provider.n_workers ) for provider in ls_providers]
+    ls_running = [0] * len( ls_providers )
+    dc_futures = {}
+
+    # Keep each provider busy with batches from its queue
+    def submit():
+        for i_provider, provider in enumerate( ls_providers ):
+            while ls_queues[i_provider] and ( ls_running[i_provider] < provider.n_workers ):
+                ls_jobs = [ls_queues[i_provider].popleft() for n in range( min( provider.batch_size, len( ls_queues[i_provider] ) ) )]
+                future = ls_executors[i_provider].submit( provider.geocode, session, [format_query( job['street'] ) for job in ls_jobs] )
+                dc_futures[future] = ( i_provider, ls_jobs )
+                ls_running[i_provider] += 1
+
+    try:
+        # Start all addresses with the first provider; each job holds the original address and the street address currently tried
+        for address in ls_addresses:
+            queue_job( { 'address': address, 'street': address }, 0 )
+
+        submit()
+
+        while True:
+
+            while ls_resolved:
+                yield ls_resolved.popleft()
+
+            if not dc_futures:
+                break
+
+            done, not_done = concurrent.futures.wait( dc_futures, return_when=concurrent.futures.FIRST_COMPLETED )
+
+            for future in done:
+
+                i_provider, ls_jobs = dc_futures.pop( future )
+                provider = ls_providers[i_provider]
+                ls_running[i_provider] -= 1
+
+                try:
+                    ls_results = future.result()
+                    b_error = False
+                except Exception as e:
+                    print( '   Geocoding request failed: {}'.format( e ) )
+                    ls_results = [None] * len( ls_jobs )
+                    b_error = True
+
+                for job, result in zip( ls_jobs, ls_results ):
+
+                    if result:
+                        result[ZIP] = validate_zip( result[ZIP] )
+                        if result[ZIP]:
+                            ls_resolved.append( ( job['address'], result, i_provider, job['street'] ) )
+                            continue
+                        reason = OUTSIDE_AREA
+                    else:
+                        reason = NOT_FOUND
+
+                    # Remember failure, unless the request itself failed
+                    if cache and not b_error:
+                        cache.add_failure( job['street'], provider.name, reason )
+
+                    next_step( job, i_provider, reason )
+
+            submit()
+
+    finally:
+        for executor in ls_executors:
+            executor.shutdown( wait=False, cancel_futures=True )
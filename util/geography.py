@@ -0,0 +1,193 @@
+# Copyright 2024 Energize Lawrence.  All rights reserved.
+
+import os
+import glob
+import hashlib
+
+import geopandas as gpd
+import shapely
+
+import util
+
+
+#
+# Lawrence geometries read from MassGIS shapefiles, shared by lawrence_geography.py and lawrence_geolocate.py
+#
+
+MBLU = util.MBLU
+LAT = util.LATITUDE
+LONG = util.LONGITUDE
+ZIP = util.ZIP
+GEOMETRY = util.GEOMETRY
+
+POSTCODE = 'POSTCODE'
+
+# Reprojected layers are cached as GeoParquet files, keyed by digests of their shapefiles and of this file
+CACHE_DIRECTORY = '../db/geometry_cache'
+
+# Any change to this file invalidates cached layers
+with open( __file__, 'rb' ) as f:
+    GEOMETRY_VERSION = hashlib.sha256( f.read() ).hexdigest()[:16]
+
+
+def pad_slashes( s_mblu ):
+
+    s_mblu = s_mblu.copy()
+
+    s = ~s_mblu.str.contains( '(?:[^/]*/[^/]*){4,}', regex=True )
+
+    while len( s[s] ) > 0:
+        s_mblu.loc[s] = s_mblu.loc[s] + '/'
+        s = ~s_mblu.str.contains( '(?:[^/]*/[^/]*){4,}', regex=True )
+
+    # Clear cells that did not need padding
+    s = s_mblu.str.contains( '////' )
+    s_mblu.loc[s] = ''
+
+    return s_mblu
+
+
+# Calculate digest of shapefile, including its companion files
+def digest_shapefile( filename ):
+
+    hash = hashlib.sha256( GEOMETRY_VERSION.encode() )
+
+    for path in sorted( glob.glob( glob.escape( os.path.splitext( filename )[0] ) + '.*' ) ):
+        hash.update( os.path.basename( path ).encode() )
+        with open( path, 'rb' ) as file:
+            for chunk in iter( lambda: file.read( 1 << 20 ), b'' ):
+                hash.update( chunk )
+
+    return hash.hexdigest()[:16]
+
+
+# Load layer derived from shapefile, from cache if possible; otherwise make it and save it in cache
+def load_cached_layer( s_layer, filename, make_layer ):
+
+    cache_filename = os.path.join( CACHE_DIRECTORY, '{}_{}.parquet'.format( s_layer, digest_shapefile( filename ) ) )
+
+    if os.path.exists( cache_filename ):
+        try:
+            return gpd.read_parquet( cache_filename )
+        except Exception as e:
+            print( 'Geometry cache "{}" not available: {}'.format( cache_filename, e ) )
+
+    df = make_layer( filename )
+
+    try:
+        os.makedirs( CACHE_DIRECTORY, exist_ok=True )
+
+        # Discard layer cached from earlier shapefile
+        for path in glob.glob( os.path.join( CACHE_DIRECTORY, s_layer + '_*.parquet' ) ):
+            os.remove( path )
+
+        df.to_parquet( cache_filename )
+
+    except Exception as e:
+        print( 'Geometry cache "{}" not saved: {}'.format( cache_filename, e ) )
+
+    return df
+
+
+# Replace polygons with polygons bounded by their exterior rings, dropping any holes
+def fill_holes( sr_polygons ):
+    return gpd.GeoSeries( shapely.polygons( shapely.get_exterior_ring( sr_polygons.values ) ), index=sr_polygons.index, crs=sr_polygons.crs )
+
+
+# Make parcels geometry dataframe, in lat/long coordinates
+# - Each Polygon is reduced to its centroid, and each MultiPolygon to its outer envelope
+def make_parcels_geometry( parcels_filename ):
+
+    # Read raw parcels table from the shapefile
+    df = gpd.read_file( parcels_filename )
+
+    # Generate mblu-format column from parcel ID
+    df[MBLU] = df['MAP_PAR_ID']
+    df[MBLU] = df[MBLU].fillna( '' )
+    df[MBLU] = df[MBLU].str.replace( '-', '/' )
+    df[MBLU] = df[MBLU].str.replace( '/0/', '//' )
+    df[MBLU] = df[MBLU].str.replace( '/0$', '/', regex=True )
+    df[MBLU] = df[MBLU].str.replace( '^0/', '/', regex=True )
+    df[MBLU] = pad_slashes( df[MBLU] )
+    df = df[[MBLU, GEOMETRY]].copy()
+
+    # Take the outer envelope of each MultiPolygon, which will be a Polygon
+    sr_multi = df.geom_type == 'MultiPolygon'
+    sr_located = sr_multi | ( df.geom_type == 'Polygon' )
+    df.loc[sr_multi, GEOMETRY] = df.loc[sr_multi, GEOMETRY].envelope
+
+    # Transform shapes to lat/long coordinates, all at once
+    sr_shapes = fill_holes( df.loc[sr_located, GEOMETRY] ).to_crs( epsg=4326 )
+    sr_centroids = gpd.GeoSeries( shapely.centroid( sr_shapes.values ), index=sr_shapes.index, crs=sr_shapes.crs )
+
+    # Save envelopes of MultiPolygons and centroids of Polygons; shapes of any other type are not located
+    df_located = gpd.GeoDataFrame( { MBLU: df[MBLU] }, geometry=sr_centroids.where( ~sr_multi[sr_located], sr_shapes ).reindex( df.index ), crs=sr_shapes.crs )
+    df_located[LAT] = sr_centroids.y
+    df_located[LONG] = sr_centroids.x
+
+    # Return dataframe
+    df_located = df_located[ [MBLU, GEOMETRY, LAT, LONG] ]
+    return df_located
+
+
+# Load parcels geometry dataframe
+def load_parcels_geometry( parcels_filename ):
+    return load_cached_layer( 'parcels', parcels_filename, make_parcels_geometry )
+
+
+# Make Lawrence precincts geometry dataframe, in lat/long coordinates
+def make_precincts_geometry( wards_filename ):
+
+    # Read raw wards table from the shapefile
+    df = gpd.read_file( wards_filename )
+
+    # Extract rows pertaining to Lawrence
+    df = df[ df['TOWN'] == 'LAWRENCE' ]
+
+    # Transform to lat/long coordinate system
+    df[GEOMETRY] = fill_holes( df[GEOMETRY] )
+    df = df.to_crs( epsg=4326 )
+
+    # Return dataframe
+    return df
+
+
+# Load Lawrence precincts geometry dataframe
+def load_precincts_geometry( wards_filename ):
+    return load_cached_layer( 'precincts', wards_filename, make_precincts_geometry )
+
+
+# Load Lawrence zip code geometries, in lat/long coordinates
+def load_zip_codes_geometry( zip_codes_filename ):
+
+    df = gpd.read_file( zip_codes_filename )
+    df = df[ df['CITY_TOWN'] == 'LAWRENCE' ]
+    df = df[[POSTCODE, GEOMETRY]]
+    df[GEOMETRY] = df.buffer( 0 )
+    df = df.to_crs( epsg=4326 )
+
+    return df
+
+
+# Geolocate parcels at centroids of their shapes, matched by MBLU
+# - Returns latitude, longitude, and zip code of each matched parcel, indexed like the parcels
+# - Parcels whose centroids fall outside Lawrence zip codes are not matched
+def locate_parcels_by_geometry( df_parcels, parcels_filename, zip_codes_filename ):
+
+    # Find centroid of each parcel shape
+    df_geometry = load_parcels_geometry( parcels_filename )
+    df_geometry = df_geometry[ ( df_geometry[MBLU] != '' ) & df_geometry[LAT].notnull() ]
+    df_geometry = df_geometry.drop_duplicates( subset=[MBLU] ).set_index( MBLU )
+
+    # Join parcels to centroids
+    df_located = df_parcels[[MBLU]].join( df_geometry[[LAT, LONG]], on=MBLU, how='inner' )
+
+    # Find zip code containing each centroid
+    df_points = gpd.GeoDataFrame( df_located, geometry=gpd.points_from_xy( df_located[LONG], df_located[LAT] ), crs='epsg:4326' )
+    df_points = gpd.sjoin( df_points, load_zip_codes_geometry( zip_codes_filename ), how='left', predicate='within' )
+    df_points = df_points[ ~df_points.index.duplicated( keep='first' ) ]
+
+    df_located[ZIP] = df_points[POSTCODE]
+    df_located = df_located[ df_located[ZIP].isin( util.LAWRENCE_ZIPS ) ]
+
+    return df_located[[LAT, LONG, ZIP]]
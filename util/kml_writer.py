@@ -0,0 +1,118 @@
+# Copyright 2025 Energize Lawrence.  All rights reserved.
+
+from xml.sax.saxutils import escape
+
+import util
+
+
+#
+# Streaming KML writer
+# - Elements are written straight to the output file as they are generated, without building an object tree.
+# - A fragment written to one KML file can be copied into other KML files, by its location in the first file.
+#
+
+KML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="{}">\n'.format( util.KML_NAMESPACE )
+KML_FOOTER = '</kml>\n'
+
+COPY_CHUNK_SIZE = 1 << 20
+
+
+# Format element containing text
+def format_text_element( s_tag, text ):
+    return '<{0}>{1}</{0}>'.format( s_tag, escape( str( text ) ) )
+
+
+# Format KML color, in aabbggrr order
+def format_color( red, green, blue, alpha=255 ):
+    return '{:02x}{:02x}{:02x}{:02x}'.format( alpha, blue, green, red )
+
+
+# Format style of icon and label
+def format_icon_style( s_id, s_color, s_icon_href, icon_scale, label_scale ):
+    return '<Style id="{}"><IconStyle><color>{}</color><scale>{}</scale><Icon><href>{}</href></Icon></IconStyle><LabelStyle><scale>{}</scale></LabelStyle></Style>\n'.format(
+        s_id, s_color, icon_scale, escape( s_icon_href ), label_scale )
+
+
+# Format stylemap switching between normal and highlight styles
+def format_style_map( s_id, s_normal_id, s_highlight_id ):
+    return '<StyleMap id="{}"><Pair><key>normal</key><styleUrl>#{}</styleUrl></Pair><Pair><key>highlight</key><styleUrl>#{}</styleUrl></Pair></StyleMap>\n'.format(
+        s_id, s_normal_id, s_highlight_id )
+
+
+# Format style of filled, outlined polygon
+def format_polygon_style( s_id, s_line_color, line_width, s_poly_color ):
+    return '<Style id="{}"><LineStyle><color>{}</color><width>{}</width></LineStyle><PolyStyle><color>{}</color><fill>1</fill><outline>1</outline></PolyStyle></Style>\n'.format(
+        s_id, s_line_color, line_width, s_poly_color )
+
+
+# Format placemark at a polygon, bounded by list of ( longitude, latitude ) coordinates
+def format_polygon_placemark( s_name, s_description, s_style_id, ls_coords ):
+    s_coords = ' '.join( '{},{},0.0'.format( long, lat ) for long, lat in ls_coords )
+    return '<Placemark>{}{}<styleUrl>#{}</styleUrl><Polygon><outerBoundaryIs><LinearRing><coordinates>{}</coordinates></LinearRing></outerBoundaryIs></Polygon></Placemark>\n'.format(
+        format_text_element( 'name', s_name ), format_text_element( 'description', s_description ), s_style_id, s_coords )
+
+
+# Format placemark at a point
+def format_point_placemark( s_name, s_description, s_style_id, longitude, latitude ):
+    return '<Placemark>{}{}<styleUrl>#{}</styleUrl><Point><coordinates>{},{},0.0</coordinates></Point></Placemark>\n'.format(
+        format_text_element( 'name', s_name ), format_text_element( 'description', s_description ), s_style_id, longitude, latitude )
+
+
+# Write KML file element by element
+class KmlWriter:
+
+    def __init__( self, filename ):
+        self.filename = filename
+        self.file = None
+        self.ls_open = []
+
+    def __enter__( self ):
+        self.file = open( self.filename, 'wb' )
+        self.write( KML_HEADER )
+        return self
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        try:
+            while self.ls_open:
+                self.end()
+            self.write( KML_FOOTER )
+        finally:
+            self.file.close()
+
+    def write( self, s ):
+        self.file.write( s.encode( 'utf-8' ) )
+
+    # Open container element, such as Document or Folder, with optional name and visibility
+    def start( self, s_tag, s_name=None, s_visibility=None ):
+        self.write( '<{}>\n'.format( s_tag ) )
+        self.ls_open.append( s_tag )
+        if s_name is not None:
+            self.write( format_text_element( 'name', s_name ) + '\n' )
+        if s_visibility is not None:
+            self.write( format_text_element( 'visibility', s_visibility ) + '\n' )
+
+    # Close most recently opened container element
+    def end( self ):
+        self.write( '</{}>\n'.format( self.ls_open.pop() ) )
+
+    # Mark start of fragment to be copied into other files
+    def start_fragment( self ):
+        return self.file.tell()
+
+    # Return location of fragment that started at given offset: ( filename, offset, length )
+    def end_fragment( self, offset ):
+        return ( self.filename, offset, self.file.tell() - offset )
+
+    # Copy fragment from another KML file, which must already be closed
+    def copy( self, fragment ):
+
+        s_filename, offset, length = fragment
+
+        with open( s_filename, 'rb' ) as f:
+            f.seek( offset )
+            while length > 0:
+                chunk = f.read( min( COPY_CHUNK_SIZE, length ) )
+                if not chunk:
+                    raise EOFError( 'KML fragment truncated in {}'.format( s_filename ) )
+                self.file.write( chunk )
+                length -= len( chunk )
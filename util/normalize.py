@@ -4,14 +4,53 @@ import pandas as pd
 pd.set_option( 'display.max_columns', 500 )
 pd.set_option( 'display.width', 1000 )
 
+import os
 import re
 import usaddress
 import copy
 import collections
+import functools
+import hashlib
+import importlib.metadata
+import json
+import sqlite3
+import atexit
+import multiprocessing
 
 import util
 
 
+# Persistent cache of normalized addresses; set to None to disable
+CACHE_FILENAME = '../db/normalize_cache.sqlite'
+CACHE_FLUSH_SIZE = 1000
+LRU_SIZE = 2 ** 17
+
+# Minimum number of uncached addresses worth parsing in a process pool
+POOL_MIN_ADDRESSES = 10000
+
+# Columns produced by normalize_addresses() with return_parts=True
+NORMALIZED_COLUMNS = \
+[
+    util.NORMALIZED_ADDRESS,
+    util.NORMALIZED_STREET_NUMBER,
+    util.NORMALIZED_STREET_NAME,
+    util.NORMALIZED_OCCUPANCY,
+    util.NORMALIZED_ADDITIONAL_INFO,
+]
+
+# Any change to this file, to the util column names of normalized parts, or to the usaddress parser invalidates cached results
+# - usaddress does not define __version__, so its version is read from its package metadata
+try:
+    USADDRESS_VERSION = importlib.metadata.version( 'usaddress' )
+except importlib.metadata.PackageNotFoundError:
+    USADDRESS_VERSION = getattr( usaddress, '__version__', '' )
+
+with open( __file__, 'rb' ) as f:
+    RULES_VERSION = hashlib.sha256( f.read() + repr( [NORMALIZED_COLUMNS, USADDRESS_VERSION] ).encode() ).hexdigest()[:16]
+
+cache_conn = None
+cache_pending = []
+
 
 # Based on USPS guidelines: https://pe.usps.com/text/pub28/28apc_002.htm
 STREET_TYPES = \
@@ -134,48 +173,141 @@ EXPECTED_KEYS = \
 }
 
 
+# Typo fixes applied to every address, in order.  Each rule maps a regular expression to its replacement.
+INPUT_RULES = \
+[
+    ( r' CI$', ' CIR' ),
+    ( r' CI ', ' CIR ' ),
+    ( r' UNION$', ' UNION ST' ),
+    ( r' ST ST ', ' ST ' ),
+    ( r' T$', ' ST' ),
+    ( r' BROADWAY ST[A-Z]*$', ' BROADWAY ' ),
+    ( r' AB FARNHAM ', ' A-B FARNHAM ' ),
+    ( r'18 FRANKLIN-45 BROADWAY', '18 FRANKLIN ST (45 BROADWAY)' ),
+    ( r' \d+([A-Z][A-Z])? FL(OOR)? ', ' ' ),
+    ( r' BERNNINGTON ', ' BENNINGTON ' ),
+    ( r'22 ?- ?24 PLEASANT$', '22-24 PLEASANT TER' ),
+    ( r'(\d+) W ST', r'\1 WEST ST' ),
+    ( r' ALLYN$', ' ALLYN TER' ),
+    ( r' WESTWOOD$', ' WESTWOOD TER' ),
+    ( r' COLONIAL$', ' COLONIAL TER' ),
+    ( r' ANDOVER$', ' ANDOVER TER' ),
+    ( r' BICKNELL$', ' BICKNELL TER' ),
+    ( r' HAYDEN$', ' HAYDEN AVE' ),
+    ( r'^5-7- ARLINGTON TERR$', '5-7 ARLINGTON TER' ),
+    ( r'^197-999 BRUCE ST$', '197-199 BRUCE ST' ),
+    ( r'^100 WATER ST\)$', '100 WATER ST' ),
+    ( r'^1 COMMONWEALTH DR/ 135 MARSTON$', '1 COMMONWEALTH DR' ),
+    ( r' ST STR$', ' ST' ),
+    ( r' NEW$', '' ),
+]
+
+# Typo fixes applied after INPUT_RULES, by city
+CITY_INPUT_RULES = \
+{
+    # Addresses of Lawrence parcels scraped from the Vision website
+    'LAWRENCE':
+    [
+        ( r'BEACONSFIED ST', 'BEACONSFIELD ST' ),
+        ( r'BROOMFIELD ST', 'BROMFIELD ST' ),
+        ( r'LANDSDOWNE CT', 'LANSDOWNE CT' ),
+        ( r'MCABE CT', 'MCCABE CT' ),
+        ( r'GENESSE ST', 'GENESEE ST' ),
+        ( r'LINCOLN ST', 'LINCOLN CT' ),
+        ( r'CENTRE ST', 'CENTER ST' ),
+        ( r'170 E FERRY ST', '170E FERRY ST' ),
+        ( r'MYTRLE CT', 'MYRTLE CT' ),
+        ( r'GRAICHEN CT', 'GRAICHEN TER' ),
+    ],
+}
+
+
+# Return literal text matched by a regular expression, or None if it contains special characters
+def literal_text( pattern ):
+
+    text = ''
+    escaped = False
+
+    for c in pattern:
+        if escaped:
+            if c.isalnum():
+                return None
+            text += c
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        elif c in '.^$*+?{}[]|()':
+            return None
+        else:
+            text += c
+
+    return text
+
+
+# Compile ordered rewrite rules into passes
+#
+# Consecutive rules that match an entire literal address are combined into one dictionary lookup.
+# Other consecutive rules are screened by a single combined expression, so that an address
+# matching none of them skips the whole pass.
+def compile_rules( ls_rules ):
+
+    ls_passes = []
+
+    for pattern, replacement in ls_rules:
+
+        text = literal_text( pattern[1:-1] ) if pattern.startswith( '^' ) and pattern.endswith( '$' ) else None
+
+        if ( text is not None ) and ( '\\' not in replacement ):
+
+            # Start a new dictionary pass if necessary
+            if not ls_passes or ls_passes[-1]['exact'] is None:
+                ls_passes.append( { 'exact': {}, 'patterns': [], 'subs': [] } )
+            exact = ls_passes[-1]['exact']
+
+            # Preserve rule order: earlier results that this rule matches are rewritten too
+            for key in exact:
+                if exact[key] == text:
+                    exact[key] = replacement
+            exact.setdefault( text, replacement )
+
+        else:
+
+            # Start a new regular expression pass if necessary
+            if not ls_passes or ls_passes[-1]['exact'] is not None:
+                ls_passes.append( { 'exact': None, 'patterns': [], 'subs': [] } )
+            ls_passes[-1]['patterns'].append( '(?:{0})'.format( pattern ) )
+            ls_passes[-1]['subs'].append( ( re.compile( pattern ), replacement ) )
+
+    # Combine patterns of each regular expression pass into a single screen
+    return [ ( dc_pass['exact'], re.compile( '|'.join( dc_pass['patterns'] ) ), dc_pass['subs'] ) for dc_pass in ls_passes ]
+
+
+# Apply compiled rewrite rules to an address
+def apply_rules( address, ls_passes ):
+
+    for exact, screen, ls_subs in ls_passes:
+        if exact is not None:
+            address = exact.get( address, address )
+        elif screen.search( address ):
+            for regex, replacement in ls_subs:
+                address = regex.sub( replacement, address )
+
+    return address
+
+
+INPUT_PASSES = compile_rules( INPUT_RULES )
+CITY_INPUT_PASSES = { city: compile_rules( ls_rules ) for city, ls_rules in CITY_INPUT_RULES.items() }
+
+
 # Help usaddress parsing algorithm with troublesome address inputs
 def fix_inputs_we_dont_like( address, city, return_parts, verbose ):
 
     # Miscellaneous typos
-    address = re.sub( r' CI$', ' CIR', address )
-    address = address.replace( ' CI ', ' CIR ' )
-    address = re.sub( r' UNION$', ' UNION ST', address )
-    address = re.sub( r' ST ST ', ' ST ', address )
-    address = re.sub( r' T$', ' ST', address )
-    address = re.sub( r' BROADWAY ST[A-Z]*$', ' BROADWAY ', address )
-    address = re.sub( r' AB FARNHAM ', ' A-B FARNHAM ', address )
-    address = re.sub( r'18 FRANKLIN-45 BROADWAY', '18 FRANKLIN ST (45 BROADWAY)', address )
-    address = re.sub( r' \d+([A-Z][A-Z])? FL(OOR)? ', ' ', address )
-    address = address.replace( ' BERNNINGTON ', ' BENNINGTON ' )
-    address = re.sub( r'22 ?- ?24 PLEASANT$', '22-24 PLEASANT TER', address )
-    address = re.sub( r'^5-7- ARLINGTON TERR$', '5-7 ARLINGTON TER', address )
-    address = re.sub( r'(\d+) W ST', r'\1 WEST ST', address )
-    address = re.sub( r' ALLYN$', ' ALLYN TER', address )
-    address = re.sub( r' WESTWOOD$', ' WESTWOOD TER', address )
-    address = re.sub( r' COLONIAL$', ' COLONIAL TER', address )
-    address = re.sub( r' ANDOVER$', ' ANDOVER TER', address )
-    address = re.sub( r' BICKNELL$', ' BICKNELL TER', address )
-    address = re.sub( r' HAYDEN$', ' HAYDEN AVE', address )
-    address = re.sub( r'^197-999 BRUCE ST$', '197-199 BRUCE ST', address )
-    address = re.sub( r'^100 WATER ST\)$', '100 WATER ST', address )
-    address = re.sub( r'^1 COMMONWEALTH DR/ 135 MARSTON$', '1 COMMONWEALTH DR', address )
-    address = re.sub( r' ST STR$', ' ST', address ).strip()
-    address = re.sub( r' NEW$', '', address ).strip()
-
-    # Fix typos in addresses of Lawrence parcels scraped from the Vision website
-    if city == 'LAWRENCE':
-        address = re.sub( r'BEACONSFIED ST', 'BEACONSFIELD ST', address )
-        address = re.sub( r'BROOMFIELD ST', 'BROMFIELD ST', address )
-        address = re.sub( r'LANDSDOWNE CT', 'LANSDOWNE CT', address )
-        address = re.sub( r'MCABE CT', 'MCCABE CT', address )
-        address = re.sub( r'GENESSE ST', 'GENESEE ST', address )
-        address = re.sub( r'LINCOLN ST', 'LINCOLN CT', address )
-        address = re.sub( r'CENTRE ST', 'CENTER ST', address )
-        address = re.sub( r'170 E FERRY ST', '170E FERRY ST', address )
-        address = re.sub( r'MYTRLE CT', 'MYRTLE CT', address )
-        address = re.sub( r'GRAICHEN CT', 'GRAICHEN TER', address )
+    address = apply_rules( address, INPUT_PASSES ).strip()
 
+    # City-specific typos
+    if city in CITY_INPUT_PASSES:
+        address = apply_rules( address, CITY_INPUT_PASSES[city] )
 
     # Remove spaces around hyphens
     address = re.sub( r' ?- ?', '-', address )
@@ -416,12 +548,172 @@ def fix_outputs_we_dont_like( parts, city, return_parts, verbose ):
     return parts
 
 
+# Open persistent cache, discarding results produced by earlier rules
+def open_cache():
+
+    global cache_conn
+    global CACHE_FILENAME
+
+    if ( cache_conn is None ) and CACHE_FILENAME:
+
+        try:
+            cache_conn = sqlite3.connect( CACHE_FILENAME, timeout=60 )
+            cache_conn.execute( 'CREATE TABLE IF NOT EXISTS NormalizedAddresses ( original TEXT, city TEXT, return_parts INTEGER, rules_version TEXT, result TEXT, PRIMARY KEY ( original, city, return_parts, rules_version ) )' )
+            cache_conn.execute( 'DELETE FROM NormalizedAddresses WHERE rules_version <> ?', ( RULES_VERSION, ) )
+            cache_conn.commit()
+            atexit.register( flush_cache )
+        except sqlite3.Error as e:
+            print( 'Address cache "{0}" not available: {1}'.format( CACHE_FILENAME, e ) )
+            cache_conn = None
+            CACHE_FILENAME = None
+
+    return cache_conn
+
+
+# Save newly normalized addresses to persistent cache
+def flush_cache():
+
+    global cache_pending
+
+    if cache_conn and cache_pending:
+        try:
+            cache_conn.executemany( 'INSERT OR REPLACE INTO NormalizedAddresses VALUES ( ?, ?, ?, ?, ? )', cache_pending )
+            cache_conn.commit()
+        except sqlite3.Error as e:
+            print( 'Address cache not saved: {0}'.format( e ) )
+
+    cache_pending = []
+
+
+# Close persistent cache, saving pending results; it is reopened when next needed
+# - Worker processes must not inherit an open connection, so the cache is closed before a process pool is started
+def close_cache():
+
+    global cache_conn
+
+    flush_cache()
+
+    if cache_conn:
+        cache_conn.close()
+        cache_conn = None
+        atexit.unregister( flush_cache )
+
+
+# Read normalized address from persistent cache; return None if not found
+def read_cache( original, city, return_parts ):
+
+    # Only strings can be cached persistently
+    conn = open_cache() if isinstance( original, str ) else None
+
+    if conn:
+        row = conn.execute( 'SELECT result FROM NormalizedAddresses WHERE original=? AND city=? AND return_parts=? AND rules_version=?', ( original, city or '', int( return_parts ), RULES_VERSION ) ).fetchone()
+        if row:
+            return json.loads( row[0] )
+
+    return None
+
+
+# Queue normalized address for saving to persistent cache
+def write_cache( original, city, return_parts, value ):
+
+    if isinstance( original, str ) and open_cache():
+        cache_pending.append( ( original, city or '', int( return_parts ), RULES_VERSION, json.dumps( value ) ) )
+        if len( cache_pending ) >= CACHE_FLUSH_SIZE:
+            flush_cache()
+
+
+# Look up normalized address, parsing only if not found in memory or persistent cache
+@functools.lru_cache( maxsize=LRU_SIZE )
+def lookup_address( original, city, return_parts ):
+
+    value = read_cache( original, city, return_parts )
+
+    if value is None:
+        value = parse_address( original, None, city, return_parts, False )
+        write_cache( original, city, return_parts, value )
+
+    return value
+
+
 # Normalize street address
 def normalize_address( row, col_name, city='ANDOVER', return_parts=False, verbose=False ):
 
     # Create original copy of the address
     original = row[col_name]
 
+    # Trace parsing steps without the cache
+    if verbose:
+        return parse_address( original, col_name, city, return_parts, verbose )
+
+    value = lookup_address( original, city, return_parts )
+
+    # Protect cached dictionary from modification by caller
+    return dict( value ) if return_parts else value
+
+
+# Normalize series of street addresses, parsing each distinct value only once
+#
+# Returns a dataframe of NORMALIZED_COLUMNS, or a series of addresses if return_parts is False,
+# aligned to the index of the input series.  With n_processes > 1, large numbers of uncached
+# addresses are parsed in a pool of worker processes.
+def normalize_addresses( series, city='ANDOVER', return_parts=True, n_processes=1 ):
+
+    # Find distinct addresses; missing values get code -1
+    codes, uniques = pd.factorize( series )
+    ls_unique = list( uniques ) + [None]
+
+    if ( n_processes or 1 ) > 1:
+
+        # Resolve what we can from the cache, in this process
+        ls_values = [ read_cache( original, city, return_parts ) for original in ls_unique ]
+        ls_missing = [ i for i, value in enumerate( ls_values ) if value is None ]
+
+        if len( ls_missing ) >= POOL_MIN_ADDRESSES:
+
+            # Parse the rest in worker processes
+            close_cache()
+            ls_args = [ ( ls_unique[i], city, return_parts ) for i in ls_missing ]
+            with multiprocessing.Pool( n_processes ) as pool:
+                ls_parsed = pool.starmap( parse_address_in_worker, ls_args, chunksize=max( 1, len( ls_args ) // ( 8 * n_processes ) ) )
+
+            for i, value in zip( ls_missing, ls_parsed ):
+                write_cache( ls_unique[i], city, return_parts, value )
+                ls_values[i] = value
+
+            flush_cache()
+
+        else:
+            for i in ls_missing:
+                ls_values[i] = lookup_address( ls_unique[i], city, return_parts )
+
+    else:
+        ls_values = [ lookup_address( original, city, return_parts ) for original in ls_unique ]
+
+    # Expand distinct results back to the full series; code -1 selects the trailing entry for None
+    if return_parts:
+        df_values = pd.DataFrame( ls_values, columns=NORMALIZED_COLUMNS )
+        result = df_values.iloc[codes]
+    else:
+        result = pd.Series( ls_values, dtype=object ).iloc[codes]
+
+    result.index = series.index
+
+    return result
+
+
+# Parse street address in a worker process
+# - An exit from a worker would lose its task and leave the pool waiting forever, so it is raised as an ordinary exception
+def parse_address_in_worker( original, city, return_parts ):
+    try:
+        return parse_address( original, None, city, return_parts, False )
+    except SystemExit as e:
+        raise RuntimeError( 'Exit while normalizing address "{0}": {1}'.format( original, e ) ) from None
+
+
+# Parse and normalize street address
+# - Raises ValueError if the parser output cannot be normalized
+def parse_address( original, col_name, city, return_parts, verbose ):
+
     # Initialize return value
     address = original.strip().upper() if ( original != None ) else ''
 
@@ -455,9 +747,7 @@ def normalize_address( row, col_name, city='ANDOVER', return_parts=False, verbos
                     if verbose:
                         print( '- {0} "{1}"'.format( key, parts[key] ) )
                     if key not in EXPECTED_KEYS:
-                        print( address )
-                        print( 'KEY NOT RECOGNIZED', key, parts[key] )
-                        exit()
+                        raise ValueError( 'KEY NOT RECOGNIZED {0} "{1}" in address "{2}"'.format( key, parts[key], address ) )
 
                 if 'StreetNamePostType' in keys:
                     street_type = parts['StreetNamePostType']
@@ -466,9 +756,7 @@ def normalize_address( row, col_name, city='ANDOVER', return_parts=False, verbos
                     elif street_type in STREET_TYPES:
                         parts['StreetNamePostType'] = STREET_TYPES[street_type]
                     else:
-                        print( address )
-                        print( 'STREET TYPE NOT FOUND', street_type )
-                        exit()
+                        raise ValueError( 'STREET TYPE NOT FOUND "{0}" in address "{1}"'.format( street_type, address ) )
 
                 if ( 'StreetNamePreDirectional' in keys ) and ( 'StreetName' in keys ):
                     pre_dir = parts['StreetNamePreDirectional']
@@ -480,10 +768,7 @@ def normalize_address( row, col_name, city='ANDOVER', return_parts=False, verbos
                         parts['AddressNumber'] += '-' + pre_dir
                         parts['StreetNamePreDirectional'] = ''
                     else:
-                        print( address )
-                        print( parts )
-                        print( 'PRE DIRECTIONAL NOT FOUND', pre_dir )
-                        exit()
+                        raise ValueError( 'PRE DIRECTIONAL NOT FOUND "{0}" in address "{1}", parsed as {2}'.format( pre_dir, address, parts ) )
 
                 if ( 'StreetNamePostDirectional' in keys ) and ( 'StreetName' in keys ):
                     post_dir = parts['StreetNamePostDirectional']
@@ -492,8 +777,7 @@ def normalize_address( row, col_name, city='ANDOVER', return_parts=False, verbos
                     elif post_dir in DIRS:
                         parts['StreetNamePostDirectional'] = DIRS[post_dir]
                     else:
-                        print( 'POST DIRECTIONAL NOT FOUND', post_dir )
-                        exit()
+                        raise ValueError( 'POST DIRECTIONAL NOT FOUND "{0}" in address "{1}"'.format( post_dir, address ) )
 
                 # Package final results
                 a_org = []
@@ -515,9 +799,7 @@ def normalize_address( row, col_name, city='ANDOVER', return_parts=False, verbos
                 if s_new.endswith( trailing_address_parts ):
                     address = s_new[ :-len( trailing_address_parts ) ]
                 else:
-                    print( '<{}> expected to end with <{}>'.format( s_new, trailing_address_parts ) )
-                    print( 'BAD ENDING!!!' )
-                    exit()
+                    raise ValueError( 'BAD ENDING: <{0}> expected to end with <{1}>'.format( s_new, trailing_address_parts ) )
 
         except usaddress.RepeatedLabelError:
 
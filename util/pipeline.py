@@ -0,0 +1,546 @@
+# Copyright 2025 Energize Lawrence.  All rights reserved.
+
+import os
+import sys
+import gc
+import ast
+import functools
+import runpy
+import shlex
+import traceback
+import hashlib
+import datetime
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import concurrent.futures
+
+
+#
+# Build graph runner
+#
+# A build is described as a list of steps.  Each step is a dictionary:
+#
+#   'label':   Text printed in the '=======>' banner
+#   'command': Shell command; '{master}' is replaced by the database the step writes
+#   'reads':   Tables read from the master database
+#   'writes':  Tables written to the master database
+#   'create':  Optional.  True if the step creates (deletes and recreates) the master database
+#   'inputs':  Optional.  Files or directories read by the step that are not named in its command
+#   'outputs': Optional.  Files or directories written by the step outside the master database
+#
+# A step depends on every earlier step that writes a table it reads or writes, or reads a table it writes.
+# A step that creates the master database is a barrier for all later steps that use the master database.
+# Independent steps run concurrently, subject to the following rules for access to the master database:
+#
+# - Steps that write tables they do not read (typically spreadsheet ingests) run against a private staging
+#   database, without holding any lock.  Their tables are then copied into the master database by the writer.
+# - Steps that read and write the master database hold the writer lock for their duration.
+# - Steps that only read the master database share the lock with each other.
+#
+# Steps that do not touch the master database at all run unrestricted.
+#
+# A step that appends to a table written by an earlier step must list that table in both 'reads' and 'writes'.
+#
+# In-process execution:
+#
+# Optionally, steps run one at a time in the calling process instead of in child interpreters.  Each populator
+# script executes as '__main__' with its command-line arguments, so it needs no changes.  Modules such as util,
+# pandas and geopandas are imported once for the whole build, and util shares one connection per database file.
+#
+# Incremental rebuilds:
+#
+# Each step is fingerprinted from its command, the contents of its input files, and the fingerprints of the
+# steps it depends on.  Input files are the 'inputs' list plus every command argument that names an existing
+# file or directory, including the populator script itself and the local modules it imports.  Command
+# arguments that name outputs, or directories containing them, are not inputs.  Fingerprints of successful
+# steps are saved in a build state database beside the master database.  A step whose fingerprint is
+# unchanged, whose tables are all present in the master database, and whose outputs all exist, is skipped,
+# unless a step it depends on ran in the same build.  A step that creates the master database always runs
+# if the database does not exist.
+#
+
+# Directory of modules shared by populator scripts, relative to the directory in which they run
+SHARED_MODULE_DIRECTORY = os.path.join( '..', 'util' )
+
+
+# Lock allowing many concurrent readers or a single writer
+class ReadWriteLock:
+
+    def __init__( self ):
+        self.cond = threading.Condition()
+        self.n_readers = 0
+        self.b_writing = False
+
+    def acquire_read( self ):
+        with self.cond:
+            while self.b_writing:
+                self.cond.wait()
+            self.n_readers += 1
+
+    def release_read( self ):
+        with self.cond:
+            self.n_readers -= 1
+            self.cond.notify_all()
+
+    def acquire_write( self ):
+        with self.cond:
+            while self.b_writing or self.n_readers:
+                self.cond.wait()
+            self.b_writing = True
+
+    def release_write( self ):
+        with self.cond:
+            self.b_writing = False
+            self.cond.notify_all()
+
+
+# Find indices of steps on which each step depends
+def find_dependencies( ls_steps ):
+
+    ls_deps = []
+
+    for i, step in enumerate( ls_steps ):
+
+        reads = set( step.get( 'reads', [] ) )
+        writes = set( step.get( 'writes', [] ) )
+        b_master = bool( reads or writes or step.get( 'create' ) )
+
+        deps = set()
+
+        for j in range( i ):
+            prior = ls_steps[j]
+            prior_reads = set( prior.get( 'reads', [] ) )
+            prior_writes = set( prior.get( 'writes', [] ) )
+
+            if ( prior_writes & ( reads | writes ) ) or ( prior_reads & writes ) or ( b_master and prior.get( 'create' ) ):
+                deps.add( j )
+
+            # A step that creates the database must wait for every earlier step that uses it
+            elif step.get( 'create' ) and ( prior_reads or prior_writes ):
+                deps.add( j )
+
+        ls_deps.append( deps )
+
+    return ls_deps
+
+
+# Determine whether step writes new tables without reading from the master database
+def is_staged( step ):
+    return bool( step.get( 'writes' ) ) and not step.get( 'reads' ) and not step.get( 'create' )
+
+
+# Copy tables from staging database into master database, preserving table definitions
+def copy_staged_tables( staging_filename, master_filename, ls_tables ):
+
+    conn = sqlite3.connect( master_filename )
+    cur = conn.cursor()
+    cur.execute( 'ATTACH DATABASE ? AS staging', ( staging_filename, ) )
+
+    for table_name in ls_tables:
+        cur.execute( 'SELECT sql FROM staging.sqlite_master WHERE type="table" AND name=?', ( table_name, ) )
+        row = cur.fetchone()
+        if row is None:
+            print( '!!! Staging database "{0}" has no table "{1}"'.format( staging_filename, table_name ) )
+            continue
+
+        cur.execute( 'DROP TABLE IF EXISTS main."{0}"'.format( table_name ) )
+        cur.execute( row[0] )
+        cur.execute( 'INSERT INTO main."{0}" SELECT * FROM staging."{0}"'.format( table_name ) )
+
+    conn.commit()
+    cur.execute( 'DETACH DATABASE staging' )
+    conn.close()
+
+
+# Open build state database that accompanies specified master database
+def open_build_state( master_filename ):
+
+    state_filename = os.path.splitext( master_filename )[0] + '_build_state.sqlite'
+    conn = sqlite3.connect( state_filename )
+    cur = conn.cursor()
+    cur.execute( 'CREATE TABLE IF NOT EXISTS BuildSteps ( label TEXT PRIMARY KEY, fingerprint TEXT, completed TEXT )' )
+    cur.execute( 'CREATE TABLE IF NOT EXISTS InputFiles ( path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT )' )
+    conn.commit()
+
+    return conn, cur
+
+
+# Calculate digest of file contents, reusing saved digest if size and modification time are unchanged
+def digest_file( path, cur ):
+
+    stat = os.stat( path )
+    cur.execute( 'SELECT digest FROM InputFiles WHERE path=? AND size=? AND mtime_ns=?', ( path, stat.st_size, stat.st_mtime_ns ) )
+    row = cur.fetchone()
+    if row:
+        return row[0]
+
+    hash = hashlib.sha256()
+    with open( path, 'rb' ) as file:
+        for chunk in iter( lambda: file.read( 1 << 20 ), b'' ):
+            hash.update( chunk )
+    digest = hash.hexdigest()
+
+    cur.execute( 'INSERT OR REPLACE INTO InputFiles VALUES ( ?, ?, ?, ? )', ( path, stat.st_size, stat.st_mtime_ns, digest ) )
+
+    return digest
+
+
+# Calculate digest of input file, or of all files in input directory
+def digest_input( path, cur ):
+
+    if os.path.isdir( path ):
+        hash = hashlib.sha256()
+        for dir_path, dir_names, file_names in sorted( os.walk( path ) ):
+            dir_names.sort()
+            for file_name in sorted( file_names ):
+                file_path = os.path.join( dir_path, file_name )
+                hash.update( os.path.relpath( file_path, path ).encode() )
+                hash.update( digest_file( file_path, cur ).encode() )
+        return hash.hexdigest()
+
+    elif os.path.isfile( path ):
+        return digest_file( path, cur )
+
+    else:
+        return 'missing'
+
+
+# Find local modules imported directly by Python source file, looked up beside it and in the shared directory
+@functools.lru_cache( maxsize=None )
+def find_imported_modules( path ):
+
+    try:
+        with open( path, 'rb' ) as file:
+            tree = ast.parse( file.read(), filename=path )
+    except ( OSError, SyntaxError, ValueError ):
+        return []
+
+    ls_names = []
+    for node in ast.walk( tree ):
+        if isinstance( node, ast.Import ):
+            ls_names += [alias.name for alias in node.names]
+        elif isinstance( node, ast.ImportFrom ) and node.module and not node.level:
+            ls_names.append( node.module )
+
+    ls_modules = []
+    for name in ls_names:
+        for directory in [os.path.dirname( path ), SHARED_MODULE_DIRECTORY]:
+            module_path = os.path.normpath( os.path.join( directory, name.split( '.' )[0] + '.py' ) )
+            if os.path.isfile( module_path ):
+                if module_path not in ls_modules:
+                    ls_modules.append( module_path )
+                break
+
+    return ls_modules
+
+
+# Find local modules imported by Python script, directly or through other local modules
+def find_local_modules( script ):
+
+    script = os.path.normpath( script )
+    ls_found = []
+    ls_pending = [script]
+
+    while ls_pending:
+        for module_path in find_imported_modules( ls_pending.pop() ):
+            if ( module_path != script ) and ( module_path not in ls_found ):
+                ls_found.append( module_path )
+                ls_pending.append( module_path )
+
+    return sorted( ls_found )
+
+
+# Determine whether path names an output of step, or a directory containing one
+def is_output( step, path ):
+
+    path = os.path.abspath( path )
+
+    for output in step.get( 'outputs', [] ):
+        output = os.path.abspath( output )
+        if ( output == path ) or output.startswith( path + os.sep ):
+            return True
+
+    return False
+
+
+# Find input files of a step
+def find_inputs( step ):
+
+    ls_inputs = list( step.get( 'inputs', [] ) )
+
+    for token in shlex.split( step['command'] ):
+        if ( '{master}' not in token ) and os.path.exists( token ) and not is_output( step, token ) and ( token not in ls_inputs ):
+            ls_inputs.append( token )
+
+            # Changes to shared modules imported by a Python script change its results
+            if token.endswith( '.py' ) and os.path.isfile( token ):
+                ls_inputs += [path for path in find_local_modules( token ) if path not in ls_inputs]
+
+    return ls_inputs
+
+
+# Fingerprint every step from its command, its input files, and the fingerprints of its dependencies
+def find_fingerprints( ls_steps, ls_deps, cur ):
+
+    ls_fingerprints = []
+
+    for step, deps in zip( ls_steps, ls_deps ):
+
+        hash = hashlib.sha256()
+        hash.update( step['command'].encode() )
+
+        for path in find_inputs( step ):
+            hash.update( path.encode() )
+            hash.update( digest_input( path, cur ).encode() )
+
+        for idx in sorted( deps ):
+            hash.update( ls_fingerprints[idx].encode() )
+
+        ls_fingerprints.append( hash.hexdigest() )
+
+    return ls_fingerprints
+
+
+# Find names of tables present in the master database
+def find_master_tables( master_filename ):
+
+    if not os.path.isfile( master_filename ):
+        return set()
+
+    conn = sqlite3.connect( master_filename )
+    cur = conn.cursor()
+    cur.execute( 'SELECT name FROM sqlite_master WHERE type="table"' )
+    tables = set( [row[0] for row in cur.fetchall()] )
+    conn.close()
+
+    return tables
+
+
+# Determine whether output file or directory of a step is present; an empty directory is not
+def is_output_present( path ):
+    if os.path.isdir( path ):
+        return len( os.listdir( path ) ) > 0
+    return os.path.isfile( path )
+
+
+# Determine whether step can be skipped because its previous result is still valid
+def is_up_to_date( step, fingerprint, cur, master_tables, master_filename ):
+
+    # A missing master database must be created, even by a step whose fingerprint is unchanged
+    if step.get( 'create' ) and not os.path.isfile( master_filename ):
+        return False
+
+    cur.execute( 'SELECT fingerprint FROM BuildSteps WHERE label=?', ( step['label'], ) )
+    row = cur.fetchone()
+
+    return ( row is not None ) and ( row[0] == fingerprint ) and set( step.get( 'writes', [] ) ) <= master_tables and all( is_output_present( path ) for path in step.get( 'outputs', [] ) )
+
+
+# Run shell command, returning exit status and captured output
+def run_command( command ):
+    result = subprocess.run( command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors='replace' )
+    return result.returncode, result.stdout
+
+
+# Execute one step under the appropriate access to the master database
+def run_step( idx, step, master_filename, staging_dir, lock, print_lock ):
+
+    if is_staged( step ):
+
+        # Produce tables in private staging database
+        staging_filename = os.path.join( staging_dir, 'step_{0}.sqlite'.format( idx ) )
+        status, output = run_command( step['command'].format( master=staging_filename ) )
+
+        # Copy staged tables into master database
+        if status == 0:
+            lock.acquire_write()
+            try:
+                copy_staged_tables( staging_filename, master_filename, step['writes'] )
+            finally:
+                lock.release_write()
+
+    elif step.get( 'writes' ) or step.get( 'create' ):
+
+        # Hold exclusive access to master database
+        lock.acquire_write()
+        try:
+            status, output = run_command( step['command'].format( master=master_filename ) )
+        finally:
+            lock.release_write()
+
+    elif step.get( 'reads' ):
+
+        # Share access to master database with other readers
+        lock.acquire_read()
+        try:
+            status, output = run_command( step['command'].format( master=master_filename ) )
+        finally:
+            lock.release_read()
+
+    else:
+        # Step does not use master database
+        status, output = run_command( step['command'].format( master=master_filename ) )
+
+    # Report output of step in one piece
+    with print_lock:
+        print( '\n=======> ' + step['label'] )
+        print( output, end='' )
+        if status != 0:
+            print( '!!! Step "{0}" failed with exit status {1}'.format( step['label'], status ) )
+
+    return status
+
+
+# Run populator script in this process, given its command line; return exit status
+def run_script( command ):
+
+    ls_args = shlex.split( command )
+
+    # Commands that do not invoke a Python script run in a shell
+    if ( len( ls_args ) < 2 ) or ( ls_args[0] != 'python' ) or not ls_args[1].endswith( '.py' ):
+        return subprocess.run( command, shell=True ).returncode
+
+    save_argv = sys.argv
+    sys.argv = ls_args[1:]
+
+    try:
+        runpy.run_path( ls_args[1], run_name='__main__' )
+        status = 0
+
+    except SystemExit as e:
+        # Mimic interpreter handling of exit() and sys.exit()
+        if ( e.code is None ) or isinstance( e.code, int ):
+            status = e.code or 0
+        else:
+            print( e.code, file=sys.stderr )
+            status = 1
+
+    except Exception:
+        traceback.print_exc()
+        status = 1
+
+    finally:
+        sys.argv = save_argv
+        sys.stdout.flush()
+
+        # Release dataframes left behind by the script
+        gc.collect()
+
+    return status
+
+
+# Execute one step in this process
+def run_step_in_process( step, master_filename ):
+
+    print( '\n=======> ' + step['label'] )
+    status = run_script( step['command'].format( master=master_filename ) )
+    if status != 0:
+        print( '!!! Step "{0}" failed with exit status {1}'.format( step['label'], status ) )
+
+    return status
+
+
+# Execute build graph, running independent steps concurrently and skipping steps that are up to date
+def run_steps( ls_steps, master_filename, n_workers=None, b_force=False, b_in_process=False ):
+
+    n_workers = n_workers or os.cpu_count() or 1
+
+    ls_deps = find_dependencies( ls_steps )
+    lock = ReadWriteLock()
+    print_lock = threading.Lock()
+
+    # Fingerprint steps and find tables that already exist
+    conn_state, cur_state = open_build_state( master_filename )
+    ls_fingerprints = find_fingerprints( ls_steps, ls_deps, cur_state )
+    conn_state.commit()
+    master_tables = find_master_tables( master_filename )
+
+    pending = list( range( len( ls_steps ) ) )
+    done = set()
+    running = {}
+    failed = []
+    skipped = []
+    tainted = set()
+    ran = set()
+
+    # Record outcome of finished step
+    def finish( idx, status ):
+
+        done.add( idx )
+        ran.add( idx )
+
+        # Results that depend on a failed step must not be recorded as valid
+        if ( status != 0 ) or ( ls_deps[idx] & tainted ):
+            tainted.add( idx )
+
+        if idx not in tainted:
+            # Record fingerprint of successful step
+            cur_state.execute( 'INSERT OR REPLACE INTO BuildSteps VALUES ( ?, ?, ? )', ( ls_steps[idx]['label'], ls_fingerprints[idx], datetime.datetime.now().isoformat() ) )
+        else:
+            # Forget fingerprint of failed step, so that it runs again next time
+            cur_state.execute( 'DELETE FROM BuildSteps WHERE label=?', ( ls_steps[idx]['label'], ) )
+            if status != 0:
+                failed.append( ls_steps[idx]['label'] )
+
+        conn_state.commit()
+
+    # Share database connections among steps that run in this process
+    if b_in_process:
+        import util
+        util.SHARE_DATABASE_CONNECTIONS = True
+
+    staging_root = os.path.dirname( os.path.abspath( master_filename ) )
+
+    with tempfile.TemporaryDirectory( prefix='staging_', dir=staging_root ) as staging_dir:
+        with concurrent.futures.ThreadPoolExecutor( max_workers=n_workers ) as executor:
+
+            while pending or running:
+
+                # Launch every step whose dependencies are satisfied, in declaration order
+                b_progress = True
+                while b_progress:
+                    b_progress = False
+                    for idx in [i for i in pending if ls_deps[i] <= done]:
+                        pending.remove( idx )
+                        step = ls_steps[idx]
+
+                        # Tables and files of a step are stale once any step it depends on has run again
+                        if not b_force and not ( ls_deps[idx] & ran ) and is_up_to_date( step, ls_fingerprints[idx], cur_state, master_tables, master_filename ):
+                            # Previous result is still valid
+                            with print_lock:
+                                print( '\n=======> ' + step['label'] )
+                                print( '(Up to date)' )
+                            skipped.append( step['label'] )
+                            done.add( idx )
+                            b_progress = True
+
+                        elif b_in_process:
+                            # Run step to completion before considering the next one
+                            finish( idx, run_step_in_process( step, master_filename ) )
+                            b_progress = True
+                            break
+
+                        else:
+                            future = executor.submit( run_step, idx, step, master_filename, staging_dir, lock, print_lock )
+                            running[future] = idx
+
+                # Wait for at least one running step to finish
+                if running:
+                    finished, _ = concurrent.futures.wait( running, return_when=concurrent.futures.FIRST_COMPLETED )
+                    for future in finished:
+                        finish( running.pop( future ), future.result() )
+
+    if b_in_process:
+        util.close_databases()
+        util.SHARE_DATABASE_CONNECTIONS = False
+
+    conn_state.close()
+
+    print( '\n{0} step(s) run, {1} step(s) up to date'.format( len( ls_steps ) - len( skipped ), len( skipped ) ) )
+
+    if failed:
+        print( '\n!!! {0} step(s) failed: {1}'.format( len( failed ), failed ) )
+
+    return failed
@@ -4,18 +4,14 @@ import os
 import glob
 import sys
 import sqlite3
-import sqlalchemy
 import pandas as pd
-import openpyxl
-import chardet
-import geopandas as gpd
-import simplekml
-import xml.etree.ElementTree as ET
+import numpy as np
 import re
 import string
 import datetime
 import warnings
-from geopy.geocoders import Nominatim
+
+# Note: sqlalchemy, openpyxl, chardet, and geopandas are imported by the functions that use them, to keep startup fast
 
 import time
 START_TIME = time.time()
@@ -138,6 +134,9 @@ HEALTH_RISK_SCORE = 'health_risk_score'
 LATITUDE = 'latitude'
 LONGITUDE = 'longitude'
 GEO_SERVICE = 'geo_service'
+GEO_ALIAS = 'geo_alias'
+GEO_FAILURE = 'geo_failure'
+GEO_FAILED_AT = 'geo_failed_at'
 CENSUS_GEO_ID = 'census_geo_id'
 CENSUS_TRACT = 'census_tract'
 CENSUS_BLOCK_GROUP = 'census_block_group'
@@ -184,12 +183,13 @@ KML_MAP = \
 {
     COLOR:
     {
-        A: f'{simplekml.Color.red}',
-        B: f'{simplekml.Color.orange}',
-        C: f'{simplekml.Color.yellow}',
-        D: f'{simplekml.Color.chartreuse}',
-        E: f'{simplekml.Color.cyan}|{simplekml.Color.green}',
-        F: f'{simplekml.Color.hotpink}|{simplekml.Color.purple}',
+        # KML aabbggrr values of simplekml.Color constants
+        A: 'ff0000ff',                  # red
+        B: 'ff00a5ff',                  # orange
+        C: 'ff00ffff',                  # yellow
+        D: 'ff00ff7f',                  # chartreuse
+        E: 'ffffff00|ff008000',         # cyan|green
+        F: 'ffb469ff|ff800080',         # hotpink|purple
     },
     ICON:
     {
@@ -208,6 +208,7 @@ LEFT_ADDR_STRIP = 'left_addr_strip'
 RIGHT_ADDR_TRUNC = 'right_addr_trunc'
 RIGHT_ADDR_EDIT = 'right_addr_edit'
 RIGHT_ADDR_STRIP = 'right_addr_strip'
+PARCEL_ADDRESS_VARIANT = 'parcel_address_variant'
 
 # Confidence of address matching results
 CONFIDENCE = 'confidence'
@@ -215,6 +216,21 @@ CONFIDENCE_HIGH = 'High'
 CONFIDENCE_MEDIUM = 'Medium'
 CONFIDENCE_LOW = 'Low'
 
+# Variants of parcel addresses matched by merge_with_assessment_data(), saved with each snapshot of the parcels table
+PARCEL_ADDRESS_INDEX_TABLE = 'ParcelAddressIndex_L'
+PARCEL_ADDRESS_VARIANTS = \
+[
+    'full',
+    'full_expanded',
+    'truncated',
+    'truncated_expanded',
+    'truncated_expanded_edit',
+    'truncated_expanded_strip',
+]
+
+# Parcel address indexes already read, by database
+PARCEL_ADDRESS_INDEXES = {}
+
 ADDRESS = 'address'
 ADDR_STREET_NUMBER = STREET_NUMBER.format( ADDRESS )
 ADDR_STREET_NAME = STREET_NAME.format( ADDRESS )
@@ -3226,109 +3242,120 @@ def isolate_unmatched( df_merge, left_columns, df_result, s_descr='' ):
     return df_result, df_unmatched
 
 
-# Add row to expanded address range
-def add_address_row( address_number, street, row, df_expanded ):
-    new_address = str( address_number ) + ' ' + street
-    new_row = row.copy()
-    new_row[NORMALIZED_ADDRESS] = new_address
-    df_expanded = df_expanded.append( new_row, ignore_index=True )
-    return( df_expanded )
-
-
 # Expand dataframe such that each address range entry is replaced by a series of entries representing the range
+#
+# Ranges are parsed with vectorized string operations.  Each generated address is described by its
+# range type, the position of its source row, its order within the expansion, its address number,
+# and its street.
+# All generated rows are then assembled at once.
 def expand_address_ranges( df ):
 
-    # Extract entries that represent implied address ranges, expressed as '<number>[letter]-<number>[letter]'
-    df_ranges = df.copy()
-    df_ranges = df_ranges[ df_ranges[NORMALIZED_ADDRESS].str.match( '^\d+[A-Z]*-\d+[A-Z]* .*$' ) ]
-
-    # Generate a new dataframe that expands the ranges into individual addresses
-    df_expanded = pd.DataFrame( columns=df_ranges.columns )
-
-    for index, row in df_ranges.iterrows():
-
-        # Extract numeric address range
-        address_range = row[NORMALIZED_ADDRESS].split()[0].split( '-' )
-        range_first = int( re.search( '^\d*', address_range[0] ).group(0) )
-        range_last = int( re.search( '^\d*', address_range[1] ).group(0) )
+    addresses = df[NORMALIZED_ADDRESS]
 
-        # Extract street
-        words = row[NORMALIZED_ADDRESS].split()[1:]
-        num_suffix = words.pop() if ( len( words ) and re.search( '^[A-Z]$', words[-1] ) ) else ''
-        street = ' '.join( words )
+    ls_groups = []
 
-        # Iterate over all numbers in the address range, incrementing by 2
-        for num in range( range_first, range_last + 1, 2 ):
-            df_expanded = add_address_row( str( num ) + num_suffix, street, row, df_expanded )
-
-        # Determine whether either range specifier contains a letter
-        letter_in_range_first = re.search( '[A-Z]', address_range[0] )
-        letter_in_range_last = re.search( '[A-Z]', address_range[1] )
-
-        # Include row representing second of two consecutive integer range specifiers
-        if ( range_last == range_first + 1 ) and not ( letter_in_range_first or letter_in_range_last ):
-            df_expanded = add_address_row( range_last, street, row, df_expanded )
-
-        # Include literal range specifier containing letter, but only if numbers are equal
-        if ( range_first == range_last ):
-            if letter_in_range_first:
-                df_expanded = add_address_row( address_range[0], street, row, df_expanded )
-            if letter_in_range_last:
-                df_expanded = add_address_row( address_range[1], street, row, df_expanded )
-
-    # Extract entries that represent explicit address ranges, expressed as '<number>[letter]-<number>[letter]-<number>[letter]...'
-    df_ranges = df.copy()
-    df_ranges = df_ranges[ df_ranges[NORMALIZED_ADDRESS].str.match( '^\d+[A-Z]*-\d+[A-Z]*(-\d+[A-Z]*)+ .*$' ) ]
+    #
+    # Implied address ranges, expressed as '<number>[letter]-<number>[letter]'
+    #
+    mask = addresses.str.match( '^\d+[A-Z]*-\d+[A-Z]* .*$' ).to_numpy( dtype=bool )
+    positions = np.flatnonzero( mask )
+
+    df_parts = addresses[mask].str.extract( r'^((\d+)[A-Z]*)-((\d+)[A-Z]*) (.*)$' )
+    spec_first = df_parts[0].to_numpy( dtype=object )
+    spec_last = df_parts[2].to_numpy( dtype=object )
+    range_first = df_parts[1].astype( int ).to_numpy()
+    range_last = df_parts[3].astype( int ).to_numpy()
+    letter_in_range_first = ( df_parts[0].str.len() > df_parts[1].str.len() ).to_numpy( dtype=bool )
+    letter_in_range_last = ( df_parts[2].str.len() > df_parts[3].str.len() ).to_numpy( dtype=bool )
+
+    # Extract street, with optional trailing single-letter suffix to be applied to each number
+    words = df_parts[4].str.split().str.join( ' ' )
+    has_suffix = words.str.contains( '(?:^| )[A-Z]$' ).to_numpy( dtype=bool )
+    num_suffix = np.where( has_suffix, words.str[-1], '' ).astype( object )
+    street = np.where( has_suffix, words.str[:-2], words ).astype( object )
+
+    # Every number in the address range, incrementing by 2
+    counts = np.where( range_last >= range_first, ( range_last - range_first ) // 2 + 1, 0 )
+    seq = np.arange( counts.sum() ) - np.repeat( np.cumsum( counts ) - counts, counts )
+    numbers = ( np.repeat( range_first, counts ) + 2 * seq ).astype( str ).astype( object ) + np.repeat( num_suffix, counts )
+    ls_groups.append( ( 0, np.repeat( positions, counts ), seq, numbers, np.repeat( street, counts ) ) )
+
+    # Second of two consecutive integer range specifiers
+    extra = ( range_last == range_first + 1 ) & ~( letter_in_range_first | letter_in_range_last )
+    ls_groups.append( ( 0, positions[extra], counts[extra], range_last[extra].astype( str ).astype( object ), street[extra] ) )
+
+    # Literal range specifiers containing letter, but only if numbers are equal
+    extra = ( range_first == range_last ) & letter_in_range_first
+    ls_groups.append( ( 0, positions[extra], counts[extra] + 1, spec_first[extra], street[extra] ) )
+    extra = ( range_first == range_last ) & letter_in_range_last
+    ls_groups.append( ( 0, positions[extra], counts[extra] + 2, spec_last[extra], street[extra] ) )
 
-    # Iterate over explicit attress ranges
-    for index, row in df_ranges.iterrows():
+    #
+    # Explicit address ranges, expressed as '<number>[letter]-<number>[letter]-<number>[letter]...'
+    #
+    mask = addresses.str.match( '^\d+[A-Z]*-\d+[A-Z]*(-\d+[A-Z]*)+ .*$' ).to_numpy( dtype=bool )
+    positions = np.flatnonzero( mask )
 
-        # Extract street
-        street = ' '.join( row[NORMALIZED_ADDRESS].split()[1:] )
+    words = addresses[mask].str.split()
+    street = words.str[1:].str.join( ' ' ).to_numpy( dtype=object )
+    range_parts = words.str[0].str.split( '-' )
+    counts = range_parts.str.len().to_numpy( dtype=int )
+    seq = np.arange( counts.sum() ) - np.repeat( np.cumsum( counts ) - counts, counts )
+    numbers = range_parts.explode().to_numpy( dtype=object )
+    ls_groups.append( ( 1, np.repeat( positions, counts ), seq, numbers, np.repeat( street, counts ) ) )
 
-        # Extract range parts
-        address_range = row[NORMALIZED_ADDRESS].split()[0].split( '-' )
+    #
+    # Ranges of occupancy identifiers, such as '95 A-B NEWTON ST'
+    #
+    mask = addresses.str.match( '^\d+ [A-Z]-[A-Z] .*$' ).to_numpy( dtype=bool )
+    positions = np.flatnonzero( mask )
 
-        # Iterate over range parts, adding a row for each
-        for range_part in address_range:
-            df_expanded = add_address_row( range_part, street, row, df_expanded )
+    words = addresses[mask].str.split()
+    number = words.str[0].to_numpy( dtype=object )
+    street = words.str[2:].str.join( ' ' ).to_numpy( dtype=object )
+    letter_first = np.array( [ ord( s[0] ) for s in words.str[1] ], dtype=int )
+    letter_last = np.array( [ ord( s[2] ) for s in words.str[1] ], dtype=int )
 
-    # Extract entries that represent ranges of occupancy identifiers, such as '95 A-B NEWTON ST'
-    df_ranges = df.copy()
-    df_ranges = df_ranges[ df_ranges[NORMALIZED_ADDRESS].str.match( '^\d+ [A-Z]-[A-Z] .*$' ) ]
+    # Each letter in the range appended to the address number
+    counts = np.maximum( letter_last - letter_first + 1, 0 )
+    seq = np.arange( counts.sum() ) - np.repeat( np.cumsum( counts ) - counts, counts )
+    letters = np.array( [ chr( i ) for i in np.repeat( letter_first, counts ) + seq ], dtype=object )
+    ls_groups.append( ( 2, np.repeat( positions, counts ), seq, np.repeat( number, counts ) + letters, np.repeat( street, counts ) ) )
 
-    # Iterate over addresses with alphabetical ranges
-    for index, row in df_ranges.iterrows():
+    #
+    # Assemble expanded rows in order of range type, source row, and order within expansion
+    #
+    range_types = np.concatenate( [ np.full( len( group[1] ), group[0] ) for group in ls_groups ] )
+    source_positions = np.concatenate( [ group[1] for group in ls_groups ] )
+    order_seq = np.concatenate( [ group[2] for group in ls_groups ] )
+    order = np.lexsort( ( order_seq, source_positions, range_types ) )
 
-        # Extract parts: address number, alphabetical range, and street name
-        parts = row[NORMALIZED_ADDRESS].split()
-        number = parts[0]
-        alpha_range = parts[1].split( '-' )
-        street = ' '.join( parts[2:] )
+    source_positions = source_positions[order]
+    new_numbers = np.concatenate( [ group[3] for group in ls_groups ] )[order]
+    new_streets = np.concatenate( [ group[4] for group in ls_groups ] )[order]
 
-        # Construct list of letters in range
-        letters_in_range = [chr(i) for i in range( ord( alpha_range[0] ), ord( alpha_range[1] ) + 1 )]
+    df_expanded = df.iloc[source_positions].copy()
+    df_expanded[NORMALIZED_ADDRESS] = new_numbers + ' ' + new_streets
 
-        # Iterate over letters, adding two entries for each: '<number> <letter>' and '<number><letter>'
-        for letter in letters_in_range:
-            address_number = ''.join( [number, letter] )
-            df_expanded = add_address_row( address_number, street, row, df_expanded )
+    # Retain all rows other than ranges of occupancy identifiers
+    df_no_ranges = df.loc[ df.index.difference( df.index[mask] ) ]
 
-    df_no_ranges = df.loc[ df.index.difference( df_ranges.index ) ]
-    df_expanded = df_expanded.append( df_no_ranges, ignore_index=True )
+    # Concatenate with empty frame to produce the same column types as appending rows one at a time
+    df_expanded = pd.concat( [pd.DataFrame( columns=df.columns ), df_expanded, df_no_ranges], ignore_index=True )
 
     return( df_expanded )
 
 
-# Merge repeatedly on original and reformatted addresses
-def merge_expand_merge_expand_merge( df_result, df_unmatched, left_columns, df_parcels, strip_left=False, strip_right=False ):
+# Merge repeatedly on original and reformatted addresses, using specified variant of parcel addresses
+def merge_expand_merge_expand_merge( df_result, df_unmatched, left_columns, dc_index, s_variant, confidence, strip_left=False, strip_right=False ):
 
     # Merge unmatched with parcels table
+    df_parcels = get_parcel_address_variant( dc_index, s_variant, confidence )
     df_merge = pd.merge( df_unmatched, df_parcels, how='left', on=[NORMALIZED_ADDRESS] )
     df_result, df_unmatched = isolate_unmatched( df_merge, left_columns, df_result, 'Unexpanded' )
 
-    # Expand addresses in parcels table
-    df_parcels = expand_address_ranges( df_parcels )
+    # Use expanded addresses in parcels table
+    df_parcels = get_parcel_address_variant( dc_index, s_variant + '_expanded', confidence )
 
     # Merge unmatched with parcels table
     df_merge = pd.merge( df_unmatched, df_parcels, how='left', on=[NORMALIZED_ADDRESS] )
@@ -3377,25 +3404,16 @@ def merge_expand_merge_expand_merge( df_result, df_unmatched, left_columns, df_p
         print( '---' )
         print( '-- Strip right --' )
 
-        pattern = r'(^\d+)([A-Z]+ )(.*)'
-
-        # Create copies of normalized address columns with trailing address letter stripped away
-        df_parcels[RIGHT_ADDR_EDIT] = df_parcels[NORMALIZED_ADDRESS].replace( { pattern : r'\1 \3 \2' }, regex=True )
-        df_parcels[RIGHT_ADDR_STRIP] = df_parcels[NORMALIZED_ADDRESS].replace( { pattern : r'\1 \3' }, regex=True )
-
-        # Merge unmatched edited
-        df_parcels[NORMALIZED_ADDRESS] = df_parcels[RIGHT_ADDR_EDIT]
+        # Merge unmatched with parcel addresses whose trailing address letter has been moved
+        df_parcels = get_parcel_address_variant( dc_index, s_variant + '_expanded_edit', confidence )
         df_merge = pd.merge( df_unmatched, df_parcels, how='left', on=[NORMALIZED_ADDRESS] )
         df_result, df_unmatched = isolate_unmatched( df_merge, left_columns, df_result, 'Edited on right' )
 
-        # Merge unmatched stripped
-        df_parcels[NORMALIZED_ADDRESS] = df_parcels[RIGHT_ADDR_STRIP]
+        # Merge unmatched with parcel addresses whose trailing address letter has been stripped away
+        df_parcels = get_parcel_address_variant( dc_index, s_variant + '_expanded_strip', confidence )
         df_merge = pd.merge( df_unmatched, df_parcels, how='left', on=[NORMALIZED_ADDRESS] )
         df_result, df_unmatched = isolate_unmatched( df_merge, left_columns, df_result, 'Stripped on right' )
 
-        # Delete columns no longer needed
-        df_result = df_result.drop( columns=[RIGHT_ADDR_EDIT, RIGHT_ADDR_STRIP] )
-
     return df_result, df_unmatched
 
 
@@ -3406,6 +3424,85 @@ def read_parcels_table_for_merge( engine, columns=[NORMALIZED_ADDRESS, ACCOUNT_N
     df_parcels = df_parcels.drop( columns=[NORMALIZED_STREET_NUMBER, NORMALIZED_STREET_NAME] )
     return df_parcels
 
+
+# Generate every variant of parcel addresses used by merge_with_assessment_data()
+def make_parcel_address_index( df_parcels ):
+
+    dc_index = {}
+
+    # Full and truncated (street number + street name) addresses
+    dc_index['full'] = df_parcels
+    dc_index['truncated'] = df_parcels.copy()
+    dc_index['truncated'][NORMALIZED_ADDRESS] = df_parcels[RIGHT_ADDR_TRUNC]
+
+    # Address ranges expanded into individual addresses
+    for s_variant in ['full', 'truncated']:
+        dc_index[s_variant + '_expanded'] = expand_address_ranges( dc_index[s_variant] )
+
+    # Expanded truncated addresses with trailing address letter moved after street, or stripped away
+    pattern = r'(^\d+)([A-Z]+ )(.*)'
+    df_expanded = dc_index['truncated_expanded']
+    dc_index['truncated_expanded_edit'] = df_expanded.copy()
+    dc_index['truncated_expanded_edit'][NORMALIZED_ADDRESS] = df_expanded[NORMALIZED_ADDRESS].replace( { pattern : r'\1 \3 \2' }, regex=True )
+    dc_index['truncated_expanded_strip'] = df_expanded.copy()
+    dc_index['truncated_expanded_strip'][NORMALIZED_ADDRESS] = df_expanded[NORMALIZED_ADDRESS].replace( { pattern : r'\1 \3' }, regex=True )
+
+    return dc_index
+
+
+# Save parcel address index in master database, for all merges against this snapshot of the parcels table
+def create_parcel_address_index( conn, cur, engine ):
+
+    dc_index = make_parcel_address_index( read_parcels_table_for_merge( engine ) )
+
+    ls_frames = []
+    for s_variant in PARCEL_ADDRESS_VARIANTS:
+        df = dc_index[s_variant].copy()
+        df.insert( 0, PARCEL_ADDRESS_VARIANT, s_variant )
+        ls_frames.append( df )
+
+    # Internal table, not exported to test spreadsheets
+    create_table( PARCEL_ADDRESS_INDEX_TABLE, conn, cur, df=pd.concat( ls_frames, ignore_index=True ), b_export=False )
+
+    # Replace any index read earlier in this process
+    PARCEL_ADDRESS_INDEXES[str( engine.url )] = dc_index
+
+
+# Read parcel address index from master database, building it from the parcels table if not found
+def read_parcel_address_index( engine ):
+
+    key = str( engine.url )
+
+    if key not in PARCEL_ADDRESS_INDEXES:
+
+        df_tables = pd.read_sql_query( 'SELECT name FROM sqlite_master WHERE type="table" AND name="{0}"'.format( PARCEL_ADDRESS_INDEX_TABLE ), engine )
+
+        if len( df_tables ):
+            print( 'Reading parcel address index' )
+            df_index = pd.read_sql_table( PARCEL_ADDRESS_INDEX_TABLE, engine, index_col=ID )
+            dc_index = {}
+            for s_variant, df in df_index.groupby( PARCEL_ADDRESS_VARIANT, sort=False ):
+                df = df.drop( columns=[PARCEL_ADDRESS_VARIANT] )
+                if '_expanded' in s_variant:
+                    # Restore column types produced by expansion
+                    df = pd.concat( [pd.DataFrame( columns=df.columns ), df], ignore_index=True )
+                dc_index[s_variant] = df
+        else:
+            print( 'Building parcel address index' )
+            dc_index = make_parcel_address_index( read_parcels_table_for_merge( engine ) )
+
+        PARCEL_ADDRESS_INDEXES[key] = dc_index
+
+    return PARCEL_ADDRESS_INDEXES[key]
+
+
+# Get specified variant of parcel addresses, with specified confidence level
+def get_parcel_address_variant( dc_index, s_variant, confidence ):
+    df_parcels = dc_index[s_variant].copy()
+    df_parcels[CONFIDENCE] = confidence
+    return df_parcels
+
+
 #####################
 # Merge dataframe with commercial and residential assessment data based on normalized addresses
 #
@@ -3413,12 +3510,16 @@ def read_parcels_table_for_merge( engine, columns=[NORMALIZED_ADDRESS, ACCOUNT_N
 # - ACCOUNT_NUMBER: Uniquely identifies a parcel in the assessment table
 # - CONFIDENCE: Confidence that choice of account number is accurate
 #
+# Parcel address variants come from the index saved with the parcels table, or from df_parcels if supplied.
+#
 def merge_with_assessment_data( table_name, df_left, sort_by=[PERMIT_NUMBER, ACCOUNT_NUMBER], drop_subset=None, engine=None, df_parcels=None ):
 
-    # If we have engine, retrieve the parcels table
+    # If we have engine, retrieve the parcel address index
     if engine != None:
-        df_parcels = read_parcels_table_for_merge( engine )
-    # else caller must supply the dataframe
+        dc_index = read_parcel_address_index( engine )
+    else:
+        # Caller supplied the dataframe
+        dc_index = make_parcel_address_index( df_parcels )
 
     print( '---' )
     print( 'Left dataframe before merge: {}'.format( df_left.shape ) )
@@ -3436,33 +3537,26 @@ def merge_with_assessment_data( table_name, df_left, sort_by=[PERMIT_NUMBER, ACC
     # High confidence matching
     #
 
-    # Initialize high confidence for these matches
-    df_parcels[CONFIDENCE] = CONFIDENCE_HIGH
-
     # Match using full normalized address
     print( '---' )
     print( '-- Matching on left full and right full addresses (FxF) --' )
-    df_result, df_unmatched = merge_expand_merge_expand_merge( df_result, df_unmatched, left_columns, df_parcels )
+    df_result, df_unmatched = merge_expand_merge_expand_merge( df_result, df_unmatched, left_columns, dc_index, 'full', CONFIDENCE_HIGH )
 
     # Retry using truncated address (street number + street name) on left side
     print( '---' )
     print( '-- Matching on left truncated and right full address (TxF) --' )
     df_unmatched[NORMALIZED_ADDRESS] = df_unmatched[LEFT_ADDR_TRUNC]
-    df_result, df_unmatched = merge_expand_merge_expand_merge( df_result, df_unmatched, left_columns, df_parcels, strip_left=True )
+    df_result, df_unmatched = merge_expand_merge_expand_merge( df_result, df_unmatched, left_columns, dc_index, 'full', CONFIDENCE_HIGH, strip_left=True )
 
     #
     # Low confidence matching
     #
 
-    # Set low confidence for remaining matches
-    df_parcels[CONFIDENCE] = CONFIDENCE_LOW
-
     # Getting more desperate.  Try again with truncated addresses on right side
     print( '---' )
     print( '-- Matching on left full and right truncated address (FxT) --' )
     df_unmatched[NORMALIZED_ADDRESS] = df_unmatched[LEFT_ADDR_FULL]
-    df_parcels[NORMALIZED_ADDRESS] = df_parcels[RIGHT_ADDR_TRUNC]
-    df_result, df_unmatched = merge_expand_merge_expand_merge( df_result, df_unmatched, left_columns, df_parcels, strip_right=True )
+    df_result, df_unmatched = merge_expand_merge_expand_merge( df_result, df_unmatched, left_columns, dc_index, 'truncated', CONFIDENCE_LOW, strip_right=True )
 
     # Finish up
     df_result = df_result.append( df_unmatched, ignore_index=True )
@@ -3493,6 +3587,8 @@ def merge_with_assessment_data( table_name, df_left, sort_by=[PERMIT_NUMBER, ACC
 # Read single input file with hyperlinks expanded
 def read_excel_with_hyperlinks( input_filename, skiprows ):
 
+    import openpyxl
+
     # Get the worksheet
     workbook = openpyxl.load_workbook( input_filename, data_only=True )
     worksheet = workbook.active
@@ -3575,6 +3671,8 @@ def clear_directory( dir, files='*' ):
 # Extract block group geometries from shapefile
 def get_block_groups_geometry( block_groups_filename ):
 
+    import geopandas as gpd
+
     # Get census block group data
     df_block_groups = gpd.read_file( block_groups_filename )
     df_block_groups[TRACTCE] = df_block_groups[TRACTCE].astype( int )
@@ -3602,6 +3700,7 @@ def read_excel_files( input_directory, column_labels, skiprows, csv, csv_sep, sh
             # Extract dataframe from a delimited text file
 
             # Detect encoding of input file
+            import chardet
             with open( input_path, 'rb' ) as rawdata:
                 encoding_info = chardet.detect( rawdata.read( 10000 ) )
 
@@ -3686,6 +3785,11 @@ def synthesize_unmapped_column_names( table_name, not_in ):
         CONSISTENT_COLUMN_NAMES[table_name][original_name] = synthesized_name
 
 
+# Optionally share one connection per database file among all callers in this process
+SHARE_DATABASE_CONNECTIONS = False
+DATABASE_CONNECTIONS = {}
+
+
 # Open the SQLite database
 def open_database( filename, b_create ):
 
@@ -3693,20 +3797,49 @@ def open_database( filename, b_create ):
 
     # Optionally delete pre-existing database
     if b_create:
+        close_database( filename )
         if os.path.exists( filename ):
             print( ' Deleting...' )
             os.remove( filename )
         print( ' Creating...' )
 
+    # Optionally reuse shared connection
+    key = os.path.abspath( filename )
+    if SHARE_DATABASE_CONNECTIONS and key in DATABASE_CONNECTIONS:
+        print( ' Reusing connection...' )
+        return DATABASE_CONNECTIONS[key]
+
     print( ' Connecting...' )
     conn = sqlite3.connect( filename )
     cur = conn.cursor()
 
+    import sqlalchemy
     engine = sqlalchemy.create_engine( 'sqlite:///' + filename )
 
+    if SHARE_DATABASE_CONNECTIONS:
+        DATABASE_CONNECTIONS[key] = ( conn, cur, engine )
+
     return conn, cur, engine
 
 
+# Close shared connection to specified database
+def close_database( filename ):
+
+    key = os.path.abspath( filename )
+    if key in DATABASE_CONNECTIONS:
+        conn, cur, engine = DATABASE_CONNECTIONS.pop( key )
+        PARCEL_ADDRESS_INDEXES.pop( str( engine.url ), None )
+        engine.dispose()
+        conn.close()
+
+
+# Close all shared database connections, and forget parcel address indexes read from any database
+def close_databases():
+    for filename in list( DATABASE_CONNECTIONS ):
+        close_database( filename )
+    PARCEL_ADDRESS_INDEXES.clear()
+
+
 def read_database( input_filename ):
 
     # Open the input database
@@ -3728,7 +3861,7 @@ def read_database( input_filename ):
 
 
 # Create table with specified name and model
-def create_table( table_name, conn, cur, columns=None, df=None, alt_column_order='' ):
+def create_table( table_name, conn, cur, columns=None, df=None, alt_column_order='', b_export=True ):
 
     if ( columns is None ) and ( df is None ):
         print( "!!! create_table() missing required parameter: either 'columns' or 'df'" )
@@ -3760,9 +3893,10 @@ def create_table( table_name, conn, cur, columns=None, df=None, alt_column_order
         # Optionally output dataframe to database and test spreadsheets
         if df is not None:
             df.to_sql( table_name, conn, if_exists='append', index=False )
-            df = df.reindex( columns=columns )
-            df.index = 1 + df.reset_index().index
-            df.to_csv( '../test/' + table_name + '.csv', index_label=ID )
+            if b_export:
+                df = df.reindex( columns=columns )
+                df.index = 1 + df.reset_index().index
+                df.to_csv( '../test/' + table_name + '.csv', index_label=ID )
 
         conn.commit()
 
@@ -4158,60 +4292,6 @@ def publish_database( input_db, output_filename, publish_info ):
         df.to_sql( table_name, conn, index=False )
 
 
-# Insert a list kml folders into a new parent folder
-def insert_in_parent_kml_folder( ls_children, s_parent, s_visibility=None, output_path=None ):
-
-    schema = f'{{{KML_NAMESPACE}}}'
-    ET.register_namespace( '', KML_NAMESPACE )
-
-    # Create new KML root
-    root = ET.Element( f'{schema}kml' )
-    doc = ET.SubElement( root, f'{schema}Document' )
-
-    # Create the new parent folder
-    parent_folder = ET.SubElement( doc, f'{schema}Folder' )
-    ET.SubElement( parent_folder, f'{schema}name' ).text = s_parent
-    if s_visibility:
-        ET.SubElement( parent_folder, f'{schema}visibility' ).text = s_visibility
-
-    # Append each existing child folder to the parent
-    for kml_tree in ls_children:
-        child_folder = get_top_kml_folder( kml_tree )
-        parent_folder.append( replicate_kml_element( child_folder ) )
-
-    xml = ET.ElementTree( root )
-
-    # Optionally write the result to a KML file
-    if output_path:
-        print( f'Saving tree "{s_parent}"' )
-        xml.write( output_path, encoding='utf-8', xml_declaration=True )
-
-    # Return the assembled KML tree
-    return xml
-
-
-# Extract top-level Document/Folder from a KML object
-def get_top_kml_folder( kml_tree ):
-    root = kml_tree.getroot()
-    schema = f'{{{KML_NAMESPACE}}}'
-    return root.find( f'./{schema}Document/{schema}Folder' )
-
-
-# Replicate KML element with all its children
-def replicate_kml_element( elem ):
-
-    # Replicate element attributes
-    new_elem = ET.Element( elem.tag, elem.attrib )
-    new_elem.text = elem.text
-    new_elem.tail = elem.tail
-
-    # Replicate children
-    for child in list( elem ):
-        new_elem.append( replicate_kml_element( child ) )
-
-    return new_elem
-
-
 def print_full( x ):
     pd.set_option( 'display.max_rows', len( x ) )
     print( x )
@@ -5,14 +5,31 @@ pd.set_option( 'display.max_columns', 500 )
 pd.set_option( 'display.width', 1000 )
 
 import re
+import time
+import inspect
+import hashlib
+import sqlite3
+import itertools
+import threading
+import collections
+import concurrent.futures
 
 import numpy as np
 
 import util
 
+# Note: requests is imported by the functions that use it, so that populators that only clean Vision data need not install it
 
 
-URL_BASE = 'https://gis.vgsi.com/{}ma/parcel.aspx?pid='
+SITE_URL = 'https://gis.vgsi.com'
+URL_BASE = SITE_URL + '/{}ma/parcel.aspx?pid='
+
+# Parameters for fetching pages from Vision website
+FETCH_TIMEOUT = 60
+FETCH_RETRIES = 4
+FETCH_BACKOFF = 2
+FETCH_AHEAD = 2
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
 
 BUILDING_TABLE_ID_FORMAT = 'MainContent_ctl{:02d}_grdCns'
 BUILDING_AREA_ID_FORMAT = 'MainContent_ctl{:02d}_lblBldArea'
@@ -21,6 +38,135 @@ BUILDING_TABLE_ID = 'building_id'
 BUILDING_AREA_ID = 'area_id'
 BUILDING_YEAR_ID = 'year_id'
 
+#
+# Utility functions to fetch Vision pages
+#
+
+# Format base of parcel page URLs for town, optionally served by a stand-in for the Vision site
+def format_url_base( town, site_url=None ):
+    url_base = URL_BASE.format( town )
+    if site_url:
+        url_base = url_base.replace( SITE_URL, site_url.rstrip( '/' ), 1 )
+    return url_base
+
+
+# Limit rate at which requests are issued, across all threads
+# - If a budget file is specified, the limit is shared with all processes that use the same file and key
+class RateLimiter:
+
+    def __init__( self, requests_per_second=None, budget_filename=None, key='' ):
+        self.interval = ( 1 / requests_per_second ) if requests_per_second else 0
+        self.next_time = time.time()
+        self.lock = threading.Lock()
+        self.key = key
+        self.budget_conn = None
+
+        if budget_filename and self.interval:
+            self.budget_conn = sqlite3.connect( budget_filename, timeout=60, isolation_level=None, check_same_thread=False )
+            self.budget_conn.execute( 'PRAGMA journal_mode=WAL' )
+            self.budget_conn.execute( 'CREATE TABLE IF NOT EXISTS Budgets ( key TEXT PRIMARY KEY, next_time REAL )' )
+
+    # Reserve the next available request time
+    def reserve( self, now ):
+
+        if self.budget_conn:
+            self.budget_conn.execute( 'BEGIN IMMEDIATE' )
+            row = self.budget_conn.execute( 'SELECT next_time FROM Budgets WHERE key=?', ( self.key, ) ).fetchone()
+            next_time = max( row[0], now ) if row else now
+            self.budget_conn.execute( 'INSERT OR REPLACE INTO Budgets VALUES ( ?, ? )', ( self.key, next_time + self.interval ) )
+            self.budget_conn.execute( 'COMMIT' )
+        else:
+            next_time = max( self.next_time, now )
+            self.next_time = next_time + self.interval
+
+        return next_time
+
+    # Wait until the next request is allowed
+    def wait( self ):
+
+        if not self.interval:
+            return
+
+        with self.lock:
+            now = time.time()
+            wait_time = self.reserve( now ) - now
+
+        if wait_time > 0:
+            time.sleep( wait_time )
+
+
+# Create HTTP session that keeps up to the specified number of connections alive
+def make_session( n_connections=1 ):
+
+    import requests
+    import urllib3
+
+    # Vision certificates are not verified, so suppress the warning that would otherwise accompany every request
+    urllib3.disable_warnings( urllib3.exceptions.InsecureRequestWarning )
+
+    session = requests.Session()
+    session.verify = False
+
+    adapter = requests.adapters.HTTPAdapter( pool_connections=1, pool_maxsize=n_connections )
+    session.mount( 'https://', adapter )
+    session.mount( 'http://', adapter )
+
+    return session
+
+
+# Fetch Vision page, retrying with exponential backoff; return HTML, or None if Vision redirected away from requested page
+def fetch_page( session, url, limiter, retries=FETCH_RETRIES, backoff=FETCH_BACKOFF ):
+
+    import requests
+
+    for n_attempt in range( retries + 1 ):
+
+        if n_attempt:
+            time.sleep( backoff * ( 2 ** ( n_attempt - 1 ) ) )
+
+        limiter.wait()
+
+        try:
+            rsp = session.get( url, timeout=FETCH_TIMEOUT )
+        except requests.exceptions.RequestException:
+            if n_attempt == retries:
+                raise
+            continue
+
+        if rsp.status_code not in RETRY_STATUS_CODES:
+            break
+        elif n_attempt == retries:
+            rsp.raise_for_status()
+
+    return rsp.text if ( rsp.url == url ) else None
+
+
+# Fetch Vision pages concurrently, yielding ( vision_id, future ) pairs in order of requested IDs
+def fetch_pages( url_base, id_range, n_workers=1, requests_per_second=None, session=None, limiter=None ):
+
+    # Successive calls may share a session and rate limit
+    session = session or make_session( n_workers )
+    limiter = limiter or RateLimiter( requests_per_second )
+    executor = concurrent.futures.ThreadPoolExecutor( max_workers=n_workers )
+
+    # Keep a bounded number of requests in flight ahead of the caller
+    it_ids = iter( id_range )
+    pending = collections.deque()
+
+    def submit( n_ids ):
+        for vision_id in itertools.islice( it_ids, n_ids ):
+            pending.append( ( vision_id, executor.submit( fetch_page, session, url_base + str( vision_id ), limiter ) ) )
+
+    try:
+        submit( FETCH_AHEAD * n_workers )
+        while pending:
+            vision_id, future = pending.popleft()
+            submit( 1 )
+            yield vision_id, future
+    finally:
+        executor.shutdown( wait=False, cancel_futures=True )
+
+
 #
 # Utility functions to clean Vision data
 #
@@ -48,84 +194,331 @@ def clean_date( col ):
     return col
 
 
-# Scrape HTML element by id
-def scrape_element( soup, tag, id ):
-    element = soup.find( tag, id=id )
-    text = element.string if element else ''
-    return text
+#
+# Lists of labels that we use to identify values of interest in Building tables.
+# - To determine whether these lists need to be updated, run vision_labels.py.
+# - To determine whether a specific town uses one or more specific labels, run vision_examples.py.
+#
+
+LS_STYL = \
+[
+    'STYLE',
+    'Style',
+    'Style:',
+]
+LS_OCCU = \
+[
+    'Occupancy',
+]
+LS_HEAT = \
+[
+    'Heat Type:',
+    'Heating Type',
+]
+LS_FUEL = \
+[
+    'Heat Fuel',
+    'Heat Fuel:',
+    'Heating Fuel',
+]
+LS_AIRC = \
+[
+    'AC Type',
+    'AC Type:',
+]
+LS_HTAC = \
+[
+    'Heat/AC',
+]
+LS_FLR1 = \
+[
+    '1st Floor Use:',
+]
+LS_RESU = \
+[
+    'Res/Com Units:',
+    'Residential Units',
+    'Residential Units:',
+]
+LS_KTCH = \
+[
+    'Num Kitchens',
+    'Total Kitchens',
+]
+LS_BATH = \
+[
+    'Total Baths',
+    'Total Bthrms:',
+    'Total Full Bthrms:',
+    'Ttl Bathrms:',
+]
+
+# Elements of parcel page that hold single values, by column name
+PARCEL_SPAN_IDS = \
+{
+    util.ACCOUNT_NUMBER: 'MainContent_lblAcctNum',
+    util.MBLU: 'MainContent_lblMblu',
+    util.LOCATION: 'MainContent_lblTab1Title',
+    util.OWNER_1_NAME: 'MainContent_lblOwner',
+    util.OWNER_2_NAME: 'MainContent_lblCoOwner',
+    util.TOTAL_ASSESSED_VALUE: 'MainContent_lblGenAssessment',
+    util.LAND_USE_CODE: 'MainContent_lblUseCode',
+    util.LAND_USE_CODE + util._DESC: 'MainContent_lblUseCodeDescription',
+    util.TOTAL_ACRES: 'MainContent_lblLndAcres',
+    util.SALE_PRICE: 'MainContent_lblPrice',
+    util.SALE_DATE: 'MainContent_lblSaleDate',
+    util.ZONE: 'MainContent_lblZone',
+}
+
+# Attributes of first building, by column name: label list and whether value is numeric
+FIRST_BUILDING_ATTRIBUTES = \
+{
+    util.STYLE: ( LS_STYL, False ),
+    util.OCCUPANCY_HOUSEHOLDS: ( LS_OCCU, True ),
+    util.HEATING_TYPE_DESC: ( LS_HEAT, False ),
+    util.HEATING_FUEL_DESC: ( LS_FUEL, False ),
+    util.AC_TYPE_DESC: ( LS_AIRC, False ),
+    util.HEAT_AC: ( LS_HTAC, False ),
+    util.FIRST_FLOOR_USE: ( LS_FLR1, False ),
+    util.RESIDENTIAL_UNITS: ( LS_RESU, False ),
+    util.KITCHENS: ( LS_KTCH, True ),
+    util.BATHS: ( LS_BATH, True ),
+}
+
+# Attributes totaled over all buildings, by column name
+TOTAL_BUILDING_ATTRIBUTES = \
+{
+    util.TOTAL_OCCUPANCY: LS_OCCU,
+    util.TOTAL_BATHS: LS_BATH,
+    util.TOTAL_KITCHENS: LS_KTCH,
+}
+
 
-# Scrape multi-line HTML element
-def scrape_lines( soup, tag, id, sep=', ' ):
-    # Initialize list of lines
-    ls_lines = []
+#
+# Utility functions to parse Vision pages
+#
 
-    # Find and iterate over lines
-    lines = soup.find( tag, id=id )
-    for line in lines:
-        s = line.string
-        if s:
-            s = s.strip()
-            if s:
-                ls_lines.append( s.strip() )
+# Get text of element, following the rules of BeautifulSoup's Tag.string: None unless element has exactly one child, which is text or has text
+def element_string( element ):
 
-    # Join lines, delimited by separator
-    text = sep.join( ls_lines )
+    while True:
 
-    return text
+        n_children = len( element )
+        text = element.text
 
-# Scrape multi-line address
-def scrape_address( soup, tag, id ):
-    address = scrape_lines( soup, tag, id )
-    match = re.search( r'\d{5}(-\d{4})?$', address )
-    zip = match.group() if match else ''
-    return address, zip
+        if n_children == 0:
+            return text if text else None
 
+        if ( n_children > 1 ) or text or element[0].tail:
+            return None
 
-# Find HTML IDs associated with building tables, areas, and years
-def find_all_building_ids( soup, building_count ):
+        element = element[0]
 
-    ls_building_ids = []
-    first_building_id = ''
-    first_area_id = ''
-    first_year_id = ''
+        # Comments and processing instructions are strings in their own right
+        if not isinstance( element.tag, str ):
+            return element.text
 
-    # Set range limit for the search
-    try:
-        range_max = min( 5 + ( 3 * int( building_count ) ), 100 )
-    except:
-        range_max = 100
-
-    # Search for HTML IDs, using 2-digit integers from 01 to range max
-    for n_index in range( 1, range_max ):
-
-        # Initialize dictionary of building and area IDs
-        dc_ids = { BUILDING_TABLE_ID: '', BUILDING_AREA_ID: '' }
-
-        # If page contains building table with current index, save the ID
-        building_id = BUILDING_TABLE_ID_FORMAT.format( n_index )
-        if soup.find( 'table', id=building_id ):
-            dc_ids[BUILDING_TABLE_ID] = building_id
-            if first_building_id == '':
-                first_building_id = building_id
-
-        # If page contains building area with current index, save the ID
-        area_id = BUILDING_AREA_ID_FORMAT.format( n_index )
-        if soup.find( 'span', id=area_id ):
-            dc_ids[BUILDING_AREA_ID] = area_id
-            if first_area_id == '':
-                first_area_id = area_id
-
-        # If page contains year built with current index, save the ID
-        year_id = BUILDING_YEAR_ID_FORMAT.format( n_index )
-        if soup.find( 'span', id=year_id ):
-            if first_year_id == '':
-                first_year_id = year_id
-
-        # If we got anything in the dictionary, append to the list
-        if dc_ids[BUILDING_TABLE_ID] or dc_ids[BUILDING_AREA_ID]:
-            ls_building_ids.append( dc_ids )
-
-    return ls_building_ids, first_building_id, first_area_id, first_year_id
+
+# Vision parcel page, parsed once by lxml and indexed by element ID
+class ParcelPage:
+
+    def __init__( self, html ):
+
+        import lxml.html
+
+        root = lxml.html.document_fromstring( html )
+
+        # Index the first span and table bearing each ID, in a single pass over the document
+        self.index = {}
+        for element in root.iter( 'span', 'table' ):
+            id = element.get( 'id' )
+            if id is not None:
+                self.index.setdefault( ( element.tag, id ), element )
+
+        # Label->value maps of building tables, built on demand
+        self.building_tables = {}
+
+    # Find element by tag and id
+    def find( self, tag, id ):
+        return self.index.get( ( tag, id ) )
+
+    # Scrape HTML element by id
+    def scrape_element( self, tag, id ):
+        element = self.find( tag, id )
+        text = element_string( element ) if element is not None else ''
+        return text
+
+    # Scrape multi-line HTML element
+    def scrape_lines( self, tag, id, sep=', ' ):
+
+        # Initialize list of lines
+        ls_lines = []
+
+        # Collect text and child elements, in document order
+        element = self.find( tag, id )
+        if element is not None:
+            ls_strings = [element.text]
+            for child in element:
+                ls_strings.append( element_string( child ) if isinstance( child.tag, str ) else child.text )
+                ls_strings.append( child.tail )
+
+            for s in ls_strings:
+                if s:
+                    s = s.strip()
+                    if s:
+                        ls_lines.append( s )
+
+        # Join lines, delimited by separator
+        text = sep.join( ls_lines )
+
+        return text
+
+    # Scrape multi-line address
+    def scrape_address( self, tag, id ):
+        address = self.scrape_lines( tag, id )
+        match = re.search( r'\d{5}(-\d{4})?$', address )
+        zip = match.group() if match else ''
+        return address, zip
+
+    # Find HTML IDs associated with building tables, areas, and years
+    def find_all_building_ids( self, building_count ):
+
+        ls_building_ids = []
+        first_building_id = ''
+        first_area_id = ''
+        first_year_id = ''
+
+        # Set range limit for the search
+        try:
+            range_max = min( 5 + ( 3 * int( building_count ) ), 100 )
+        except:
+            range_max = 100
+
+        # Search for HTML IDs, using 2-digit integers from 01 to range max
+        for n_index in range( 1, range_max ):
+
+            # Initialize dictionary of building and area IDs
+            dc_ids = { BUILDING_TABLE_ID: '', BUILDING_AREA_ID: '' }
+
+            # If page contains building table with current index, save the ID
+            building_id = BUILDING_TABLE_ID_FORMAT.format( n_index )
+            if ( 'table', building_id ) in self.index:
+                dc_ids[BUILDING_TABLE_ID] = building_id
+                if first_building_id == '':
+                    first_building_id = building_id
+
+            # If page contains building area with current index, save the ID
+            area_id = BUILDING_AREA_ID_FORMAT.format( n_index )
+            if ( 'span', area_id ) in self.index:
+                dc_ids[BUILDING_AREA_ID] = area_id
+                if first_area_id == '':
+                    first_area_id = area_id
+
+            # If page contains year built with current index, save the ID
+            year_id = BUILDING_YEAR_ID_FORMAT.format( n_index )
+            if ( 'span', year_id ) in self.index:
+                if first_year_id == '':
+                    first_year_id = year_id
+
+            # If we got anything in the dictionary, append to the list
+            if dc_ids[BUILDING_TABLE_ID] or dc_ids[BUILDING_AREA_ID]:
+                ls_building_ids.append( dc_ids )
+
+        return ls_building_ids, first_building_id, first_area_id, first_year_id
+
+    # Get ( label, value ) pairs from rows of building table that have 2 cells
+    def building_rows( self, building_id ):
+
+        ls_rows = []
+
+        table = self.find( 'table', building_id )
+
+        if table is not None:
+            for tr in table.iter( 'tr' ):
+                tds = list( tr.iter( 'td' ) )
+                if len( tds ) == 2:
+                    ls_rows.append( ( element_string( tds[0] ), element_string( tds[1] ) ) )
+
+        return ls_rows
+
+    # Get map of building table labels to their first row number and value
+    def building_table( self, building_id ):
+
+        if building_id not in self.building_tables:
+            dc_table = {}
+            for n_row, ( s_label, s_value ) in enumerate( self.building_rows( building_id ) ):
+                if s_label not in dc_table:
+                    dc_table[s_label] = ( n_row, str( s_value ).strip() )
+            self.building_tables[building_id] = dc_table
+
+        return self.building_tables[building_id]
+
+    # Scrape cell of Building Attributes table, identified by first row matching any label in list
+    def scrape_building_attribute( self, building_id, ls_labels, is_numeric=False ):
+
+        dc_table = self.building_table( building_id )
+        ls_found = [dc_table[s_label] for s_label in ls_labels if s_label in dc_table]
+        s_attribute = min( ls_found )[1] if ls_found else ''
+
+        if is_numeric:
+
+            # Replace letter O with zero (e.g. 'O1' - thanks, Tewksbury)
+            s_attribute = s_attribute.replace( 'O', '0' )
+
+            # Strip trailing non-numeric text (e.g. '2 Full' - thanks, Quincy)
+            s_attribute = re.sub( r'(^\d+)(.*)', r'\1', s_attribute )
+
+        return s_attribute
+
+
+# Parse Vision parcel page into a complete record of scraped values, keyed by column name
+def parse_parcel_page( html ):
+
+    page = ParcelPage( html )
+
+    # Find IDs of all building tables and areas
+    building_count = page.scrape_element( 'span', 'MainContent_lblBldCount' )
+    ls_building_ids, first_building_id, first_area_id, first_year_id = page.find_all_building_ids( building_count )
+
+    # Extract parcel values
+    dc_record = {}
+    for s_column, s_id in PARCEL_SPAN_IDS.items():
+        dc_record[s_column] = page.scrape_element( 'span', s_id )
+    dc_record[util.OWNER_ADDRESS], dc_record[util.OWNER_ZIP] = page.scrape_address( 'span', 'MainContent_lblAddr1' )
+
+    # Extract values of first building
+    for s_column, ( ls_labels, is_numeric ) in FIRST_BUILDING_ATTRIBUTES.items():
+        dc_record[s_column] = page.scrape_building_attribute( first_building_id, ls_labels, is_numeric=is_numeric )
+    dc_record[util.YEAR_BUILT] = page.scrape_element( 'span', first_year_id )
+    dc_record[util.LIVING_AREA] = page.scrape_element( 'span', first_area_id )
+    dc_record[util.BUILDING_COUNT] = building_count
+
+    # Total values over all buildings
+    for s_column, ls_labels in TOTAL_BUILDING_ATTRIBUTES.items():
+        n_total = 0
+        for dc_ids in ls_building_ids:
+            s_value = page.scrape_building_attribute( dc_ids[BUILDING_TABLE_ID], ls_labels, is_numeric=True )
+            if len( s_value ):
+                n_total += int( float( s_value ) )
+        dc_record[s_column] = n_total
+
+    n_area = 0
+    for dc_ids in ls_building_ids:
+        scr_area = page.scrape_element( 'span', dc_ids[BUILDING_AREA_ID] )
+        if scr_area:
+            s = scr_area.strip().replace( ',', '' )
+            if len( s ):
+                n_area += int( float( s ) )
+    dc_record[util.TOTAL_AREA] = n_area
+
+    return dc_record
+
+
+# Version of the parser: any change to its code, element IDs, or label lists invalidates records parsed from archived pages
+PARSER_VERSION = hashlib.sha256( repr(
+    [inspect.getsource( parser_object ) for parser_object in [element_string, ParcelPage, parse_parcel_page]] +
+    [BUILDING_TABLE_ID_FORMAT, BUILDING_AREA_ID_FORMAT, BUILDING_YEAR_ID_FORMAT, PARCEL_SPAN_IDS, FIRST_BUILDING_ATTRIBUTES, TOTAL_BUILDING_ATTRIBUTES]
+).encode() ).hexdigest()[:16]
 
 
 
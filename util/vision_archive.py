@@ -0,0 +1,114 @@
+# Copyright 2025 Energize Lawrence.  All rights reserved.
+
+import datetime
+import hashlib
+import sqlite3
+import atexit
+import zlib
+import concurrent.futures
+
+#
+# Archive of raw Vision parcel pages, shared by vision_scrape.py, vision_labels.py, and vision_examples.py.
+# - Page content is compressed and stored once per distinct content hash.
+# - Each fetch is recorded by town, Vision ID, and fetch time, so pages can be re-parsed offline.
+#
+
+# Persistent archive of fetched pages; set to None to disable
+ARCHIVE_FILENAME = '../db/vision_archive.sqlite'
+ARCHIVE_FLUSH_SIZE = 100
+
+archive_conn = None
+archive_pending = []
+
+
+# Open archive, creating tables if necessary
+def open_archive():
+
+    global archive_conn
+    global ARCHIVE_FILENAME
+
+    if ( archive_conn is None ) and ARCHIVE_FILENAME:
+
+        try:
+            archive_conn = sqlite3.connect( ARCHIVE_FILENAME, timeout=60 )
+            archive_conn.execute( 'PRAGMA journal_mode=WAL' )
+            archive_conn.execute( 'CREATE TABLE IF NOT EXISTS Pages ( digest TEXT PRIMARY KEY, html BLOB )' )
+            archive_conn.execute( 'CREATE TABLE IF NOT EXISTS Fetches ( town TEXT, vision_id INTEGER, fetched_at TEXT, digest TEXT, PRIMARY KEY ( town, vision_id, fetched_at ) )' )
+            archive_conn.commit()
+            atexit.register( flush_archive )
+        except sqlite3.Error as e:
+            print( 'Vision page archive "{0}" not available: {1}'.format( ARCHIVE_FILENAME, e ) )
+            archive_conn = None
+            ARCHIVE_FILENAME = None
+
+    return archive_conn
+
+
+# Save newly fetched pages to archive
+def flush_archive():
+
+    global archive_pending
+
+    if archive_conn and archive_pending:
+        try:
+            archive_conn.executemany( 'INSERT OR IGNORE INTO Pages VALUES ( ?, ? )', [( digest, html ) for town, vision_id, fetched_at, digest, html in archive_pending] )
+            archive_conn.executemany( 'INSERT OR REPLACE INTO Fetches VALUES ( ?, ?, ?, ? )', [( town, vision_id, fetched_at, digest ) for town, vision_id, fetched_at, digest, html in archive_pending] )
+            archive_conn.commit()
+        except sqlite3.Error as e:
+            print( 'Vision pages not archived: {0}'.format( e ) )
+
+    archive_pending = []
+
+
+# Compute content hash of page
+def page_digest( html ):
+    return hashlib.sha256( html.encode( 'utf-8' ) ).hexdigest()
+
+
+# Queue fetched page for saving to archive; return its content hash
+def store_page( town, vision_id, html ):
+
+    digest = page_digest( html )
+
+    if open_archive():
+        fetched_at = datetime.datetime.now( datetime.timezone.utc ).strftime( '%Y-%m-%d %H:%M:%S.%f' )
+        archive_pending.append( ( town.lower(), int( vision_id ), fetched_at, digest, zlib.compress( html.encode( 'utf-8' ) ) ) )
+        if len( archive_pending ) >= ARCHIVE_FLUSH_SIZE:
+            flush_archive()
+
+    return digest
+
+
+# Map Vision IDs of town to content hashes of their most recently fetched pages
+def read_latest_digests( town ):
+
+    dc_digests = {}
+
+    if open_archive():
+        flush_archive()
+        for vision_id, digest, fetched_at in archive_conn.execute( 'SELECT vision_id, digest, MAX( fetched_at ) FROM Fetches WHERE town=? GROUP BY vision_id ORDER BY vision_id', ( town.lower(), ) ):
+            dc_digests[vision_id] = digest
+
+    return dc_digests
+
+
+# Read page by content hash
+def read_page( digest ):
+    row = archive_conn.execute( 'SELECT html FROM Pages WHERE digest=?', ( digest, ) ).fetchone()
+    return zlib.decompress( row[0] ).decode( 'utf-8' )
+
+
+# Read most recently fetched pages of town, yielding ( vision_id, future ) pairs in order of requested IDs, like vision.fetch_pages()
+def read_pages( town, id_range ):
+
+    dc_digests = read_latest_digests( town )
+
+    for vision_id in id_range:
+
+        future = concurrent.futures.Future()
+        try:
+            future.set_result( read_page( dc_digests[vision_id] ) if vision_id in dc_digests else None )
+        except Exception as e:
+            future.set_exception( e )
+
+        yield vision_id, future